@@ -0,0 +1,83 @@
+"""
+Teste de carga do serviço HTTP (rpa.servico).
+
+Envia o mesmo PDF várias vezes com N clientes simultâneos, respeitando o
+Retry-After das respostas 429, acompanha cada trabalho até o fim e mostra a
+vazão, as latências (aceite e total) e quantas vezes o serviço recusou por fila cheia.
+
+Suba o serviço antes (python -m rpa.servico --workers 3 --fila 8) e rode:
+    python -m benchmarks.carga_servico caminho/da/nota.pdf [--total 50] [--clientes 8]
+"""
+import sys
+import time
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.carga_servico")
+    parser.add_argument("pdf")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--total", type=int, default=50, help="Quantidade de notas enviadas")
+    parser.add_argument("--clientes", type=int, default=8, help="Clientes enviando ao mesmo tempo")
+    parser.add_argument("--intervalo", type=float, default=0.2, help="Intervalo entre consultas da situação")
+    args = parser.parse_args(argv)
+
+    with open(args.pdf, "rb") as f:
+        conteudo = f.read()
+
+    recusas = 0
+    lock = threading.Lock()
+    sessao = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_maxsize=args.clientes)
+    sessao.mount("http://", adaptador)
+
+    def uma_nota(_):
+        nonlocal recusas
+        inicio = time.perf_counter()
+        while True:
+            r = sessao.post(f"{args.url}/notas", data=conteudo, headers={"Content-Type": "application/pdf"},
+                            params={"nome": "carga.pdf"}, timeout=60)
+            if r.status_code != 429:
+                break
+            with lock:
+                recusas += 1
+            time.sleep(float(r.headers.get("Retry-After", 1)))
+        r.raise_for_status()
+        aceite = time.perf_counter() - inicio
+        id_trabalho = r.json()["id"]
+        while True:
+            situacao = sessao.get(f"{args.url}/notas/{id_trabalho}", timeout=60).json()
+            if situacao["situacao"] in ("concluido", "erro"):
+                return aceite, time.perf_counter() - inicio, situacao["situacao"]
+            time.sleep(args.intervalo)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clientes) as executor:
+        resultados = list(executor.map(uma_nota, range(args.total)))
+    duracao = time.perf_counter() - inicio
+
+    aceites = [r[0] for r in resultados]
+    totais = [r[1] for r in resultados]
+    erros = sum(1 for r in resultados if r[2] == "erro")
+    print(f"{args.total} notas em {duracao:.1f}s: {args.total / duracao * 60:.1f} notas/min, "
+          f"{erros} com erro, {recusas} respostas 429")
+    for nome, valores in (("aceite", aceites), ("total", totais)):
+        print(f"  {nome:<7} média {statistics.mean(valores):6.2f}s  p50 {percentil(valores, 50):6.2f}s  "
+              f"p95 {percentil(valores, 95):6.2f}s  máx {max(valores):6.2f}s")
+    return 0 if not erros else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
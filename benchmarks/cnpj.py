@@ -0,0 +1,93 @@
+"""
+Benchmark da busca do CNPJ do tomador.
+
+Gera cadastros sintéticos de CNPJs válidos, simula leituras do OCR com até três
+erros e compara a varredura antiga (Levenshtein contra todo o cadastro) com o
+IndiceCNPJ de rpa.cnpj, que varre cadastros pequenos e indexa os grandes, e o
+índice de deleções forçado em qualquer tamanho: tempo por busca e quantas
+leituras cada um acertou.
+
+Uso: python -m benchmarks.cnpj [--tamanhos 18 1000 10000] [--consultas 200]
+"""
+import sys
+import time
+import random
+import argparse
+import Levenshtein
+
+from rpa.cnpj import IndiceCNPJ, CONFUSOES_OCR, _digito_verificador, _PESOS_DV1, _PESOS_DV2
+
+
+def gerar_cnpj(rnd):
+    base = "".join(rnd.choice("0123456789") for _ in range(8)) + f"{rnd.randint(1, 30):04d}"
+    dv1 = _digito_verificador(base, _PESOS_DV1)
+    return base + dv1 + _digito_verificador(base + dv1, _PESOS_DV2)
+
+
+def ler_com_erros(cnpj, rnd, max_erros=3):
+    # Erros de OCR: troca por dígito parecido, dígito qualquer, dígito perdido ou repetido
+    parecidos = [par for par in CONFUSOES_OCR]
+    texto = list(cnpj)
+    for _ in range(rnd.randint(1, max_erros)):
+        pos = rnd.randrange(len(texto))
+        tipo = rnd.random()
+        if tipo < 0.5:
+            opcoes = [b for a, b in parecidos if a == texto[pos]] + [a for a, b in parecidos if b == texto[pos]]
+            texto[pos] = rnd.choice(opcoes or "0123456789")
+        elif tipo < 0.7:
+            texto[pos] = rnd.choice("0123456789")
+        elif tipo < 0.85 and len(texto) > 12:
+            del texto[pos]
+        else:
+            texto.insert(pos, texto[pos])
+    return "".join(texto)
+
+
+def varredura_antiga(cnpjs_ocr, cadastro):
+    # Cópia da busca anterior do encontrar_cnpj_tomador
+    melhor, menor = None, float("inf")
+    for cnpj_ocr in cnpjs_ocr:
+        for candidato in cadastro:
+            dist = Levenshtein.distance(cnpj_ocr, candidato)
+            if dist < menor:
+                menor, melhor = dist, candidato
+    return melhor if melhor and menor <= 3 else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.cnpj")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[18, 1000, 10000])
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(42)
+    for tamanho in args.tamanhos:
+        cadastro = list({gerar_cnpj(rnd) for _ in range(tamanho)})
+        busca = IndiceCNPJ(cadastro)
+        inicio = time.perf_counter()
+        indice = IndiceCNPJ(cadastro, limite_varredura=0)
+        montagem = time.perf_counter() - inicio
+
+        # Cada documento tem o CNPJ do fornecedor (válido, fora do cadastro) e o do tomador lido com erros
+        consultas = []
+        for _ in range(args.consultas):
+            tomador = rnd.choice(cadastro)
+            consultas.append((tomador, [gerar_cnpj(rnd), ler_com_erros(tomador, rnd)]))
+
+        for nome, buscar in (
+            ("antiga", lambda trechos: varredura_antiga(trechos, cadastro)),
+            ("indexada" if busca.indexado else "varrida", lambda trechos: (busca.melhor(trechos) or (None, None))[1]),
+            ("índice", lambda trechos: (indice.melhor(trechos) or (None, None))[1]),
+        ):
+            acertos = 0
+            inicio = time.perf_counter()
+            for tomador, trechos in consultas:
+                acertos += buscar(trechos) == tomador
+            tempo = (time.perf_counter() - inicio) / len(consultas)
+            print(f"{len(cadastro):>6} CNPJs  {nome:<10} {tempo * 1e3:>8.3f} ms/busca  acertos {acertos}/{len(consultas)}")
+        print(f"{'':>6}        montagem do índice: {montagem * 1e3:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Benchmark de ponta a ponta: notas escaneadas sintéticas pelo pipeline completo.
+
+Gera (ou reaproveita) um corpus com benchmarks.sintetico e processa recortes de
+tamanhos crescentes pelo mesmo caminho do lote: rasterização, pré-processamento,
+OCR, extração e gravação do JSON, sem envio, cache nem índice de envios. Cada
+tamanho roda num interpretador novo, para que o pico de memória seja o dele e não o
+dos tamanhos anteriores. Para cada tamanho mostra notas/s, percentis de cada estágio,
+pico de memória e a acurácia de cada campo contra o `.esperado.json` da nota.
+
+Com `--salvar` o relatório vai para um JSON; com `--comparar` a execução é comparada
+a um relatório anterior, para que uma regressão de desempenho apareça no número.
+
+Uso: python -m benchmarks.e2e [--tamanhos 5 20 50] [--workers 3] [--perfil padrao] [--escalonar] [--parar-cedo]
+     [--pasta bench/corpus]
+     [--salvar relatorio.json] [--comparar relatorio_anterior.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource  # pico de memória (só Unix)
+except ImportError:
+    resource = None
+
+from rpa.ocr import PERFIS
+from rpa.batch import processar_lote, workers_padrao
+from rpa.pipeline import ConfigPipeline
+from rpa.artefatos import DESLIGADO
+from benchmarks.carga_servico import percentil
+from benchmarks.sintetico import CAMPOS_CONFERIDOS, gerar_corpus, carregar_esperado
+
+# Estágios na ordem do pipeline; os que não aparecerem na execução ficam de fora
+ESTAGIOS = ("camada_texto", "rasterizar", "pre_processar", "ocr", "avaliar", "extrair", "persistir")
+
+
+def pico_memoria_mb():
+    """
+    Pico de memória residente deste processo e do maior processo filho já encerrado.
+    O ru_maxrss vale para a vida inteira do processo: só mede uma execução se ela for
+    a única do processo (ver executar_isolado).
+    """
+    if resource is None:
+        return None
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "principal": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor, 1),
+    }
+
+
+def preparar_corpus(pasta, quantidade, args):
+    """Reaproveita o corpus da pasta se já tiver notas suficientes; senão gera de novo com a semente"""
+    existentes = sorted(f for f in os.listdir(pasta) if f.endswith(".pdf")) if os.path.isdir(pasta) else []
+    if len(existentes) >= quantidade:
+        return existentes[:quantidade]
+    print(f"Gerando {quantidade} notas sintéticas em {pasta}...", flush=True)
+    return gerar_corpus(pasta, quantidade, dpi=args.dpi, paginas=args.paginas, ruido=args.ruido,
+                        inclinacao=args.inclinacao, semente=args.semente, fonte=args.fonte)
+
+
+def executar(pasta, arquivos, saida, config, workers):
+    resultados = []
+    inicio = time.perf_counter()
+    processar_lote(pasta, saida, arquivos, workers=workers, config=config,
+                   ao_concluir=lambda idx, resultado: resultados.append(resultado))
+    segundos = time.perf_counter() - inicio
+
+    estagios = {}
+    for nome in ESTAGIOS:
+        valores = [r.tempos[nome] for r in resultados if nome in r.tempos]
+        if valores:
+            estagios[nome] = {"p50": percentil(valores, 50), "p95": percentil(valores, 95), "max": max(valores)}
+
+    acertos = dict.fromkeys(CAMPOS_CONFERIDOS, 0)
+    for resultado in resultados:
+        esperado = carregar_esperado(pasta, resultado.nome)
+        for campo in CAMPOS_CONFERIDOS:
+            if resultado.dados.get(campo) == esperado[campo]:
+                acertos[campo] += 1
+
+    return {
+        "documentos": len(resultados),
+        "workers": workers,
+        "segundos": segundos,
+        "docs_por_segundo": len(resultados) / segundos if segundos else 0.0,
+        "erros": sum(1 for r in resultados if r.erro),
+        "estagios": estagios,
+        "acuracia": {campo: total / len(resultados) for campo, total in acertos.items()} if resultados else {},
+        "memoria_pico_mb": pico_memoria_mb(),
+    }
+
+
+def executar_isolado(pasta, arquivos, saida, config, workers):
+    """executar num interpretador novo, com o próprio pico de memória e sem o dos tamanhos anteriores"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as isolado:
+        return isolado.submit(executar, pasta, arquivos, saida, config, workers).result()
+
+
+def imprimir(relatorio, anterior=None):
+    variacao = ""
+    if anterior:
+        delta = relatorio["docs_por_segundo"] / anterior["docs_por_segundo"] - 1 if anterior["docs_por_segundo"] else 0
+        variacao = f"  ({delta:+.0%} vs anterior)"
+    print(f"\n== {relatorio['documentos']} notas, {relatorio['workers']} workers: "
+          f"{relatorio['docs_por_segundo']:.2f} notas/s em {relatorio['segundos']:.1f}s, "
+          f"{relatorio['erros']} com erro{variacao}")
+
+    print(f"  {'estágio':<14} {'p50':>9} {'p95':>9} {'máx':>9}")
+    for nome, p in relatorio["estagios"].items():
+        linha = f"  {nome:<14} {p['p50'] * 1000:>7.0f}ms {p['p95'] * 1000:>7.0f}ms {p['max'] * 1000:>7.0f}ms"
+        if anterior and nome in anterior["estagios"] and anterior["estagios"][nome]["p95"]:
+            linha += f"  (p95 {p['p95'] / anterior['estagios'][nome]['p95'] - 1:+.0%})"
+        print(linha)
+
+    memoria = relatorio["memoria_pico_mb"]
+    if memoria:
+        print(f"  pico de memória: {memoria['principal']:.0f} MB no principal, "
+              f"{memoria['workers']:.0f} MB no maior worker")
+
+    campos = "  ".join(f"{campo} {taxa:.0%}" for campo, taxa in relatorio["acuracia"].items())
+    print(f"  acurácia: {campos}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.e2e")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[5, 20, 50],
+                        help="Quantidades de notas processadas, em ordem crescente")
+    parser.add_argument("--workers", type=int, default=None, help=f"Processos paralelos (padrão: {workers_padrao()})")
+    parser.add_argument("--perfil", choices=sorted(PERFIS), default="padrao")
+    parser.add_argument("--escalonar", action="store_true", help="OCR escalonado (ignora o --perfil)")
+    parser.add_argument("--parar-cedo", action="store_true", help="Não lê as páginas depois da que resolve os campos")
+    parser.add_argument("--pasta", default=None, help="Corpus sintético (reaproveitado entre execuções); padrão: temporário")
+    parser.add_argument("--dpi", type=int, default=200, help="Resolução da digitalização simulada")
+    parser.add_argument("--paginas", type=int, default=1)
+    parser.add_argument("--ruido", type=float, default=0.08)
+    parser.add_argument("--inclinacao", type=float, default=1.5)
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--fonte", default=None, help="Arquivo .ttf com acentos para o corpus")
+    parser.add_argument("--salvar", default=None, help="Grava o relatório em JSON")
+    parser.add_argument("--comparar", default=None, help="Relatório JSON anterior para comparação")
+    args = parser.parse_args(argv)
+
+    tamanhos = sorted(args.tamanhos)
+    workers = args.workers or workers_padrao()
+    anteriores = {}
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anteriores = {r["documentos"]: r for r in json.load(f)["execucoes"]}
+
+    temporaria = tempfile.mkdtemp(prefix="bench_e2e_")
+    pasta = args.pasta or os.path.join(temporaria, "corpus")
+    try:
+        arquivos = preparar_corpus(pasta, tamanhos[-1], args)
+        # Só o pipeline: sem envio, sem cache (cada execução faz o OCR de verdade) e sem índice
+        config = ConfigPipeline(enviar=False, perfil=args.perfil, escalonar=args.escalonar,
+                                parar_cedo=args.parar_cedo, pasta_cache=None, artefatos=DESLIGADO,
+                                caminho_indice=None)
+        execucoes = []
+        for tamanho in tamanhos:
+            relatorio = executar_isolado(pasta, arquivos[:tamanho], os.path.join(temporaria, f"saida_{tamanho}"),
+                                 config, workers)
+            imprimir(relatorio, anteriores.get(relatorio["documentos"]))
+            execucoes.append(relatorio)
+    finally:
+        shutil.rmtree(temporaria, ignore_errors=True)
+
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            json.dump({"momento": time.strftime("%Y-%m-%dT%H:%M:%S"), "perfil": args.perfil,
+                       "escalonar": args.escalonar, "parar_cedo": args.parar_cedo, "dpi": args.dpi,
+                       "paginas": args.paginas, "ruido": args.ruido, "execucoes": execucoes}, f, indent=2)
+        print(f"\nRelatório gravado em {args.salvar}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
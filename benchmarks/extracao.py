@@ -0,0 +1,133 @@
+"""
+Benchmark da extração de campos sobre os textos de OCR guardados em artefatos.
+
+Compara as cinco buscas do extrair_info antigo com o motor de rpa.extracao e
+confere se os dois concordam. Depois mede o motor com vários fornecedores de layout
+próprio cadastrados, sobre os mesmos textos reescritos no layout de um deles, para
+mostrar que o custo não cresce com o cadastro. O motor também converte e valida os
+campos (data, valor, dígitos do CNPJ), o que as buscas antigas não faziam.
+
+Uso: python -m benchmarks.extracao [pasta ou zip de artefatos] [--repeticoes 200]
+Sem fonte, usa a pasta `artefatos/`; sem artefatos, um texto montado a partir
+de `NF JSON TESTE/nfe_ficticia_realista.json`.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+from rpa.extracao import MotorExtracao, PadraoCampo, PerfilFornecedor
+from rpa.artefatos import PASTA_ARTEFATOS, iterar_artefatos, texto_do_registro
+
+FIXTURE = os.path.join("NF JSON TESTE", "nfe_ficticia_realista.json")
+
+
+def extrair_legado(texto):
+    # Cópia das buscas do extrair_info anterior, mantida só para comparação
+    cnpj_fornecedor = re.search(r'\bC?F?P?\/?C?N?P?J?[:\s-]*([\d./-]{18})', texto, re.IGNORECASE)
+    re.search(r'Contrato\s+([A-Za-z0-9]+)', texto)
+    numero_nf = re.search(r'RPS Nº\s*(\d+)', texto)
+    data_emissao = re.search(r'Data da Compra:\s*(\d{2}/\d{2}/\d{4})', texto)
+    valor_total = re.search(r'VALOR TOTAL DO SERVIÇO\s*=\s*R\$\s*([\d,.]+)', texto)
+    return {
+        "cnpjFornecedor": cnpj_fornecedor.group(1).replace(".", "").replace("/", "").replace("-", "") if cnpj_fornecedor else "",
+        "nrNotaFiscal": numero_nf.group(1) if numero_nf else "",
+        "dtEmissao": data_emissao.group(1) if data_emissao else "",
+        "valorNf": valor_total.group(1) if valor_total else "",
+    }
+
+
+def extrair_motor(motor, texto):
+    extracao = motor.extrair(texto)
+    return {
+        "cnpjFornecedor": extracao.valor("cnpjFornecedor") or "",
+        "nrNotaFiscal": extracao.texto("nrNotaFiscal"),
+        "dtEmissao": extracao.texto("dtEmissao"),
+        "valorNf": extracao.texto("valorNf"),
+    }
+
+
+def texto_da_fixture():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        nf = json.load(f)
+    valor = f"{float(nf['valorNf']):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    cnpj = nf["cnpjFornecedor"]
+    return (
+        "PREFEITURA MUNICIPAL NOTA FISCAL DE SERVIÇOS ELETRÔNICA "
+        f"Prestador CNPJ: {cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]} "
+        f"RPS Nº {nf['nrNotaFiscal']} Data da Compra: {nf['dtEmissao']} "
+        "Tomador 10.384.095/0003-00 Discriminação dos serviços " + "Auxilio Alimentação e Refeição " * 20 +
+        f"VALOR TOTAL DO SERVIÇO = R$ {valor}"
+    )
+
+
+def carregar_textos(fonte):
+    textos = []
+    if fonte and os.path.exists(fonte):
+        textos = [re.sub(r"\s+", " ", texto_do_registro(r)) for r in iterar_artefatos(fonte)]
+    return textos or [texto_da_fixture()]
+
+
+def medir(funcao, textos, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for texto in textos:
+            funcao(texto)
+    return (time.perf_counter() - inicio) / (repeticoes * len(textos))
+
+
+def padroes_proprios(i):
+    # Layout do fornecedor i: número e total com rótulos que o padrão geral não reconhece
+    return (
+        PadraoCampo("nrNotaFiscal", rf"NFS-e\s+{i}\s+Nº\s*(?P<valor>\d+)"),
+        PadraoCampo("valorNf", rf"TOTAL\s+{i}\s*=\s*R\$\s*(?P<valor>[\d,.]+)"),
+    )
+
+
+def no_layout_proprio(texto, i):
+    return texto.replace("RPS Nº", f"NFS-e {i} Nº").replace("VALOR TOTAL DO SERVIÇO", f"TOTAL {i}")
+
+
+def motor_com_fornecedores(quantidade, cnpjs_alvo):
+    """`quantidade` fornecedores de layout próprio; o último é o dono dos CNPJs dos textos"""
+    fornecedores = [
+        PerfilFornecedor(f"fornecedor_{i}", cnpjs=(f"{i:014d}",), padroes=padroes_proprios(i), nr_contrato=str(i))
+        for i in range(quantidade - 1)
+    ]
+    fornecedores.append(PerfilFornecedor("alvo", cnpjs=tuple(cnpjs_alvo), padroes=padroes_proprios(quantidade - 1)))
+    return MotorExtracao(fornecedores=fornecedores)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.extracao")
+    parser.add_argument("fonte", nargs="?", default=PASTA_ARTEFATOS)
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    textos = carregar_textos(args.fonte)
+    motor = MotorExtracao()
+
+    divergentes = [t for t in textos if extrair_legado(t) != extrair_motor(motor, t)]
+    print(f"{len(textos)} textos, {len(textos) - len(divergentes)} com resultado igual ao extrair_info antigo")
+
+    legado = medir(extrair_legado, textos, args.repeticoes)
+    print(f"{'legado (5 buscas)':<36} {legado * 1e6:>8.1f} µs/texto")
+    tempo = medir(motor.extrair, textos, args.repeticoes)
+    print(f"{'motor, layout comum':<36} {tempo * 1e6:>8.1f} µs/texto  ({tempo / legado:.1f}x o legado)")
+
+    cnpjs = {extrair_legado(t)["cnpjFornecedor"] for t in textos}
+    for quantidade in (1, 100, 10000):
+        m = motor_com_fornecedores(quantidade, cnpjs)
+        proprios = [no_layout_proprio(t, quantidade - 1) for t in textos]
+        errados = sum(1 for t, p in zip(textos, proprios) if extrair_legado(t) != extrair_motor(m, p))
+        divergentes += [None] * errados
+        tempo = medir(m.extrair, proprios, args.repeticoes)
+        print(f"{f'motor, {quantidade} com layout próprio':<36} {tempo * 1e6:>8.1f} µs/texto  "
+              f"({tempo / legado:.1f}x o legado){f', {errados} divergentes' if errados else ''}")
+    return 0 if not divergentes else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
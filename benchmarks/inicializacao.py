@@ -0,0 +1,156 @@
+"""
+Benchmark do tempo de inicialização da interface.
+
+Cada medida roda num interpretador novo, como o operador abrindo o programa: o tempo
+de `import` de cada módulo (descontado o do interpretador vazio), os módulos que mais
+pesam nesse import (`-X importtime`) e, com `--janela`, quanto tempo leva até a janela
+aparecer e até o aquecimento do OCR terminar.
+
+Com `--limite` o código de saída é 1 se o import da interface passar do limite, para
+que uma importação pesada de volta no topo do rpa.main apareça na hora.
+
+Uso: python -m benchmarks.inicializacao [--repeticoes 5] [--modulos rpa.main rpa.pipeline] [--janela]
+     [--limite 200] [--salvar relatorio.json] [--comparar relatorio_anterior.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIS_PESADOS = 10
+
+# Roda no processo filho: abre a janela, espera o aquecimento e imprime os dois tempos
+SCRIPT_JANELA = """
+import time
+inicio = time.perf_counter()
+import tkinter as tk
+from rpa.main import ModernApp
+root = tk.Tk()
+app = ModernApp(root)
+root.update()
+janela = time.perf_counter() - inicio
+while app.status_ocr.cget("text") == "Carregando OCR..." and time.perf_counter() - inicio < {espera}:
+    root.update()
+    time.sleep(0.01)
+print(janela, time.perf_counter() - inicio, app.status_ocr.cget("text"), sep="|")
+app.thread_ocr.shutdown(wait=True)
+root.destroy()
+"""
+
+
+def cronometrar(argumentos):
+    """Tempo de parede de um interpretador novo executando `argumentos`"""
+    inicio = time.perf_counter()
+    subprocess.run([sys.executable] + argumentos, cwd=RAIZ, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - inicio
+
+
+def tempo_import(modulo, repeticoes):
+    return [cronometrar(["-c", f"import {modulo}"]) for _ in range(repeticoes)]
+
+
+def importtime(codigo):
+    """{módulo: milissegundos acumulados} do `-X importtime` de um interpretador novo"""
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo], cwd=RAIZ,
+                           capture_output=True, text=True, check=True).stderr
+    tempos = {}
+    for linha in saida.splitlines():
+        partes = linha.split("|")
+        if len(partes) == 3 and partes[1].strip().isdigit():
+            tempos[partes[2].strip()] = int(partes[1]) / 1000
+    return tempos
+
+
+def mais_pesados(modulo, quantidade=MAIS_PESADOS):
+    """Módulos de maior tempo acumulado no import de `modulo`, sem os que o interpretador já carrega"""
+    do_interpretador = importtime("pass")
+    tempos = [(ms, nome) for nome, ms in importtime(f"import {modulo}").items()
+              if nome != modulo and nome not in do_interpretador]
+    return [{"modulo": nome, "ms": round(ms, 1)} for ms, nome in sorted(tempos, reverse=True)[:quantidade]]
+
+
+def tempo_janela(espera):
+    """(segundos até a janela, segundos até o fim do aquecimento, situação do OCR) ou None sem tela"""
+    processo = subprocess.run([sys.executable, "-c", SCRIPT_JANELA.format(espera=espera)], cwd=RAIZ,
+                              capture_output=True, text=True)
+    ultima = processo.stdout.strip().splitlines()[-1] if processo.stdout.strip() else ""
+    if processo.returncode != 0 or ultima.count("|") != 2:
+        print(f"Janela não medida: {processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else 'sem saída'}",
+              file=sys.stderr)
+        return None
+    janela, aquecimento, situacao = ultima.split("|")
+    return {"janela": float(janela), "aquecimento": float(aquecimento), "situacao_ocr": situacao}
+
+
+def medir(args):
+    base = tempo_import("sys", args.repeticoes)
+    relatorio = {"interpretador": statistics.median(base), "modulos": {}}
+    for modulo in args.modulos:
+        tempos = tempo_import(modulo, args.repeticoes)
+        relatorio["modulos"][modulo] = {
+            "mediana": max(0.0, statistics.median(tempos) - relatorio["interpretador"]),
+            "minimo": max(0.0, min(tempos) - min(base)),
+            "mais_pesados": mais_pesados(modulo),
+        }
+    if args.janela:
+        relatorio["janela"] = tempo_janela(args.espera)
+    return relatorio
+
+
+def imprimir(relatorio, anterior=None):
+    print(f"Interpretador vazio: {relatorio['interpretador'] * 1000:.0f}ms")
+    for modulo, medida in relatorio["modulos"].items():
+        variacao = ""
+        if anterior and modulo in anterior["modulos"] and anterior["modulos"][modulo]["mediana"]:
+            variacao = f"  ({medida['mediana'] / anterior['modulos'][modulo]['mediana'] - 1:+.0%} vs anterior)"
+        print(f"\nimport {modulo}: mediana {medida['mediana'] * 1000:.0f}ms, "
+              f"mínimo {medida['minimo'] * 1000:.0f}ms{variacao}")
+        for item in medida["mais_pesados"]:
+            print(f"  {item['ms']:>8.1f}ms  {item['modulo']}")
+    janela = relatorio.get("janela")
+    if janela:
+        print(f"\nJanela visível em {janela['janela'] * 1000:.0f}ms; "
+              f"aquecimento terminado em {janela['aquecimento']:.1f}s ({janela['situacao_ocr']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.inicializacao")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--modulos", nargs="+", default=["rpa.main"],
+                        help="Módulos cujo import é medido (rpa.pipeline mostra o custo que a interface adia)")
+    parser.add_argument("--janela", action="store_true", help="Abre a interface e mede até a janela e o aquecimento")
+    parser.add_argument("--espera", type=float, default=60.0, help="Máximo de segundos esperando o aquecimento")
+    parser.add_argument("--limite", type=float, default=None,
+                        help="Falha (código 1) se o import do primeiro módulo passar destes milissegundos")
+    parser.add_argument("--salvar", default=None, help="Grava o relatório em JSON")
+    parser.add_argument("--comparar", default=None, help="Relatório JSON anterior para comparação")
+    args = parser.parse_args(argv)
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+
+    relatorio = medir(args)
+    imprimir(relatorio, anterior)
+
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            json.dump(dict(relatorio, momento=time.strftime("%Y-%m-%dT%H:%M:%S")), f, indent=2)
+        print(f"\nRelatório gravado em {args.salvar}")
+
+    mediana = relatorio["modulos"][args.modulos[0]]["mediana"] * 1000
+    if args.limite is not None and mediana > args.limite:
+        print(f"\nimport {args.modulos[0]} levou {mediana:.0f}ms, acima do limite de {args.limite:.0f}ms",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark do pré-processamento de página.
+
+Compara o caminho antigo (render padrão de 200 dpi, binarização e ampliação 2x)
+com `preprocess_image` recebendo a página já renderizada no dpi do perfil.
+A renderização em si (Poppler) fica de fora; o tempo de gerar o PNG que o
+pytesseract entrega ao Tesseract é medido à parte, porque depende do formato da saída.
+
+Uso: python -m benchmarks.preprocessamento [--repeticoes 10]
+"""
+import io
+import sys
+import time
+import argparse
+import statistics
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from rpa.ocr import PERFIS, preprocess_image
+
+LINHAS = [
+    "PRESTADOR DE SERVIÇOS  CNPJ: 12.345.678/0001-99",
+    "RPS Nº 74124        Data da Compra: 22/05/2024",
+    "TOMADOR  10.384.095/0003-00",
+    "Auxilio Alimentação e Refeição",
+    "VALOR TOTAL DO SERVIÇO = R$ 3.570,00",
+]
+
+
+def pagina_sintetica(dpi):
+    """Página A4 com texto, no tamanho que o Poppler produziria no dpi informado"""
+    escala = dpi / 200
+    largura, altura = int(1654 * escala), int(2339 * escala)
+    img = Image.new("RGB", (largura, altura), (236, 234, 228))
+    desenho = ImageDraw.Draw(img)
+    fonte = ImageFont.load_default(size=int(22 * escala))
+    y = int(120 * escala)
+    while y < altura - int(120 * escala):
+        for linha in LINHAS:
+            desenho.text((int(110 * escala), y), linha, fill=(25, 25, 25), font=fonte)
+            y += int(38 * escala)
+    return img
+
+
+def preprocess_legado(img):
+    # Cópia do pré-processamento anterior, mantida só para comparação
+    img = img.convert("L")
+    img = img.filter(ImageFilter.SHARPEN)
+    img = img.point(lambda x: 0 if x < 180 else 255)
+    img = img.resize((img.width * 2, img.height * 2))
+    return img
+
+
+def gerar_png(img):
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.tell()
+
+
+def medir(funcao, img, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(img)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.preprocessamento")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    pagina_200 = pagina_sintetica(200)
+    casos = [("legado (200 dpi + ampliação 2x)", preprocess_legado, pagina_200)]
+    for perfil in PERFIS.values():
+        # Poppler já entrega em tons de cinza (grayscale=True) no dpi do perfil
+        pagina = pagina_sintetica(perfil.dpi).convert("L")
+        casos.append((f"perfil {perfil.nome} ({perfil.dpi} dpi)",
+                      lambda img, p=perfil: preprocess_image(img, p), pagina))
+
+    print(f"{'caso':<36} {'pré-proc.':>10} {'+ PNG':>10} {'PNG (KB)':>10}")
+    referencia = None
+    for nome, funcao, pagina in casos:
+        tempo = medir(funcao, pagina, args.repeticoes)
+        tempo_png = medir(lambda img: gerar_png(funcao(img)), pagina, args.repeticoes)
+        tamanho = gerar_png(funcao(pagina)) / 1024
+        referencia = referencia or tempo_png
+        print(f"{nome:<36} {tempo * 1000:>8.1f}ms {tempo_png * 1000:>8.1f}ms {tamanho:>10.0f}"
+              f"  ({referencia / tempo_png:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
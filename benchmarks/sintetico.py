@@ -0,0 +1,187 @@
+"""
+Gerador de notas escaneadas sintéticas para os benchmarks.
+
+Parte de uma fixture JSON (`NF JSON TESTE/nfe_ficticia_realista.json`), varia número,
+data, valor e tomador de cada nota, desenha o layout que a extração espera e simula
+a digitalização: página em tons de cinza, inclinação, ruído e um leve desfoque. Cada
+PDF sai só com imagem (sem camada de texto), como um scanner entrega, e ao lado dele
+um `<nome>.esperado.json` com os campos que a extração deveria devolver.
+
+Uso: python -m benchmarks.sintetico <pasta> [--quantidade 20] [--dpi 200] [--paginas 1]
+     [--ruido 0.08] [--inclinacao 1.5] [--semente 1]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from functools import lru_cache
+from datetime import date, timedelta
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from rpa.constantes import mapa_estab
+from rpa.extracao import FORNECEDOR_PADRAO
+
+FIXTURE = os.path.join("NF JSON TESTE", "nfe_ficticia_realista.json")
+# Campos que vêm do texto da nota (os demais são constantes do fornecedor)
+CAMPOS_CONFERIDOS = ("cnpjFornecedor", "codEstab", "nrNotaFiscal", "dtEmissao", "dtVencimento", "valorNf",
+                     "qtdeTotalNf")
+# Fontes TrueType procuradas nas pastas do sistema; a fonte embutida do Pillow não tem Ç, Ã nem º
+FONTES = ("arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf")
+
+
+def formatar_cnpj(cnpj):
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def formatar_valor(valor):
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def carregar_fixture(caminho=FIXTURE):
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def variar_nota(base, rnd):
+    """Nota nova a partir da fixture, com os campos esperados já calculados como o extrair_info faz"""
+    cnpj_tomador, cod_estab = rnd.choice(sorted(mapa_estab.items()))
+    emissao = date(2024, 1, 1) + timedelta(days=rnd.randrange(365))
+    valor = rnd.randrange(1000, 2000000) / 100
+    nota = dict(base)
+    nota.update({
+        "cnpjTomador": cnpj_tomador,
+        "codEstab": str(cod_estab),
+        "nrNotaFiscal": str(rnd.randrange(1000, 999999)),
+        "dtEmissao": emissao.strftime("%d/%m/%Y"),
+        "dtVencimento": (emissao + timedelta(days=FORNECEDOR_PADRAO.prazo_vencimento_dias)).strftime("%d/%m/%Y"),
+        "valorNf": f"{valor:.2f}",
+        "qtdeTotalNf": f"{valor / FORNECEDOR_PADRAO.valor_unitario:.4f}",
+    })
+    nota.pop("fileHashNF", None)
+    return nota
+
+
+def linhas_da_nota(nota):
+    """Linhas da primeira página; o CNPJ do prestador vem antes do tomador, como nas notas reais"""
+    return [
+        "PREFEITURA MUNICIPAL",
+        "NOTA FISCAL DE SERVIÇOS ELETRÔNICA",
+        "",
+        "PRESTADOR DE SERVIÇOS",
+        f"CNPJ: {formatar_cnpj(nota['cnpjFornecedor'])}",
+        f"RPS Nº {nota['nrNotaFiscal']}        Data da Compra: {nota['dtEmissao']}",
+        "",
+        "TOMADOR DE SERVIÇOS",
+        f"CPF/CNPJ: {formatar_cnpj(nota['cnpjTomador'])}",
+        "",
+        "DISCRIMINAÇÃO DOS SERVIÇOS",
+        nota["lstProdServ"][0]["nomeProdServ"] if nota.get("lstProdServ") else nota.get("descricao", ""),
+        "",
+        f"VALOR TOTAL DO SERVIÇO = R$ {formatar_valor(float(nota['valorNf']))}",
+    ]
+
+
+def linhas_de_continuacao(numero):
+    # Páginas seguintes: texto corrido, sem os campos, como anexos e condições gerais
+    return [f"Página {numero} - continuação da discriminação"] + [
+        "Serviço prestado conforme contrato e condições gerais do fornecedor." for _ in range(12)
+    ]
+
+
+@lru_cache(maxsize=None)
+def carregar_fonte(tamanho, caminho=None):
+    for nome in ((caminho,) if caminho else FONTES):
+        try:
+            return ImageFont.truetype(nome, tamanho)
+        except OSError:
+            continue
+    if caminho:
+        raise OSError(f"Fonte não encontrada: {caminho}")
+    print("Aviso: nenhuma fonte TrueType encontrada (use --fonte); acentos saem errados e a extração perde campos",
+          file=sys.stderr)
+    return ImageFont.load_default(size=tamanho)
+
+
+def desenhar_pagina(linhas, dpi, fonte=None):
+    """Página A4 em tons de cinza com as linhas em corpo 11"""
+    largura, altura = int(8.27 * dpi), int(11.69 * dpi)
+    img = Image.new("L", (largura, altura), 250)
+    desenho = ImageDraw.Draw(img)
+    fonte = carregar_fonte(max(8, int(11 * dpi / 72)), fonte)
+    margem = int(0.8 * dpi)
+    y = margem
+    for linha in linhas:
+        desenho.text((margem, y), linha, fill=20, font=fonte)
+        y += int(fonte.size * 1.6)
+    return img
+
+
+def digitalizar(img, rnd, ruido=0.08, inclinacao=1.5):
+    """Simula o scanner: papel torto, grão e borrão"""
+    if inclinacao:
+        img = img.rotate(rnd.uniform(-inclinacao, inclinacao), resample=Image.BICUBIC, expand=False, fillcolor=250)
+    if ruido:
+        grao = Image.effect_noise(img.size, 255 * ruido).point(lambda v: v - 128)
+        img = Image.blend(img, grao.convert("L"), ruido)
+        # Pontos pretos espalhados, como poeira no vidro
+        desenho = ImageDraw.Draw(img)
+        for _ in range(int(img.width * img.height * ruido / 2000)):
+            x, y = rnd.randrange(img.width), rnd.randrange(img.height)
+            desenho.point((x, y), fill=rnd.randrange(0, 90))
+    return img.filter(ImageFilter.GaussianBlur(0.6))
+
+
+def gerar_pdf(nota, caminho, dpi=200, paginas=1, ruido=0.08, inclinacao=1.5, rnd=None, fonte=None):
+    rnd = rnd or random.Random()
+    imagens = [digitalizar(desenhar_pagina(linhas_da_nota(nota), dpi, fonte), rnd, ruido, inclinacao)]
+    for n in range(2, paginas + 1):
+        imagens.append(digitalizar(desenhar_pagina(linhas_de_continuacao(n), dpi, fonte), rnd, ruido, inclinacao))
+    imagens[0].save(caminho, "PDF", resolution=dpi, save_all=True, append_images=imagens[1:])
+
+
+def gerar_corpus(pasta, quantidade, dpi=200, paginas=1, ruido=0.08, inclinacao=1.5, semente=1, fixture=FIXTURE,
+                 fonte=None):
+    """Gera `quantidade` PDFs em `pasta`; retorna os nomes, em ordem. A mesma semente gera o mesmo corpus"""
+    os.makedirs(pasta, exist_ok=True)
+    rnd = random.Random(semente)
+    base = carregar_fixture(fixture)
+    nomes = []
+    for i in range(quantidade):
+        nota = variar_nota(base, rnd)
+        nome = f"nf_{i:05d}.pdf"
+        gerar_pdf(nota, os.path.join(pasta, nome), dpi, paginas, ruido, inclinacao, rnd, fonte)
+        with open(os.path.join(pasta, nome.replace(".pdf", ".esperado.json")), "w", encoding="utf-8") as f:
+            json.dump({c: nota[c] for c in CAMPOS_CONFERIDOS}, f, ensure_ascii=False, indent=2)
+        nomes.append(nome)
+    return nomes
+
+
+def carregar_esperado(pasta, nome):
+    with open(os.path.join(pasta, nome.replace(".pdf", ".esperado.json")), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sintetico",
+                                     description="Gera notas escaneadas sintéticas a partir de uma fixture JSON")
+    parser.add_argument("pasta")
+    parser.add_argument("--quantidade", type=int, default=20)
+    parser.add_argument("--dpi", type=int, default=200, help="Resolução da digitalização simulada")
+    parser.add_argument("--paginas", type=int, default=1, help="Páginas por nota (as seguintes são continuação)")
+    parser.add_argument("--ruido", type=float, default=0.08, help="Intensidade do grão e da poeira, de 0 a 1")
+    parser.add_argument("--inclinacao", type=float, default=1.5, help="Inclinação máxima das páginas, em graus")
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--fixture", default=FIXTURE)
+    parser.add_argument("--fonte", default=None, help="Arquivo .ttf com acentos (padrão: Arial ou DejaVu Sans)")
+    args = parser.parse_args(argv)
+
+    nomes = gerar_corpus(args.pasta, args.quantidade, args.dpi, args.paginas, args.ruido, args.inclinacao,
+                         args.semente, args.fixture, args.fonte)
+    print(f"{len(nomes)} notas geradas em {args.pasta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
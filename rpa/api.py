@@ -1,47 +1,157 @@
-import json
+import os
 import time
-import requests
-from rpa.utils import salvar_log
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from rpa.log import registrar_envio
+from rpa.metricas import contar, observar
+from rpa.payload import CAMPO_ARQUIVO, CorpoPayload
 
 url = "http:www.api.com/teste" # Base teste
 #url = "http:www.api.com/oficial" # Base oficial
 
-def enviar_para_api(json_data, max_tentativas=3, timeout=30):
-    global url
-    
-    headers = {"Content-Type": "application/json"}
-    
-    obrigatorios = ["cnpjFornecedor", "nrNotaFiscal", "dtEmissao", "valorNf"]
-    faltando = [campo for campo in obrigatorios if not json_data.get(campo)]
-    
-    if faltando:
-        return 400, f"Campos obrigatórios faltando: {', '.join(faltando)}"
-    
-    for tentativa in range(1, max_tentativas + 1):
+CAMPOS_OBRIGATORIOS = ["cnpjFornecedor", "nrNotaFiscal", "dtEmissao", "valorNf"]
+
+
+@contextmanager
+def _corpo_requisicao(json_data, caminho_pdf=None, arquivo_json=None):
+    """
+    Corpo do POST sem montar o base64 do PDF na memória: o JSON já gravado em disco
+    é enviado direto do arquivo; sem ele, o PDF é codificado em blocos durante o envio.
+    """
+    if arquivo_json and os.path.isfile(arquivo_json):
+        with open(arquivo_json, "rb") as corpo:
+            yield {"data": corpo}
+    elif caminho_pdf and CAMPO_ARQUIVO not in json_data:
+        yield {"data": CorpoPayload(json_data, caminho_pdf)}
+    else:
+        yield {"json": json_data}
+
+
+class ClienteAPI:
+    """
+    Cliente da API com Session keep-alive: as conexões TCP/TLS são reaproveitadas
+    entre notas. Envios assíncronos rodam em no máximo `max_em_voo` threads, e quem
+    agenda espera quando já há o dobro disso na fila.
+    """
+
+    def __init__(self, max_em_voo=4, max_tentativas=3, timeout=30):
+        # Importado só aqui: a interface lê api.url ao abrir sem carregar o requests
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.max_tentativas = max_tentativas
+        self.timeout = timeout
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_em_voo)
+        self.sessao.mount("http://", adaptador)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.headers.update({"Content-Type": "application/json"})
+
+        self._executor = ThreadPoolExecutor(max_workers=max_em_voo, thread_name_prefix="envio-api")
+        self._vagas = threading.BoundedSemaphore(max_em_voo * 2)
+
+    def enviar(self, json_data, max_tentativas=None, timeout=None, caminho_pdf=None, arquivo_json=None):
+        """
+        Envia uma nota e retorna (status, resposta), como o enviar_para_api.
+        `json_data` valida os campos; o corpo sai de `arquivo_json` ou `caminho_pdf` quando informados.
+        """
+        import requests
+
+        max_tentativas = max_tentativas or self.max_tentativas
+        timeout = timeout or self.timeout
+
+        faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not json_data.get(campo)]
+
+        if faltando:
+            return 400, f"Campos obrigatórios faltando: {', '.join(faltando)}"
+
+        for tentativa in range(1, max_tentativas + 1):
+            if tentativa > 1:
+                contar("rpa_api_retentativas_total")
+            inicio = time.perf_counter()
+            try:
+                # A URL é lida a cada envio para respeitar a troca de ambiente em api.url
+                with _corpo_requisicao(json_data, caminho_pdf, arquivo_json) as corpo:
+                    response = self.sessao.post(url, timeout=timeout, **corpo)
+                observar("rpa_api_segundos", time.perf_counter() - inicio)
+                contar("rpa_api_requisicoes_total", status=response.status_code)
+                registrar_envio(response.status_code, json_data, response.text)
+
+                if response.status_code == 200:
+                    return response.status_code, response.text
+                elif response.status_code >= 500:
+                    if tentativa < max_tentativas:
+                        time.sleep(2 * tentativa)
+                else:
+                    return response.status_code, response.text
+
+            except requests.exceptions.Timeout:
+                observar("rpa_api_segundos", time.perf_counter() - inicio)
+                contar("rpa_api_requisicoes_total", status="timeout")
+                if tentativa < max_tentativas:
+                    time.sleep(2 * tentativa)
+                    continue
+                return 408, "Timeout na conexão com a API"
+
+            except requests.exceptions.ConnectionError:
+                contar("rpa_api_requisicoes_total", status="conexao")
+                if tentativa < max_tentativas:
+                    time.sleep(2 * tentativa)
+                    continue
+                return 503, "Erro de conexão com a API"
+
+            except Exception as e:
+                contar("rpa_api_requisicoes_total", status="excecao")
+                return 500, f"Erro inesperado: {str(e)}"
+
+        return 500, "Todas as tentativas falharam"
+
+    def agendar(self, funcao, *args):
+        """Executa `funcao` numa das threads de envio; bloqueia se a fila de envios estiver cheia"""
+        self._vagas.acquire()
         try:
-            response = requests.post(url, json=json_data, headers=headers, timeout=timeout)
-            salvar_log(response.status_code, json.dumps(json_data, ensure_ascii=False), response.text)
-
-            if response.status_code == 200:
-                return response.status_code, response.text
-            elif response.status_code >= 500:
-                time.sleep(2 * tentativa)
-            else:
-                return response.status_code, response.text
-
-        except requests.exceptions.Timeout:
-            if tentativa < max_tentativas:
-                time.sleep(2 * tentativa)
-                continue
-            return 408, "Timeout na conexão com a API"
-        
-        except requests.exceptions.ConnectionError:
-            if tentativa < max_tentativas:
-                time.sleep(2 * tentativa)
-                continue
-            return 503, "Erro de conexão com a API"
-        
-        except Exception as e:
-            return 500, f"Erro inesperado: {str(e)}"
-
-    return 500, "Todas as tentativas falharam"
\ No newline at end of file
+            futuro = self._executor.submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro
+
+    def enviar_async(self, json_data, caminho_pdf=None, arquivo_json=None):
+        """Agenda o envio e retorna um Future com (status, resposta)"""
+        return self.agendar(self.enviar, json_data, None, None, caminho_pdf, arquivo_json)
+
+    def fechar(self):
+        self._executor.shutdown(wait=True)
+        self.sessao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+_cliente = None
+_lock_cliente = threading.Lock()
+
+def cliente_padrao():
+    """Cliente compartilhado do processo, criado no primeiro envio"""
+    global _cliente
+    with _lock_cliente:
+        if _cliente is None:
+            _cliente = ClienteAPI()
+        return _cliente
+
+
+def enviar_para_api(json_data, max_tentativas=3, timeout=30, caminho_pdf=None):
+    """
+    Envio compatível com a versão antiga. A extração não põe mais o `fileHashNF` nos dados:
+    sem ele, `caminho_pdf` é obrigatório e o PDF segue em base64, em blocos, no corpo.
+    """
+    if CAMPO_ARQUIVO not in json_data and not caminho_pdf:
+        raise ValueError(f"enviar_para_api sem o PDF: informe caminho_pdf ou o campo {CAMPO_ARQUIVO}")
+    return cliente_padrao().enviar(json_data, max_tentativas=max_tentativas, timeout=timeout,
+                                   caminho_pdf=caminho_pdf)
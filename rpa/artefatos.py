@@ -0,0 +1,221 @@
+"""
+Armazém dos textos do OCR (artefatos), para conferência e para refazer a extração.
+
+Modos:
+- `desligado`: nada é gravado;
+- `conteudo`: um arquivo por documento, `<pasta>/<ab>/<hash_pdf>.json.gz`, endereçado
+  pelo hash do PDF (PDFs com o mesmo nome em pastas diferentes não colidem);
+- `lote`: um único zip por lote, `<pasta>/lote_<data>_<pid>.zip`, com um `<hash_pdf>.json`
+  por documento.
+
+A gravação é feita por uma thread em segundo plano; quem chama `guardar` só entrega
+o registro. Cada registro tem o hash, o nome do arquivo, a assinatura do OCR e o
+texto de cada página.
+
+Uso: python -m rpa.artefatos {listar,replay} <pasta ou zip> [--saida resultado.jsonl]
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import queue
+import atexit
+import zipfile
+import argparse
+import threading
+
+DESLIGADO = "desligado"
+CONTEUDO = "conteudo"
+LOTE = "lote"
+MODOS = (DESLIGADO, CONTEUDO, LOTE)
+
+PASTA_ARTEFATOS = "artefatos"
+
+
+def montar_registro(hash_pdf, caminho_pdf, textos, assinatura=None):
+    return {
+        "hash_pdf": hash_pdf,
+        "arquivo": os.path.basename(caminho_pdf),
+        "momento": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "assinatura_ocr": assinatura,
+        "paginas": list(textos),
+    }
+
+
+class Armazem:
+    """Base dos armazéns: fila e thread de gravação; as subclasses implementam `_gravar`"""
+
+    def __init__(self, pasta=PASTA_ARTEFATOS, tamanho_fila=256):
+        self.pasta = pasta
+        # Fila limitada: se o disco não acompanhar, quem grava espera em vez de acumular memória
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = threading.Thread(target=self._loop, name="artefatos", daemon=True)
+        self._thread.start()
+
+    def guardar(self, registro):
+        self._fila.put(registro)
+
+    def _loop(self):
+        while True:
+            registro = self._fila.get()
+            try:
+                if registro is None:
+                    return
+                self._gravar(registro)
+            except Exception as e:
+                print(f"Erro ao gravar artefato do OCR: {str(e)}")
+            finally:
+                self._fila.task_done()
+
+    def esvaziar(self):
+        """Espera a gravação de tudo o que já foi entregue"""
+        self._fila.join()
+
+    def fechar(self):
+        if self._thread.is_alive():
+            self._fila.put(None)
+            self._thread.join()
+
+    def _gravar(self, registro):
+        raise NotImplementedError
+
+
+class ArmazemConteudo(Armazem):
+    """Um .json.gz por documento, em subpastas pelos dois primeiros caracteres do hash"""
+
+    def caminho(self, hash_pdf):
+        return os.path.join(self.pasta, hash_pdf[:2], f"{hash_pdf}.json.gz")
+
+    def _gravar(self, registro):
+        destino = self.caminho(registro["hash_pdf"])
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with gzip.open(temporario, "wt", encoding="utf-8") as f:
+            json.dump(registro, f, ensure_ascii=False)
+        os.replace(temporario, destino)
+
+
+class ArmazemLote(Armazem):
+    """Todos os documentos do lote num zip; só a thread de gravação mexe no arquivo"""
+
+    def __init__(self, pasta=PASTA_ARTEFATOS, nome=None, tamanho_fila=256):
+        os.makedirs(pasta, exist_ok=True)
+        nome = nome or f"lote_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.zip"
+        self.arquivo = os.path.join(pasta, nome)
+        self._zip = zipfile.ZipFile(self.arquivo, "a", compression=zipfile.ZIP_DEFLATED)
+        self._gravados = set(self._zip.namelist())
+        super().__init__(pasta, tamanho_fila)
+
+    def _gravar(self, registro):
+        nome = f"{registro['hash_pdf']}.json"
+        # O mesmo PDF duas vezes no lote (cópias com nomes diferentes): basta um registro
+        if nome in self._gravados:
+            return
+        self._zip.writestr(nome, json.dumps(registro, ensure_ascii=False))
+        self._gravados.add(nome)
+
+    def fechar(self):
+        super().fechar()
+        # O índice do zip só é escrito aqui; sem fechar, o arquivo não abre
+        self._zip.close()
+
+
+def criar_armazem(modo, pasta=PASTA_ARTEFATOS):
+    if modo == CONTEUDO:
+        return ArmazemConteudo(pasta)
+    if modo == LOTE:
+        return ArmazemLote(pasta)
+    if modo == DESLIGADO:
+        return None
+    raise ValueError(f"Modo de artefatos desconhecido: {modo}")
+
+
+_armazens = {}
+_lock_armazens = threading.Lock()
+
+def obter_armazem(modo, pasta=PASTA_ARTEFATOS):
+    """Armazém do processo para o modo e a pasta; fechado (e o zip finalizado) na saída"""
+    if modo == DESLIGADO:
+        return None
+    with _lock_armazens:
+        chave = (modo, pasta)
+        if chave not in _armazens:
+            _armazens[chave] = criar_armazem(modo, pasta)
+            if len(_armazens) == 1:
+                atexit.register(fechar_armazens)
+        return _armazens[chave]
+
+def fechar_armazens():
+    with _lock_armazens:
+        while _armazens:
+            _armazens.popitem()[1].fechar()
+
+
+# --- Leitura (conferência e replay) ---
+def iterar_artefatos(fonte):
+    """Registros gravados numa pasta do modo `conteudo` ou num zip do modo `lote`"""
+    if zipfile.is_zipfile(fonte):
+        with zipfile.ZipFile(fonte) as zf:
+            for nome in sorted(zf.namelist()):
+                if nome.endswith(".json"):
+                    yield json.loads(zf.read(nome).decode("utf-8"))
+        return
+    for raiz, _, arquivos in os.walk(fonte):
+        for nome in sorted(arquivos):
+            if nome.endswith(".json.gz"):
+                with gzip.open(os.path.join(raiz, nome), "rt", encoding="utf-8") as f:
+                    yield json.load(f)
+
+def texto_do_registro(registro):
+    # Mesmo formato que o pipeline entrega à extração
+    return "".join(t + "\n" for t in registro["paginas"])
+
+
+def replay(fonte, saida=None):
+    """Refaz a extração sobre os textos gravados, sem PDF nem OCR; retorna quantos documentos leu"""
+    from rpa.ocr import extrair_info_detalhado
+
+    destino = open(saida, "w", encoding="utf-8") if saida else None
+    total = 0
+    try:
+        for registro in iterar_artefatos(fonte):
+            dados, extracao = extrair_info_detalhado(
+                texto_do_registro(registro), registro["arquivo"], len(registro["paginas"])
+            )
+            linha = {"hash_pdf": registro["hash_pdf"], "arquivo": registro["arquivo"],
+                     "dados": dados, "confianca": extracao.confiancas()}
+            if destino:
+                destino.write(json.dumps(linha, ensure_ascii=False) + "\n")
+            else:
+                print(json.dumps(linha, ensure_ascii=False))
+            total += 1
+    finally:
+        if destino:
+            destino.close()
+    return total
+
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rpa.artefatos", description="Textos do OCR gravados")
+    parser.add_argument("comando", choices=["listar", "replay"])
+    parser.add_argument("fonte", help="Pasta do modo conteudo ou zip do modo lote")
+    parser.add_argument("--saida", default=None, help="Grava o resultado do replay em JSON por linha")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.fonte):
+        print(f"Fonte não encontrada: {args.fonte}", file=sys.stderr)
+        return 2
+
+    if args.comando == "listar":
+        for registro in iterar_artefatos(args.fonte):
+            print(f"{registro['hash_pdf'][:12]}  {registro['momento']}  {len(registro['paginas'])} pág.  {registro['arquivo']}")
+    else:
+        total = replay(args.fonte, args.saida)
+        print(f"{total} documentos reprocessados.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
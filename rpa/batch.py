@@ -0,0 +1,277 @@
+import os
+import sys
+import signal
+import argparse
+from collections import deque
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor
+
+from rpa.api import ClienteAPI
+from rpa.constantes import workers_padrao
+from rpa.outbox import Entregador, obter_outbox
+from rpa.ocr import PERFIS, MOTORES
+from rpa.pipeline import ConfigPipeline, processar_nf, enviar_resultado, reservar_envio, guardar_artefato
+from rpa.artefatos import DESLIGADO, MODOS, criar_armazem
+from rpa.registro import CAMINHO_REGISTRO, snapshot_atual
+from rpa.indice import obter_indice
+from rpa.log import fila_para_processos, configurar_worker
+from rpa.metricas import GravadorMetricas, obter_metricas
+from rpa.diagnostico import TOP_LENTOS, RelatorioLentos
+
+
+def listar_pdfs(pasta):
+    """Lista os PDFs da pasta em ordem alfabética"""
+    return sorted(f for f in os.listdir(pasta) if f.lower().endswith(".pdf"))
+
+
+def _inicializar_worker(fila_log):
+    # O Ctrl+C do terminal chega a todo o grupo de processos; quem decide parar é o principal,
+    # que espera as notas em andamento. Sem isto elas terminariam com KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Cada processo roda um Tesseract; sem este limite o OpenMP dele disputa os mesmos núcleos
+    # com os outros processos. Só aqui, nos processos do pool: no principal ele limitaria também
+    # o OCR de nota avulsa da interface, que roda sozinho. Vale para o executável do pytesseract
+    # e para o tesserocr de processos que ainda não carregaram a libgomp
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    # O log dos processos vai para o principal, que é quem grava o arquivo
+    configurar_worker(fila_log)
+
+
+def criar_pool(workers):
+    """Pool de processos de OCR, com o log encaminhado ao processo principal"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_worker,
+                               initargs=(fila_para_processos(),))
+
+
+def processar_arquivo(tarefa):
+    """Executa no processo filho o fluxo completo de um PDF"""
+    caminho_pdf, output_json, config = tarefa
+    return processar_nf(caminho_pdf, output_json, config)
+
+
+def processar_lote(entrada, saida, arquivos, workers=None, ao_concluir=None, config=None, top_lentos=TOP_LENTOS):
+    """
+    Processa os PDFs em paralelo num pool de processos.
+
+    Os processos fazem rasterização, OCR, extração e gravação; o envio para a API
+    acontece neste processo, por um cliente com conexões reaproveitadas, enquanto
+    os processos já leem as próximas notas.
+
+    `ao_concluir(idx, resultado)` é chamado na ordem original dos arquivos,
+    à medida que cada um termina. Com `config.pasta_perfis`, grava nela o relatório
+    das `top_lentos` notas mais lentas e o perfil do lote. Retorna (sucesso, erros); notas
+    puladas por já terem sido enviadas não contam como sucesso.
+    """
+    workers = workers or workers_padrao()
+    config = config or ConfigPipeline()
+    # Envio e artefatos ficam com este processo; os processos só leem e extraem
+    config_workers = replace(config, enviar=False, artefatos=DESLIGADO)
+    tarefas = [
+        (os.path.join(entrada, nome), os.path.join(saida, os.path.splitext(nome)[0] + ".json"), config_workers)
+        for nome in arquivos
+    ]
+
+    # Carregado antes do pool: com fork os processos herdam o cadastro já indexado;
+    # com spawn (Windows) cada processo lê o arquivo uma vez, na primeira nota
+    snapshot_atual(config.caminho_registro)
+
+    sucesso = 0
+    erros = []
+    metricas = obter_metricas()
+    concluidos = 0
+    relatorio = RelatorioLentos(top_lentos) if config.pasta_perfis else None
+
+    def concluir(idx, resultado, envio):
+        nonlocal sucesso, concluidos
+        if envio is not None:
+            envio.result()
+        concluidos += 1
+        metricas.registrar_resultado(resultado)
+        if relatorio:
+            relatorio.adicionar(resultado)
+        if not resultado.sucesso:
+            erros.append(f"{resultado.nome}: {resultado.descricao_erro()}")
+        elif not resultado.ja_enviado:
+            sucesso += 1
+        if ao_concluir:
+            ao_concluir(idx, resultado)
+
+    # Um armazém por lote: no modo "lote" é um zip novo, finalizado ao fim do lote
+    armazem = criar_armazem(config.artefatos, config.pasta_artefatos)
+    cliente = None
+    if config.enviar and config.entrega == "direta":
+        cliente = ClienteAPI(max_em_voo=config.envios_simultaneos)
+    pendentes = deque()
+    metricas.medidor("rpa_fila", lambda: len(tarefas) - concluidos, fila="lote")
+    metricas.medidor("rpa_fila", lambda: sum(1 for p in pendentes if p[2] is not None and not p[2].done()),
+                     fila="lote_envios")
+
+    try:
+        with criar_pool(workers) as executor:
+            try:
+                # map devolve os resultados na ordem de envio, mesmo que terminem fora de ordem
+                for idx, resultado in enumerate(executor.map(processar_arquivo, tarefas)):
+                    if armazem:
+                        guardar_artefato(resultado, config, armazem)
+                    envio = None
+                    # Os processos consultaram o índice antes dos envios anteriores deste lote;
+                    # a reserva confere de novo, na ordem dos envios
+                    if (config.enviar and not resultado.erro and not resultado.ja_enviado
+                            and reservar_envio(resultado, config)):
+                        if cliente:
+                            envio = cliente.agendar(enviar_resultado, resultado, config, cliente)
+                        else:
+                            # Outbox: só grava na fila local, o Entregador faz o envio
+                            enviar_resultado(resultado, config)
+                    pendentes.append((idx, resultado, envio))
+
+                    # Reporta em ordem o que já terminou, sem esperar envios em andamento
+                    while pendentes and (pendentes[0][2] is None or pendentes[0][2].done()):
+                        concluir(*pendentes.popleft())
+            except BaseException:
+                # Interrompido (Ctrl+C): as notas que nem começaram são canceladas; as que estão
+                # nos processos terminam antes de o pool fechar
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+
+        while pendentes:
+            concluir(*pendentes.popleft())
+
+        if relatorio:
+            caminho = relatorio.gravar(config.pasta_perfis)
+            print(relatorio.texto())
+            print(f"Relatório de desempenho em {caminho}; perfil do lote em {config.pasta_perfis}/lote.prof")
+    finally:
+        metricas.remover_medidor("rpa_fila", fila="lote")
+        metricas.remover_medidor("rpa_fila", fila="lote_envios")
+        if cliente:
+            cliente.fechar()
+        if armazem:
+            armazem.fechar()
+
+    return sucesso, erros
+
+
+# --- Linha de comando ---
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m rpa.batch",
+        description="Processa em lote, sem interface gráfica, todos os PDFs de uma pasta."
+    )
+    parser.add_argument("entrada", help="Pasta com os PDFs")
+    parser.add_argument("saida", help="Pasta para salvar os JSONs")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Processos paralelos (padrão: {workers_padrao()})")
+    parser.add_argument("--sem-envio", action="store_true",
+                        help="Apenas gera os JSONs, sem enviar para a API")
+    parser.add_argument("--sem-camada-texto", action="store_true",
+                        help="Ignora o texto embutido de PDFs digitais e força o OCR")
+    parser.add_argument("--perfil", choices=sorted(PERFIS), default="padrao",
+                        help="Perfil de renderização e pré-processamento das páginas")
+    parser.add_argument("--escalonar", action="store_true",
+                        help="Lê primeiro em baixa resolução e relê com perfis mais caros só as páginas "
+                             "de baixa confiança ou sem os campos obrigatórios (ignora o --perfil, "
+                             "exceto com --template, em que só as regiões vazias sobem de perfil)")
+    parser.add_argument("--parar-cedo", action="store_true",
+                        help="Extrai os campos a cada página e não lê as seguintes quando os obrigatórios "
+                             "e o estabelecimento já foram encontrados")
+    parser.add_argument("--template", default=None,
+                        help="Template de layout (templates/layouts.json) para ler só as regiões dos campos")
+    parser.add_argument("--motor", choices=["auto"] + sorted(MOTORES), default="auto",
+                        help="Backend do Tesseract (auto usa o tesserocr residente quando instalado)")
+    parser.add_argument("--envios", type=int, default=ConfigPipeline.envios_simultaneos,
+                        help="Máximo de envios simultâneos para a API")
+    parser.add_argument("--outbox", action="store_true",
+                        help="Grava as notas na fila local e envia em segundo plano, com novas tentativas")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="Refaz o OCR mesmo de PDFs já lidos com as mesmas configurações")
+    parser.add_argument("--forcar-reenvio", action="store_true",
+                        help="Processa e envia de novo notas que o índice de envios já registra como enviadas")
+    parser.add_argument("--artefatos", choices=MODOS, default=ConfigPipeline.artefatos,
+                        help="Onde guardar o texto do OCR: um arquivo por hash, um zip por lote ou nada")
+    parser.add_argument("--registro", default=CAMINHO_REGISTRO,
+                        help="Cadastro de estabelecimentos (CSV ou SQLite); sem ele vale o mapa_estab")
+    parser.add_argument("--metricas", default=None,
+                        help="Grava as métricas (tempos por estágio, contadores, filas) neste JSON a cada 10s")
+    parser.add_argument("--perfilar", default=None, metavar="PASTA",
+                        help="Diagnóstico: grava um cProfile por nota e o relatório das mais lentas nesta pasta")
+    parser.add_argument("--top", type=int, default=TOP_LENTOS, help="Quantas notas lentas entram no relatório")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+
+    if not os.path.isdir(args.entrada):
+        print(f"Pasta de entrada não existe: {args.entrada}", file=sys.stderr)
+        return 2
+
+    arquivos = listar_pdfs(args.entrada)
+    if not arquivos:
+        print("Nenhum arquivo PDF encontrado na pasta de entrada.")
+        return 0
+
+    total = len(arquivos)
+    config = ConfigPipeline(
+        enviar=not args.sem_envio,
+        usar_camada_texto=not args.sem_camada_texto,
+        perfil=args.perfil,
+        escalonar=args.escalonar,
+        parar_cedo=args.parar_cedo,
+        template=args.template,
+        motor_ocr=args.motor,
+        envios_simultaneos=args.envios,
+        entrega="outbox" if args.outbox else "direta",
+        pasta_cache=None if args.sem_cache else ConfigPipeline.pasta_cache,
+        caminho_registro=args.registro,
+        artefatos=args.artefatos,
+        # Só gerando os JSONs, nada é pulado: o índice serve para evitar envios repetidos
+        pular_enviados=not (args.forcar_reenvio or args.sem_envio),
+        pasta_perfis=args.perfilar,
+    )
+
+    pulados = 0
+
+    def ao_concluir(idx, resultado):
+        nonlocal pulados
+        pulados += resultado.ja_enviado
+        if resultado.ja_enviado:
+            situacao = f"PULADO - {resultado.resposta}"
+        else:
+            situacao = "OK" if resultado.sucesso else f"ERRO {resultado.descricao_erro()}"
+        tempo = sum(resultado.tempos.values())
+        print(f"[{idx + 1}/{total}] {resultado.nome} - {situacao} ({tempo:.1f}s)", flush=True)
+
+    entregador = None
+    if config.enviar and config.entrega == "outbox":
+        outbox = obter_outbox(config.caminho_outbox)
+        entregador = Entregador(outbox, ClienteAPI(max_em_voo=config.envios_simultaneos),
+                                indice=obter_indice(config.caminho_indice)).iniciar()
+        obter_metricas().medidor("rpa_fila", lambda: outbox.contar().get("pendente", 0), fila="outbox")
+
+    gravador = GravadorMetricas(args.metricas).iniciar() if args.metricas else None
+    try:
+        sucesso, erros = processar_lote(args.entrada, args.saida, arquivos, workers=args.workers,
+                                        ao_concluir=ao_concluir, config=config, top_lentos=args.top)
+    finally:
+        if entregador:
+            # Esvazia o que já venceu; itens aguardando nova tentativa continuam na outbox
+            entregador.parar()
+            while entregador.entregar_vencidos():
+                pass
+            entregador.cliente.fechar()
+        if gravador:
+            gravador.parar()
+
+    print(f"{sucesso} de {total} arquivos processados com sucesso.")
+    if pulados:
+        print(f"{pulados} já tinham sido enviados e foram pulados.")
+    if entregador:
+        contagem = entregador.outbox.contar()
+        print(f"Outbox: {contagem.get('enviado', 0)} enviados, {contagem.get('pendente', 0)} pendentes, "
+              f"{contagem.get('morto', 0)} mortos (python -m rpa.outbox status)")
+    return 0 if not erros else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+import threading
+
+
+class CacheOCR:
+    """
+    Cache em disco do texto do OCR por página, endereçado pelo conteúdo do PDF.
+
+    A chave é o SHA-256 do PDF somado às configurações do OCR, então mudar o
+    perfil ou o idioma gera outra entrada. Quando o tamanho total passa do limite,
+    as entradas usadas há mais tempo (mtime) são removidas.
+    """
+
+    def __init__(self, diretorio="cache/ocr", limite_mb=500):
+        self.diretorio = diretorio
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._tamanho = None
+
+    @staticmethod
+    def chave(hash_pdf, assinatura):
+        conteudo = hash_pdf + json.dumps(assinatura, sort_keys=True)
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def _caminho(self, chave):
+        # Subpastas pelos dois primeiros caracteres evitam diretórios com milhares de arquivos
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.json")
+
+    def obter(self, chave):
+        """(textos por página, páginas puladas pelo parar_cedo), ou None se não estiver no cache"""
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                conteudo = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if isinstance(conteudo, list):
+            # Entrada gravada antes das páginas puladas irem para o cache
+            conteudo = {"textos": conteudo, "paginas_puladas": []}
+
+        # Marca como usado recentemente para a política LRU
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return conteudo["textos"], conteudo["paginas_puladas"]
+
+    def guardar(self, chave, textos, paginas_puladas=()):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        # Grava em arquivo temporário e troca, para outro processo nunca ler pela metade
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"textos": textos, "paginas_puladas": list(paginas_puladas)}, f, ensure_ascii=False)
+        tamanho = os.path.getsize(temporario)
+        os.replace(temporario, caminho)
+
+        with self._lock:
+            if self._tamanho is None:
+                self._tamanho = self._medir()
+            else:
+                self._tamanho += tamanho
+            if self._tamanho > self.limite_bytes:
+                self._despejar()
+
+    def _entradas(self):
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if not nome.endswith(".json"):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    info = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                yield caminho, info.st_mtime, info.st_size
+
+    def _medir(self):
+        return sum(tamanho for _, _, tamanho in self._entradas())
+
+    def _despejar(self):
+        # Remove as menos usadas até sobrar 90% do limite, para não despejar a cada gravação
+        entradas = sorted(self._entradas(), key=lambda e: e[1])
+        total = sum(tamanho for _, _, tamanho in entradas)
+        alvo = self.limite_bytes * 0.9
+        for caminho, _, tamanho in entradas:
+            if total <= alvo:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+        self._tamanho = total
+
+
+_caches = {}
+
+def obter_cache(diretorio, limite_mb):
+    """Uma instância por processo para cada pasta de cache"""
+    chave = (diretorio, limite_mb)
+    if chave not in _caches:
+        _caches[chave] = CacheOCR(diretorio, limite_mb)
+    return _caches[chave]
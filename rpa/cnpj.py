@@ -0,0 +1,173 @@
+"""
+Busca aproximada do CNPJ do tomador entre os estabelecimentos cadastrados.
+
+Cadastros pequenos são varridos inteiros com Levenshtein. A partir de
+LIMITE_VARREDURA CNPJs eles ficam num índice de deleções: uma busca com raio 3
+confere só os poucos CNPJs que podem estar no raio, em vez do cadastro inteiro.
+Trechos que já têm dígitos verificadores válidos e não estão no cadastro são,
+quase sempre, CNPJs de outra empresa (o fornecedor, por exemplo) e ficam por
+último na escolha. Entre os candidatos, ganha o de menor distância e, no empate,
+o das trocas de dígitos mais comuns no OCR.
+"""
+from operator import mul
+
+import Levenshtein
+
+RAIO_PADRAO = 3
+# Abaixo disto a varredura é mais rápida que o índice de deleções; em benchmarks.cnpj
+# os dois empatam perto de 200 CNPJs (com 18, a varredura é cerca de 12x mais rápida)
+LIMITE_VARREDURA = 200
+
+_PESOS_DV1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+_PESOS_DV2 = (6,) + _PESOS_DV1
+
+
+def _digito_verificador(digitos, pesos):
+    # Os bytes ASCII dos dígitos valem 48 + dígito; o excesso sai somando os pesos
+    resto = (sum(map(mul, digitos.encode(), pesos)) - 48 * sum(pesos)) % 11
+    return "0" if resto < 2 else str(11 - resto)
+
+def validar_cnpj(cnpj):
+    """Confere os dois dígitos verificadores (módulo 11) de um CNPJ só com dígitos"""
+    if len(cnpj) != 14 or not cnpj.isdigit() or cnpj == cnpj[0] * 14:
+        return False
+    return (
+        _digito_verificador(cnpj[:12], _PESOS_DV1) == cnpj[12]
+        and _digito_verificador(cnpj[:13], _PESOS_DV2) == cnpj[13]
+    )
+
+
+# Dígitos que o Tesseract costuma trocar entre si; a troca custa menos que uma substituição qualquer
+CONFUSOES_OCR = {
+    ("0", "8"): 0.4, ("3", "8"): 0.4, ("5", "6"): 0.4, ("6", "8"): 0.4,
+    ("1", "7"): 0.4, ("0", "9"): 0.5, ("5", "9"): 0.6, ("4", "9"): 0.6,
+    ("2", "7"): 0.6, ("1", "4"): 0.7, ("3", "9"): 0.7, ("6", "0"): 0.7,
+}
+_CUSTO_TROCA = {}
+for (a, b), custo in CONFUSOES_OCR.items():
+    _CUSTO_TROCA[a, b] = _CUSTO_TROCA[b, a] = custo
+
+def distancia_ocr(origem, destino):
+    """Levenshtein com custo de substituição reduzido para as confusões de OCR"""
+    anterior = [float(j) for j in range(len(destino) + 1)]
+    for i, a in enumerate(origem, 1):
+        atual = [float(i)]
+        for j, b in enumerate(destino, 1):
+            troca = 0.0 if a == b else _CUSTO_TROCA.get((a, b), 1.0)
+            atual.append(min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + troca))
+        anterior = atual
+    return anterior[-1]
+
+
+def _delecoes(texto, profundidade):
+    """O texto e todas as variantes com até `profundidade` caracteres removidos"""
+    variantes = {texto}
+    fronteira = {texto}
+    for _ in range(profundidade):
+        fronteira = {v[:i] + v[i + 1:] for v in fronteira for i in range(len(v))}
+        variantes |= fronteira
+    return variantes
+
+
+class IndiceCNPJ:
+    """
+    Índice de deleções sobre as duas metades de cada CNPJ, montado só quando o
+    cadastro chega a `limite_varredura` CNPJs; antes disso a busca varre todos.
+
+    Se a leitura está a até `raio` edições do CNPJ, uma das metades tem no máximo
+    raio // 2 edições (pigeonhole). Cada metade é indexada com suas variantes por
+    deleção, e a busca só confere com Levenshtein os CNPJs que compartilham uma
+    variante com o trecho correspondente da leitura.
+    """
+
+    def __init__(self, cnpjs=(), raio=RAIO_PADRAO, limite_varredura=LIMITE_VARREDURA):
+        self.raio = raio
+        self.limite_varredura = limite_varredura
+        self._profundidade = raio // 2
+        self._inicio = {}
+        self._fim = {}
+        self._cnpjs = set()
+        self.indexado = False
+        for cnpj in cnpjs:
+            self.adicionar(cnpj)
+
+    def __len__(self):
+        return len(self._cnpjs)
+
+    def __contains__(self, cnpj):
+        return cnpj in self._cnpjs
+
+    def adicionar(self, cnpj):
+        if cnpj in self._cnpjs:
+            return
+        self._cnpjs.add(cnpj)
+        if self.indexado:
+            self._indexar(cnpj)
+        elif len(self._cnpjs) >= self.limite_varredura:
+            self.indexado = True
+            for cadastrado in self._cnpjs:
+                self._indexar(cadastrado)
+
+    def _indexar(self, cnpj):
+        meio = len(cnpj) // 2
+        for variante in _delecoes(cnpj[:meio], self._profundidade):
+            self._inicio.setdefault(variante, []).append(cnpj)
+        for variante in _delecoes(cnpj[meio:], self._profundidade):
+            self._fim.setdefault(variante, []).append(cnpj)
+
+    def _candidatos(self, cnpj):
+        if not self.indexado:
+            return self._cnpjs
+        # As metades têm 7 caracteres; com até `profundidade` edições o trecho
+        # correspondente da leitura tem entre 7 - p e 7 + p caracteres
+        candidatos = set()
+        p = self._profundidade
+        for tamanho in range(7 - p, 7 + p + 1):
+            if tamanho > len(cnpj):
+                break
+            for variante in _delecoes(cnpj[:tamanho], p):
+                candidatos.update(self._inicio.get(variante, ()))
+            for variante in _delecoes(cnpj[len(cnpj) - tamanho:], p):
+                candidatos.update(self._fim.get(variante, ()))
+        return candidatos
+
+    def buscar(self, cnpj, raio=None):
+        """Lista de (distância, cnpj) a no máximo `raio` edições de `cnpj`"""
+        raio = self.raio if raio is None else min(raio, self.raio)
+        if abs(len(cnpj) - 14) > raio:
+            return []
+        encontrados = []
+        for candidato in self._candidatos(cnpj):
+            dist = Levenshtein.distance(cnpj, candidato, score_cutoff=raio)
+            if dist <= raio:
+                encontrados.append((dist, candidato))
+        return encontrados
+
+    def melhor(self, cnpjs_ocr, raio=None):
+        """
+        Melhor correspondência para os trechos lidos pelo OCR, ou None.
+        Retorna (cnpj_ocr, cnpj_cadastrado, distância); no empate de distância,
+        ganha a troca mais comum no OCR.
+        """
+        melhor = None
+        chave_melhor = None
+        for ordem, cnpj_ocr in enumerate(cnpjs_ocr):
+            # Dígitos verificadores certos e fora do cadastro: quase sempre é outra empresa
+            # (o fornecedor), então só serve se nenhum outro trecho tiver correspondência
+            outra_empresa = validar_cnpj(cnpj_ocr) and cnpj_ocr not in self
+            for dist, candidato in self.buscar(cnpj_ocr, raio):
+                if chave_melhor is None or (outra_empresa, dist) < chave_melhor[:2]:
+                    chave_melhor = (outra_empresa, dist, None, ordem)
+                    melhor = (cnpj_ocr, candidato, dist)
+                    continue
+                if (outra_empresa, dist) > chave_melhor[:2]:
+                    continue
+                # Empate: só aqui vale calcular a distância de OCR, que é bem mais cara
+                if chave_melhor[2] is None:
+                    chave_melhor = chave_melhor[:2] + (distancia_ocr(*melhor[:2]), chave_melhor[3])
+                chave = (outra_empresa, dist, distancia_ocr(cnpj_ocr, candidato), ordem)
+                if chave < chave_melhor:
+                    chave_melhor = chave
+                    melhor = (cnpj_ocr, candidato, dist)
+        return melhor
+
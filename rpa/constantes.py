@@ -1,3 +1,5 @@
+import os
+
 pytesseract_cmd = r"C:\Users\rpa03_tuper\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
 
 mapa_estab = {
@@ -7,4 +9,9 @@ mapa_estab = {
     "11081096000186": "501", "10701174000135": "481", "10144595000293": "422",
     "11350362000129": "521", "10941252000179": "461", "81315426000993": "103",
     "10701174000216": "482", "81315426003070": "106", "81315426000489": "121"
-}
\ No newline at end of file
+}
+
+
+def workers_padrao():
+    """Quantidade padrão de processos: um por núcleo, deixando um livre para a interface"""
+    return max(1, (os.cpu_count() or 1) - 1)
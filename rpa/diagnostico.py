@@ -0,0 +1,162 @@
+"""
+Modo de diagnóstico do desempenho: cProfile de cada nota e relatório das mais lentas.
+
+Ligado por `ConfigPipeline.pasta_perfis` (`--perfilar` no lote, opção na interface).
+Cada nota roda sob o cProfile no processo que a processa e grava
+`<pasta>/<nome>.prof`; ao fim do lote o processo principal junta tudo em `lote.prof`
+e grava `lentos.txt`/`lentos.json` com as N notas mais lentas: páginas, tamanho do
+PDF e das imagens, tempo de cada estágio e as funções que mais gastaram.
+
+Os .prof abrem com `python -m pstats`, snakeviz ou similares.
+
+Uso: python -m rpa.diagnostico <pasta de perfis> [--top 10]   (lista os .prof mais lentos de uma pasta)
+"""
+import os
+import sys
+import json
+import heapq
+import pstats
+import cProfile
+import argparse
+import itertools
+
+TOP_LENTOS = 10
+FUNCOES_POR_NOTA = 5
+
+
+def perfilar_documento(funcao, path_pdf, output_json, config):
+    """Roda `funcao(path_pdf, output_json, config)` sob o cProfile e grava o .prof da nota"""
+    perfil = cProfile.Profile()
+    resultado = perfil.runcall(funcao, path_pdf, output_json, config)
+    os.makedirs(config.pasta_perfis, exist_ok=True)
+    base = os.path.splitext(os.path.basename(path_pdf))[0]
+    # Mesmo nome em pastas diferentes: o início do hash separa os arquivos
+    sufixo = f"_{resultado.hash_pdf[:8]}" if resultado.hash_pdf else ""
+    destino = os.path.join(config.pasta_perfis, f"{base}{sufixo}.prof")
+    perfil.dump_stats(destino)
+    resultado.arquivo_perfil = destino
+    return resultado
+
+
+def mesclar_perfis(arquivos, destino):
+    """Soma os .prof das notas num só, para ver o lote inteiro de uma vez"""
+    arquivos = [a for a in arquivos if a and os.path.exists(a)]
+    if not arquivos:
+        return None
+    pstats.Stats(*arquivos).dump_stats(destino)
+    return destino
+
+
+def funcoes_mais_caras(arquivo, quantidade=FUNCOES_POR_NOTA):
+    """As funções com mais tempo próprio no .prof, como texto curto"""
+    if not arquivo or not os.path.exists(arquivo):
+        return []
+    estatisticas = pstats.Stats(arquivo).stats
+    maiores = sorted(estatisticas.items(), key=lambda item: item[1][2], reverse=True)[:quantidade]
+    return [
+        f"{tempo_proprio:.3f}s  {funcao} ({os.path.basename(arquivo_fonte)}:{linha}, {chamadas} chamadas)"
+        for (arquivo_fonte, linha, funcao), (_, chamadas, tempo_proprio, _, _) in maiores
+    ]
+
+
+def resumir(resultado):
+    """O que o relatório mostra de uma nota"""
+    try:
+        tamanho_kb = round(os.path.getsize(resultado.caminho_pdf) / 1024, 1)
+    except OSError:
+        tamanho_kb = None
+    return {
+        "arquivo": resultado.nome,
+        "caminho_pdf": resultado.caminho_pdf,
+        "total": round(sum(resultado.tempos.values()), 4),
+        "paginas": resultado.paginas,
+        "paginas_texto": resultado.paginas_texto,
+        "paginas_puladas": resultado.paginas_puladas,
+        "tamanho_pdf_kb": tamanho_kb,
+        "imagens": [f"{largura}x{altura}" for largura, altura in resultado.dimensoes],
+        "tempos": {estagio: round(segundos, 4)
+                   for estagio, segundos in sorted(resultado.tempos.items(), key=lambda t: -t[1])},
+        "erro": resultado.descricao_erro(),
+        "perfil": resultado.arquivo_perfil,
+    }
+
+
+class RelatorioLentos:
+    """Guarda só as N notas mais lentas vistas até agora"""
+
+    def __init__(self, quantidade=TOP_LENTOS):
+        self.quantidade = quantidade
+        self._heap = []
+        self._ordem = itertools.count()
+        self.arquivos_perfil = []
+
+    def adicionar(self, resultado):
+        if resultado.arquivo_perfil:
+            self.arquivos_perfil.append(resultado.arquivo_perfil)
+        item = (sum(resultado.tempos.values()), next(self._ordem), resumir(resultado))
+        if len(self._heap) < self.quantidade:
+            heapq.heappush(self._heap, item)
+        else:
+            heapq.heappushpop(self._heap, item)
+
+    def lentos(self):
+        return [resumo for _, _, resumo in sorted(self._heap, reverse=True)]
+
+    def texto(self):
+        linhas = [f"As {len(self._heap)} notas mais lentas"]
+        for posicao, nota in enumerate(self.lentos(), 1):
+            linhas.append("")
+            linhas.append(f"{posicao}. {nota['arquivo']} - {nota['total']:.2f}s, {nota['paginas']} pág. "
+                          f"({nota['paginas_texto']} com texto), {nota['tamanho_pdf_kb']} KB")
+            if nota["imagens"]:
+                linhas.append(f"   imagens: {', '.join(nota['imagens'])}")
+            if nota["paginas_puladas"]:
+                linhas.append(f"   páginas puladas: {', '.join(map(str, nota['paginas_puladas']))}")
+            linhas.append("   estágios: " + ", ".join(f"{e} {s:.2f}s" for e, s in nota["tempos"].items()))
+            if nota["erro"]:
+                linhas.append(f"   erro: {nota['erro']}")
+            for funcao in nota.get("funcoes", []):
+                linhas.append(f"   {funcao}")
+            if nota["perfil"]:
+                linhas.append(f"   perfil: {nota['perfil']}")
+        return "\n".join(linhas)
+
+    def gravar(self, pasta):
+        """Grava lentos.txt, lentos.json e o lote.prof; retorna o caminho do lentos.txt"""
+        os.makedirs(pasta, exist_ok=True)
+        for nota in self.lentos():
+            nota["funcoes"] = funcoes_mais_caras(nota["perfil"])
+        mesclar_perfis(self.arquivos_perfil, os.path.join(pasta, "lote.prof"))
+        with open(os.path.join(pasta, "lentos.json"), "w", encoding="utf-8") as f:
+            json.dump(self.lentos(), f, ensure_ascii=False, indent=2)
+        caminho = os.path.join(pasta, "lentos.txt")
+        with open(caminho, "w", encoding="utf-8") as f:
+            f.write(self.texto() + "\n")
+        return caminho
+
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rpa.diagnostico",
+                                     description="Funções mais caras de cada .prof de uma pasta de perfis")
+    parser.add_argument("pasta")
+    parser.add_argument("--top", type=int, default=TOP_LENTOS, help="Quantos perfis mostrar, dos mais lentos")
+    args = parser.parse_args(argv)
+
+    arquivos = [os.path.join(args.pasta, f) for f in os.listdir(args.pasta)
+                if f.endswith(".prof") and f != "lote.prof"]
+    if not arquivos:
+        print(f"Nenhum perfil em {args.pasta}", file=sys.stderr)
+        return 2
+    # Sem os ResultadoNF, o tempo total de cada nota vem do próprio perfil
+    totais = sorted(((pstats.Stats(a).total_tt, a) for a in arquivos), reverse=True)[:args.top]
+    for total, arquivo in totais:
+        print(f"{os.path.basename(arquivo)} - {total:.2f}s")
+        for funcao in funcoes_mais_caras(arquivo):
+            print(f"   {funcao}")
+    mesclar_perfis(arquivos, os.path.join(args.pasta, "lote.prof"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
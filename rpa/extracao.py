@@ -0,0 +1,154 @@
+"""
+Motor de extração de campos da nota.
+
+Cada fornecedor com layout próprio tem o seu conjunto de padrões, compilado no
+cadastro; os que usam o layout comum compartilham o conjunto geral. A extração
+acha o CNPJ do fornecedor com o padrão geral, escolhe o fornecedor por busca em
+dicionário e aplica só o conjunto dele, uma busca por campo: o custo não cresce
+com o número de fornecedores cadastrados.
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from rpa.cnpj import validar_cnpj
+
+
+@dataclass(frozen=True)
+class PadraoCampo:
+    """Padrão de um campo; o valor fica no grupo nomeado `valor`"""
+    campo: str
+    regex: str
+    confianca: float = 1.0
+
+
+@dataclass(frozen=True)
+class PerfilFornecedor:
+    """Constantes do contrato de um fornecedor e, se o layout for diferente, seus padrões próprios"""
+    nome: str
+    cnpjs: tuple = ()
+    padroes: tuple = ()
+    nr_contrato: str = "434"
+    descricao: str = "Compra de benefícios - Auxilio Alimentação e Refeição"
+    nome_prod_serv: str = "Auxilio Alimentação e Refeição"
+    valor_unitario: float = 100.0
+    prazo_vencimento_dias: int = 30
+
+
+@dataclass
+class CampoExtraido:
+    texto: str = ""
+    valor: object = None
+    confianca: float = 0.0
+
+
+@dataclass
+class Extracao:
+    fornecedor: PerfilFornecedor
+    campos: dict = field(default_factory=dict)
+
+    def texto(self, campo):
+        return self.campos[campo].texto if campo in self.campos else ""
+
+    def valor(self, campo):
+        return self.campos[campo].valor if campo in self.campos else None
+
+    def confiancas(self):
+        return {campo: c.confianca for campo, c in self.campos.items()}
+
+
+# O CNPJ sem rótulo obrigatório pega qualquer sequência de 18 caracteres, daí a confiança menor
+PADROES_GERAIS = (
+    PadraoCampo("cnpjFornecedor", r"(?i:\bC?F?P?/?C?N?P?J?[:\s-]*(?P<valor>[\d./-]{18}))", 0.7),
+    PadraoCampo("nrNotaFiscal", r"RPS\s+Nº\s*(?P<valor>\d+)"),
+    PadraoCampo("dtEmissao", r"Data\s+da\s+Compra:\s*(?P<valor>\d{2}/\d{2}/\d{4})"),
+    PadraoCampo("valorNf", r"VALOR\s+TOTAL\s+DO\s+SERVIÇO\s*=\s*R\$\s*(?P<valor>[\d,.]+)"),
+)
+
+FORNECEDOR_PADRAO = PerfilFornecedor("padrao")
+
+
+def _so_digitos(texto):
+    return texto.replace(".", "").replace("/", "").replace("-", "")
+
+def _converter_data(texto):
+    # O padrão já garante dd/mm/aaaa; date() recusa dia ou mês inválido com ValueError, como o strptime
+    dia, mes, ano = texto.split("/")
+    return date(int(ano), int(mes), int(dia))
+
+def _converter_valor(texto):
+    return float(texto.replace(".", "").replace(",", "."))
+
+# Conversão para o tipo do campo; se falhar o texto é mantido e a confiança cai pela metade
+CONVERSORES = {
+    "cnpjFornecedor": _so_digitos,
+    "nrNotaFiscal": str,
+    "dtEmissao": _converter_data,
+    "valorNf": _converter_valor,
+}
+
+def _validar(campo, valor):
+    if campo == "cnpjFornecedor":
+        return validar_cnpj(valor)
+    if campo == "valorNf":
+        return valor > 0
+    return True
+
+
+def _compilar(padroes):
+    return tuple((padrao, re.compile(padrao.regex)) for padrao in padroes)
+
+
+class MotorExtracao:
+    def __init__(self, padroes_gerais=PADROES_GERAIS, fornecedores=()):
+        self.padroes_gerais = tuple(padroes_gerais)
+        self._gerais = _compilar(self.padroes_gerais)
+        self._regex_cnpj = next((regex for padrao, regex in self._gerais if padrao.campo == "cnpjFornecedor"), None)
+        self.fornecedores = []
+        self._por_cnpj = {}
+        self._conjuntos = {}
+        for fornecedor in fornecedores:
+            self.registrar(fornecedor)
+
+    def registrar(self, fornecedor):
+        self.fornecedores.append(fornecedor)
+        for cnpj in fornecedor.cnpjs:
+            self._por_cnpj[cnpj] = fornecedor
+        if fornecedor.padroes:
+            # Padrões próprios primeiro; os gerais ficam para os campos que eles não acharem
+            self._conjuntos[fornecedor.nome] = _compilar(fornecedor.padroes) + self._gerais
+
+    def extrair(self, texto):
+        """Escolhe o fornecedor pelo CNPJ e aplica só o conjunto de padrões dele"""
+        achado_cnpj = self._regex_cnpj.search(texto) if self._regex_cnpj else None
+        fornecedor = FORNECEDOR_PADRAO
+        if achado_cnpj:
+            fornecedor = self._por_cnpj.get(_so_digitos(achado_cnpj.group("valor")), FORNECEDOR_PADRAO)
+
+        extracao = Extracao(fornecedor)
+        for padrao, regex in self._conjuntos.get(fornecedor.nome, self._gerais):
+            if padrao.campo in extracao.campos:
+                continue
+            # Cada campo tem a sua busca: padrões de campos diferentes podem se sobrepor no texto
+            achado = achado_cnpj if regex is self._regex_cnpj else regex.search(texto)
+            if achado:
+                extracao.campos[padrao.campo] = self._converter(padrao, achado.group("valor"))
+        return extracao
+
+    @staticmethod
+    def _converter(padrao, texto):
+        conversor = CONVERSORES.get(padrao.campo, str)
+        try:
+            valor = conversor(texto)
+        except ValueError:
+            return CampoExtraido(texto, None, padrao.confianca * 0.5)
+        confianca = padrao.confianca if _validar(padrao.campo, valor) else padrao.confianca * 0.5
+        return CampoExtraido(texto, valor, confianca)
+
+
+_motor = MotorExtracao()
+
+def registrar_fornecedor(fornecedor):
+    _motor.registrar(fornecedor)
+
+def extrair_campos(texto):
+    return _motor.extrair(texto)
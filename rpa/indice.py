@@ -0,0 +1,132 @@
+"""
+Índice local dos envios para a API, em SQLite.
+
+Cada nota enviada fica registrada pelo hash do PDF e pelo par
+(cnpjFornecedor, nrNotaFiscal), com a situação do envio. Ao reprocessar uma
+pasta, PDFs já entregues (ou já na fila da outbox) são reconhecidos pelo hash
+antes da renderização e não passam de novo por OCR nem por envio; a mesma nota
+digitalizada de novo é reconhecida pelo par depois da extração e não é reenviada.
+Logo antes de enviar, o processo que envia confere o índice de novo e marca a nota
+como em envio, para que uma segunda cópia no mesmo lote não seja enviada junto; a
+marca vence em PRAZO_ENVIO, caso o processo caia antes da resposta da API.
+"""
+import os
+import time
+import sqlite3
+import threading
+
+CAMINHO_INDICE = os.path.join("dados", "envios.db")
+
+ENTREGUE = "entregue"
+ENFILEIRADA = "enfileirada"
+ENVIANDO = "enviando"
+FALHOU = "falhou"
+
+# Situações em que a nota não deve ser enviada de novo sem pedido explícito
+JA_ENVIADAS = (ENTREGUE, ENFILEIRADA)
+
+# Uma nota em envio só bloqueia outro envio por este prazo, como a reserva da outbox: se o
+# processo cair antes da resposta da API, a nota volta a poder ser enviada quando ele vence.
+# Cobre as novas tentativas do ClienteAPI e a espera na fila de envios do lote
+PRAZO_ENVIO = 600
+_EM_JA_ENVIADAS = "(situacao IN (?, ?) OR (situacao = ? AND atualizado_em > ?))"
+
+def _ja_enviadas():
+    return JA_ENVIADAS + (ENVIANDO, time.time() - PRAZO_ENVIO)
+
+
+class IndiceEnvios:
+    def __init__(self, caminho=CAMINHO_INDICE):
+        self.caminho = caminho
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._local = threading.local()
+        with self._conexao() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS envios (
+                    hash_pdf TEXT PRIMARY KEY,
+                    cnpj_fornecedor TEXT,
+                    nr_nota_fiscal TEXT,
+                    caminho_pdf TEXT,
+                    output_json TEXT,
+                    situacao TEXT NOT NULL,
+                    status INTEGER,
+                    resposta TEXT,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS ix_envios_nota ON envios (cnpj_fornecedor, nr_nota_fiscal)")
+
+    def _conexao(self):
+        # Uma conexão por thread, como na outbox: os processos do lote consultam, o principal grava
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=30)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            self._local.con = con
+        return con
+
+    def consultar(self, hash_pdf):
+        """Registro do PDF se ele já foi entregue, está na fila ou em envio dentro do PRAZO_ENVIO; senão None"""
+        linha = self._conexao().execute(
+            f"SELECT * FROM envios WHERE hash_pdf = ? AND {_EM_JA_ENVIADAS}", (hash_pdf,) + _ja_enviadas()
+        ).fetchone()
+        return dict(linha) if linha else None
+
+    def consultar_nota(self, cnpj_fornecedor, nr_nota_fiscal):
+        """Registro de outro PDF com a mesma nota já entregue, na fila ou em envio; senão None"""
+        if not cnpj_fornecedor or not nr_nota_fiscal:
+            return None
+        linha = self._conexao().execute(
+            f"SELECT * FROM envios WHERE cnpj_fornecedor = ? AND nr_nota_fiscal = ? AND {_EM_JA_ENVIADAS} "
+            "ORDER BY atualizado_em DESC LIMIT 1",
+            (cnpj_fornecedor, nr_nota_fiscal) + _ja_enviadas(),
+        ).fetchone()
+        return dict(linha) if linha else None
+
+    def registrar(self, hash_pdf, dados, situacao, status=None, resposta="", caminho_pdf="", output_json=""):
+        """Grava a situação do envio; uma nota entregue não volta a constar como pendente ou com falha"""
+        if not hash_pdf:
+            return
+        with self._conexao() as con:
+            con.execute(
+                "INSERT INTO envios (hash_pdf, cnpj_fornecedor, nr_nota_fiscal, caminho_pdf, output_json, "
+                "situacao, status, resposta, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (hash_pdf) DO UPDATE SET cnpj_fornecedor = excluded.cnpj_fornecedor, "
+                "nr_nota_fiscal = excluded.nr_nota_fiscal, caminho_pdf = excluded.caminho_pdf, "
+                "output_json = excluded.output_json, situacao = excluded.situacao, status = excluded.status, "
+                "resposta = excluded.resposta, atualizado_em = excluded.atualizado_em "
+                "WHERE envios.situacao != ? OR excluded.situacao = ?",
+                (hash_pdf, dados.get("cnpjFornecedor", ""), dados.get("nrNotaFiscal", ""), caminho_pdf,
+                 output_json, situacao, status, resposta, time.time(), ENTREGUE, ENTREGUE),
+            )
+
+    def registrar_resposta(self, hash_pdf, dados, status, resposta, caminho_pdf="", output_json=""):
+        situacao = ENTREGUE if status == 200 else FALHOU
+        self.registrar(hash_pdf, dados, situacao, status, resposta, caminho_pdf, output_json)
+
+    def contar(self):
+        linhas = self._conexao().execute("SELECT situacao, COUNT(*) FROM envios GROUP BY situacao").fetchall()
+        return {situacao: total for situacao, total in linhas}
+
+
+_indices = {}
+
+def obter_indice(caminho=CAMINHO_INDICE):
+    """Uma instância por processo para cada arquivo de índice"""
+    if caminho not in _indices:
+        _indices[caminho] = IndiceEnvios(caminho)
+    return _indices[caminho]
+
+
+def descrever(registro):
+    """Texto curto sobre um envio anterior, para relatórios e mensagens"""
+    quando = time.strftime("%d/%m/%Y %H:%M", time.localtime(registro["atualizado_em"]))
+    arquivo = os.path.basename(registro["caminho_pdf"] or "")
+    if registro["situacao"] == ENFILEIRADA:
+        return f"Já está na fila de envio desde {quando} ({arquivo})"
+    if registro["situacao"] == ENVIANDO:
+        return f"Envio iniciado em {quando}, ainda sem resposta registrada ({arquivo})"
+    return f"Já enviada em {quando} ({arquivo})"
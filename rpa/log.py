@@ -0,0 +1,151 @@
+"""
+Log estruturado do sistema, em JSON por linha.
+
+Quem registra só coloca o evento numa fila; uma thread em segundo plano grava no
+arquivo, que é rotacionado por tamanho (`logs/api_log.jsonl`, `.1`, `.2`...).
+Os processos do lote mandam seus registros por uma fila de multiprocessing para
+o processo principal, o único que escreve no arquivo.
+
+O conteúdo binário das requisições não vai para o log: o `fileHashNF` é trocado
+pelo SHA-256 e pelo tamanho do base64, e textos longos são cortados.
+"""
+import os
+import json
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+from queue import SimpleQueue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+CAMINHO_LOG = os.path.join("logs", "api_log.jsonl")
+TAMANHO_MAX = 10 * 1024 * 1024
+BACKUPS = 5
+
+CAMPOS_BINARIOS = {"fileHashNF"}
+LIMITE_TEXTO = 2000
+
+logger = logging.getLogger("rpa")
+
+_lock = threading.Lock()
+_manipulador = None
+_ouvintes = []
+_fila_processos = None
+
+
+def resumir(valor):
+    """Cópia do valor pronta para o log: campos binários viram hash e textos longos são cortados"""
+    if isinstance(valor, dict):
+        resumo = {}
+        for chave, item in valor.items():
+            if chave in CAMPOS_BINARIOS and isinstance(item, str):
+                resumo[chave] = {"sha256": hashlib.sha256(item.encode("ascii", "replace")).hexdigest(),
+                                 "tamanho": len(item)}
+            else:
+                resumo[chave] = resumir(item)
+        return resumo
+    if isinstance(valor, list):
+        return [resumir(item) for item in valor]
+    if isinstance(valor, str) and len(valor) > LIMITE_TEXTO:
+        return f"{valor[:LIMITE_TEXTO]}... (+{len(valor) - LIMITE_TEXTO} caracteres)"
+    return valor
+
+
+class FormatoJSON(logging.Formatter):
+    """Uma linha JSON por registro; o dicionário passado em extra={"dados": ...} vira campos da linha"""
+
+    def format(self, record):
+        linha = {
+            "momento": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "origem": record.name,
+            "pid": record.process,
+            "evento": record.getMessage(),
+        }
+        linha.update(getattr(record, "dados", None) or {})
+        if record.exc_info:
+            linha["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(linha, ensure_ascii=False, default=str)
+
+
+def configurar_log(caminho=CAMINHO_LOG, tamanho_max=TAMANHO_MAX, backups=BACKUPS):
+    """Liga o log deste processo ao arquivo rotativo, por uma fila; chamadas repetidas não fazem nada"""
+    global _manipulador
+    with _lock:
+        if _manipulador is not None:
+            return
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        _manipulador = RotatingFileHandler(caminho, maxBytes=tamanho_max, backupCount=backups,
+                                           encoding="utf-8", delay=True)
+        _manipulador.setFormatter(FormatoJSON())
+
+        fila = SimpleQueue()
+        _ouvintes.append(QueueListener(fila, _manipulador))
+        _ouvintes[-1].start()
+        _trocar_destino(QueueHandler(fila))
+        atexit.register(encerrar_log)
+
+
+def fila_para_processos():
+    """
+    Fila para os processos do lote (passar ao configurar_worker); os registros que
+    chegam por ela são gravados no mesmo arquivo por este processo.
+    """
+    global _fila_processos
+    configurar_log()
+    with _lock:
+        if _fila_processos is None:
+            _fila_processos = multiprocessing.Queue()
+            _ouvintes.append(QueueListener(_fila_processos, _manipulador))
+            _ouvintes[-1].start()
+        return _fila_processos
+
+
+def configurar_worker(fila):
+    """No processo filho: tudo vai para a fila do processo principal, nada é escrito aqui"""
+    # Com fork o filho herda a configuração do pai, cuja thread de gravação não existe no filho
+    _trocar_destino(QueueHandler(fila))
+
+
+def _trocar_destino(manipulador):
+    for antigo in list(logger.handlers):
+        logger.removeHandler(antigo)
+    logger.addHandler(manipulador)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def encerrar_log():
+    """Grava o que ainda está nas filas e para as threads de gravação"""
+    global _manipulador, _fila_processos
+    with _lock:
+        for manipulador in list(logger.handlers):
+            logger.removeHandler(manipulador)
+        while _ouvintes:
+            _ouvintes.pop().stop()
+        if _manipulador is not None:
+            _manipulador.close()
+        _manipulador = None
+        _fila_processos = None
+
+
+def registrar(evento, nivel=logging.INFO, **dados):
+    """Registra um evento com campos estruturados"""
+    if not logger.handlers:
+        configurar_log()
+    logger.log(nivel, evento, extra={"dados": dados})
+
+
+def registrar_envio(status, requisicao, resposta):
+    """Requisição e resposta de um envio para a API, sem o conteúdo do PDF"""
+    if isinstance(requisicao, str):
+        try:
+            requisicao = json.loads(requisicao)
+        except ValueError:
+            pass
+    registrar("envio_api", logging.INFO if status == 200 else logging.WARNING,
+              status=status, requisicao=resumir(requisicao), resposta=resumir(resposta))
@@ -1,11 +1,17 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
+import time
 import threading
-from PIL import Image, ImageTk
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
 import sys
 from pathlib import Path
-from rpa.ocr import ler_nf_com_ocr 
+# Só módulos leves aqui: pipeline, lote e OCR (pytesseract, pdf2image, PIL, Levenshtein,
+# requests) são importados pelo aquecimento em segundo plano, depois que a janela aparece
+from rpa.constantes import workers_padrao
+from rpa.metricas import obter_metricas, JANELA_TAXA
 import rpa.api as api
 
 def verificar_ambiente():
@@ -85,6 +91,10 @@ class ModernApp:
         # Configurar estilo
         self.configurar_estilo()
         
+        # Reprocessa e reenvia notas que o índice de envios já registra como enviadas
+        self.var_forcar_reenvio = tk.BooleanVar(value=False)
+        self.var_perfilar = tk.BooleanVar(value=False)
+        
         # Layout principal
         self.criar_menu()
         self.criar_header()
@@ -94,8 +104,15 @@ class ModernApp:
         # Status de processamento
         self.processando = False
         
+        # Thread única de OCR da nota individual: o motor carregado no aquecimento
+        # (por thread, como o tesserocr exige) é o mesmo usado em todas as notas
+        self.thread_ocr = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-interface")
+        
         # Centralizar a janela na tela
         self.centralizar_janela()
+        
+        # Aquecimento depois que a janela já foi desenhada
+        self.root.after_idle(self.iniciar_aquecimento)
     
     def centralizar_janela(self):
         """Centraliza a janela na tela"""
@@ -354,6 +371,12 @@ class ModernApp:
         )
         btn_saida.pack(side="right")
         
+        ttk.Checkbutton(
+            frame,
+            text="Forçar reenvio de notas já enviadas",
+            variable=self.var_forcar_reenvio
+        ).pack(anchor="w", pady=(5, 0))
+        
         # Separador
         ttk.Separator(frame, orient="horizontal").pack(fill="x", pady=20)
         
@@ -463,6 +486,42 @@ class ModernApp:
         )
         btn_saida_lote.pack(side="right")
         
+        # Quantidade de processos paralelos
+        workers_frame = ttk.Frame(frame)
+        workers_frame.pack(fill="x", pady=10)
+        
+        workers_label = tk.Label(
+            workers_frame,
+            text="Processos paralelos:",
+            font=self.fonte["normal"],
+            fg=self.cores["texto"],
+            bg=self.cores["fundo"],
+            anchor="w"
+        )
+        workers_label.pack(side="left")
+        
+        self.spin_workers = ttk.Spinbox(
+            workers_frame,
+            from_=1,
+            to=os.cpu_count() or 1,
+            width=5,
+            font=self.fonte["normal"]
+        )
+        self.spin_workers.set(workers_padrao())
+        self.spin_workers.pack(side="left", padx=(10, 0))
+        
+        ttk.Checkbutton(
+            workers_frame,
+            text="Forçar reenvio de notas já enviadas",
+            variable=self.var_forcar_reenvio
+        ).pack(side="left", padx=(20, 0))
+        
+        ttk.Checkbutton(
+            workers_frame,
+            text="Diagnóstico de desempenho",
+            variable=self.var_perfilar
+        ).pack(side="left", padx=(20, 0))
+        
         # Separador
         ttk.Separator(frame, orient="horizontal").pack(fill="x", pady=20)
         
@@ -497,6 +556,16 @@ class ModernApp:
         )
         self.contador_lote.pack(side="right")
         
+        # Vazão do lote em andamento (notas por minuto no último minuto)
+        self.taxa_lote = tk.Label(
+            status_frame,
+            text="",
+            font=self.fonte["normal"],
+            fg=self.cores["secundaria"],
+            bg=self.cores["fundo"]
+        )
+        self.taxa_lote.pack(side="right", padx=(0, 15))
+        
         # Barra de progresso
         self.progress_lote = ttk.Progressbar(
             frame,
@@ -535,6 +604,16 @@ class ModernApp:
             )
             ambiente_info.pack(side="left")
         
+        # Andamento do aquecimento do OCR
+        self.status_ocr = tk.Label(
+            footer,
+            text="Carregando OCR...",
+            font=self.fonte["pequena"],
+            fg=self.cores["texto"],
+            bg=self.cores["fundo"]
+        )
+        self.status_ocr.pack(side="left", padx=(10, 0))
+        
         # Versão e informações
         info = tk.Label(
             footer,
@@ -545,6 +624,29 @@ class ModernApp:
         )
         info.pack(side="right")
     
+    # --- Aquecimento ---
+    def iniciar_aquecimento(self):
+        """Carrega os módulos pesados e o motor de OCR sem travar a janela"""
+        self.thread_ocr.submit(self._aquecer)
+    
+    def _aquecer(self):
+        inicio = time.perf_counter()
+        try:
+            import rpa.batch  # noqa: F401  (pipeline, OCR e extração)
+            import requests  # noqa: F401  (o ClienteAPI só o importa quando é criado)
+            from rpa.ocr import aquecer
+            from rpa.pipeline import ConfigPipeline
+            
+            # Idioma e motor padrão; as variáveis do Tk não são lidas fora da thread da janela
+            config = ConfigPipeline()
+            aquecer(config.lang, config.motor_ocr)
+            texto = f"OCR pronto ({time.perf_counter() - inicio:.1f}s)"
+        except Exception as e:
+            # Sem Tesseract, por exemplo: o erro real aparece ao processar a primeira nota
+            print(f"Aquecimento do OCR falhou: {str(e)}")
+            texto = "OCR não carregado"
+        self.root.after(0, lambda: self.status_ocr.config(text=texto))
+    
     # --- Funções de ação ---
     def escolher_pdf(self):
         """Abre diálogo para escolher arquivo PDF"""
@@ -615,21 +717,45 @@ class ModernApp:
         self.status_individual.config(text="Processando...")
         self.progress_individual["value"] = 0
         
-        # Executa em thread separada
-        threading.Thread(target=self._processar_individual, args=(caminho_pdf, pasta_saida)).start()
+        # Executa na thread de OCR; se o aquecimento ainda estiver rodando, a nota espera por ele
+        self.thread_ocr.submit(self._processar_individual, caminho_pdf, pasta_saida)
     
     def _processar_individual(self, caminho_pdf, pasta_saida):
-        """Executa o processamento individual em thread separada"""
+        """Executa o processamento individual na thread de OCR"""
+        from rpa.pipeline import processar_nf
+        
         try:
             # Atualiza progresso
             self.root.after(100, lambda: self.progress_individual.config(value=30))
             
             # Nome do arquivo de saída
-            nome_json = os.path.basename(caminho_pdf).replace(".pdf", ".json")
+            nome_json = os.path.splitext(os.path.basename(caminho_pdf))[0] + ".json"
             output_json = os.path.join(pasta_saida, nome_json)
             
             # Executa a conversão
-            ler_nf_com_ocr(caminho_pdf, output_json)
+            resultado = processar_nf(caminho_pdf, output_json, self.config_pipeline())
+            if resultado.erro:
+                raise RuntimeError(resultado.descricao_erro())
+            
+            # O índice de envios já registra esta nota: nada foi reenviado
+            if resultado.ja_enviado:
+                self.root.after(100, lambda: self.progress_individual.config(value=100))
+                self.root.after(100, lambda: self.status_individual.config(text="Nota já enviada"))
+                self.root.after(200, lambda: messagebox.showinfo(
+                    "Nota já enviada",
+                    f"{resultado.resposta}\n\nMarque \"Forçar reenvio\" para enviar de novo."
+                ))
+                return
+            
+            # JSON gerado, mas a API recusou ou não respondeu
+            if not resultado.sucesso:
+                self.root.after(100, lambda: self.progress_individual.config(value=100))
+                self.root.after(100, lambda: self.status_individual.config(text="JSON gerado, envio com erro"))
+                self.root.after(200, lambda: messagebox.showwarning(
+                    "Erro no envio",
+                    f"Erro ({resultado.status}): {resultado.resposta}\nJSON salvo em: {output_json}"
+                ))
+                return
             
             # Finaliza com sucesso
             self.root.after(100, lambda: self.progress_individual.config(value=100))
@@ -639,7 +765,7 @@ class ModernApp:
             if self.ambiente == "TESTE":
                 mensagem = f"✅ Arquivo convertido com sucesso (AMBIENTE DE TESTE):\n{nome_json}\n\n🧪 Os dados foram processados no servidor de desenvolvimento."
             else:
-                mensagem = f"O arquivo foi convertido com sucesso:\n{nome_json}"
+                mensagem = f"O arquivo foi convertido e enviado com sucesso:\n{nome_json}"
             
             # Mostra mensagem de sucesso
             self.root.after(200, lambda: messagebox.showinfo(
@@ -648,13 +774,14 @@ class ModernApp:
             ))
             
         except Exception as e:
-            # Mostra erro
+            # Mostra erro; a mensagem é lida agora, o `e` deixa de existir ao fim do except
+            mensagem_erro = str(e)
             self.root.after(100, lambda: self.status_individual.config(
                 text="Erro no processamento"
             ))
-            self.root.after(200, lambda: messagebox.showerror(
+            self.root.after(200, lambda m=mensagem_erro: messagebox.showerror(
                 "Erro na conversão", 
-                f"Ocorreu um erro ao processar o arquivo:\n{str(e)}"
+                f"Ocorreu um erro ao processar o arquivo:\n{m}"
             ))
         
         finally:
@@ -704,46 +831,73 @@ class ModernApp:
         self.progress_lote["value"] = 0
         self.status_lote.config(text=f"Processando em lote...")
         self.contador_lote.config(text=f"0/{len(arquivos)}")
+        self.taxa_lote.config(text="")
+        self.inicio_lote = time.monotonic()
+        self.root.after(1000, self.atualizar_taxa_lote)
         
         # Executa em thread separada
-        threading.Thread(target=self._processar_lote, args=(entrada, saida, arquivos)).start()
+        workers = self.obter_workers()
+        config = self.config_pipeline()
+        if self.var_perfilar.get():
+            # Um cProfile por nota e o relatório das mais lentas, numa pasta por execução
+            config = replace(config, pasta_perfis=os.path.join("perfis", time.strftime("%Y%m%d_%H%M%S")))
+        threading.Thread(target=self._processar_lote, args=(entrada, saida, arquivos, workers, config)).start()
     
-    def _processar_lote(self, entrada, saida, arquivos):
-        """Executa o processamento em lote em thread separada"""
+    def atualizar_taxa_lote(self):
+        """Mostra as notas por minuto enquanto o lote roda; no começo a janela é o tempo decorrido"""
+        if not self.processando:
+            return
+        janela = min(JANELA_TAXA, max(1.0, time.monotonic() - self.inicio_lote))
+        self.taxa_lote.config(text=f"{obter_metricas().docs_por_minuto(janela):.1f} notas/min")
+        self.root.after(1000, self.atualizar_taxa_lote)
+    
+    def config_pipeline(self):
+        """Opções do pipeline escolhidas na interface"""
+        from rpa.pipeline import ConfigPipeline
+        
+        return ConfigPipeline(pular_enviados=not self.var_forcar_reenvio.get())
+    
+    def obter_workers(self):
+        """Lê a quantidade de processos paralelos informada na aba de lote"""
+        try:
+            return max(1, int(self.spin_workers.get()))
+        except ValueError:
+            return workers_padrao()
+    
+    def _processar_lote(self, entrada, saida, arquivos, workers, config=None):
+        """Executa o processamento em lote em thread separada, distribuindo os PDFs entre processos"""
+        from rpa.batch import processar_lote
+        
         total = len(arquivos)
-        sucesso = 0
-        erros = []
-        
-        for idx, nome in enumerate(arquivos):
-            try:
-                # Atualiza status
-                progresso = int(((idx + 0.5) / total) * 100)
-                self.root.after(0, lambda p=progresso: self.progress_lote.config(value=p))
-                self.root.after(0, lambda i=idx, t=total: self.contador_lote.config(text=f"{i}/{t}"))
-                self.root.after(0, lambda n=nome: self.status_lote.config(text=f"Processando: {n}"))
-                
-                # Processa o arquivo
-                caminho_pdf = os.path.join(entrada, nome)
-                output_json = os.path.join(saida, nome.replace(".pdf", ".json"))
-                ler_nf_com_ocr(caminho_pdf, output_json)
-                
-                # Incrementa contador de sucesso
-                sucesso += 1
-                
-            except Exception as e:
-                # Registra erro
-                erros.append(f"{nome}: {str(e)}")
-            
-            # Atualiza status final do arquivo
+        
+        self.root.after(0, lambda: self.status_lote.config(text=f"Processando em lote ({workers} processos)..."))
+        
+        pulados = 0
+        
+        def ao_concluir(idx, resultado):
+            # Chamado na ordem dos arquivos; atualiza a barra a partir da thread de lote
+            nonlocal pulados
+            pulados += resultado.ja_enviado
             progresso = int(((idx + 1) / total) * 100)
             self.root.after(0, lambda p=progresso: self.progress_lote.config(value=p))
             self.root.after(0, lambda i=idx+1, t=total: self.contador_lote.config(text=f"{i}/{t}"))
+            self.root.after(0, lambda n=resultado.nome: self.status_lote.config(text=f"Concluído: {n}"))
+        
+        try:
+            sucesso, erros = processar_lote(entrada, saida, arquivos, workers=workers,
+                                            ao_concluir=ao_concluir, config=config)
+        except Exception as e:
+            sucesso, erros = 0, [f"Falha no pool de processos: {str(e)}"]
         
         # Processamento finalizado
         self.root.after(0, lambda: self.status_lote.config(text="Processamento concluído"))
         
         # Mensagem de resultado personalizada por ambiente
         msg_base = f"{sucesso} de {total} arquivos processados com sucesso."
+        if pulados:
+            msg_base += f"\n{pulados} já tinham sido enviados e foram pulados."
+        if config and config.pasta_perfis:
+            msg_base += f"\nRelatório de desempenho em {os.path.join(config.pasta_perfis, 'lentos.txt')}"
         if self.ambiente == "TESTE":
             msg_base = f"🧪 AMBIENTE DE TESTE: {msg_base}"
         
@@ -810,6 +964,8 @@ class ModernApp:
 
 # --- Inicialização do Aplicativo ---
 if __name__ == "__main__":
+    # Necessário para o pool de processos no executável do PyInstaller
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ModernApp(root)
     root.mainloop()
\ No newline at end of file
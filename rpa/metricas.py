@@ -0,0 +1,292 @@
+"""
+Métricas do processamento: contadores, histogramas de latência e medidores de fila.
+
+Os processos do lote não expõem nada: cada ResultadoNF traz os tempos dos estágios
+e as contagens do documento (páginas, cache, busca do CNPJ do tomador), e o processo
+principal agrega em `registrar_resultado`. O que roda no próprio processo principal
+(envio para a API, outbox, filas) é contado direto.
+
+Saída no formato texto do Prometheus (`texto_prometheus`, o `GET /metricas` do
+serviço) ou em JSON (`snapshot`), que o GravadorMetricas grava de tempos em tempos
+num arquivo (`--metricas` do lote e do monitor).
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Limites dos baldes em segundos: do extrair (milissegundos) ao OCR de PDFs longos
+BALDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Janela da taxa de notas por minuto
+JANELA_TAXA = 60.0
+INTERVALO_GRAVACAO = 10.0
+
+_local = threading.local()
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _serie(nome, rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return nome
+    return nome + "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+
+class Histograma:
+    """Contagem por balde, soma e total, como o histograma do Prometheus"""
+
+    def __init__(self, limites=BALDES):
+        self.limites = tuple(limites)
+        self.baldes = [0] * (len(self.limites) + 1)
+        self.soma = 0.0
+        self.contagem = 0
+
+    def observar(self, valor):
+        self.baldes[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.contagem += 1
+
+    def percentil(self, p):
+        """Limite superior do balde onde cai o percentil (estimativa, como o histogram_quantile)"""
+        if not self.contagem:
+            return 0.0
+        alvo = p / 100 * self.contagem
+        acumulado = 0
+        for limite, quantidade in zip(self.limites + (float("inf"),), self.baldes):
+            acumulado += quantidade
+            if acumulado >= alvo:
+                return limite
+        return float("inf")
+
+    def acumulados(self):
+        total = 0
+        for limite, quantidade in zip(self.limites + (float("inf"),), self.baldes):
+            total += quantidade
+            yield limite, total
+
+    def resumo(self):
+        return {
+            "contagem": self.contagem,
+            "soma": round(self.soma, 6),
+            "media": round(self.soma / self.contagem, 6) if self.contagem else 0.0,
+            # Acima do último balde não há limite conhecido
+            "p50": self.percentil(50) if self.percentil(50) != float("inf") else None,
+            "p95": self.percentil(95) if self.percentil(95) != float("inf") else None,
+        }
+
+
+class Metricas:
+    def __init__(self, limites=BALDES):
+        self.limites = limites
+        self.inicio = time.time()
+        self._contadores = {}
+        self._histogramas = {}
+        self._medidores = {}
+        self._concluidos = deque()
+        self._lock = threading.Lock()
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self._lock:
+            if chave not in self._histogramas:
+                self._histogramas[chave] = Histograma(self.limites)
+            self._histogramas[chave].observar(segundos)
+
+    def medidor(self, nome, funcao, **rotulos):
+        """Registra um valor lido na hora da exportação (tamanho de fila, trabalhos em andamento)"""
+        with self._lock:
+            self._medidores[_chave(nome, rotulos)] = funcao
+
+    def remover_medidor(self, nome, **rotulos):
+        with self._lock:
+            self._medidores.pop(_chave(nome, rotulos), None)
+
+    def registrar_resultado(self, resultado):
+        """Agrega o ResultadoNF de uma nota terminada (no processo principal)"""
+        if resultado.ja_enviado:
+            situacao = "ja_enviado"
+        else:
+            situacao = "ok" if resultado.sucesso else "erro"
+        self.incrementar("rpa_documentos_total", situacao=situacao)
+        if resultado.erro:
+            self.incrementar("rpa_erros_total", estagio=resultado.estagio_erro or "desconhecido")
+
+        for estagio, segundos in resultado.tempos.items():
+            self.observar("rpa_estagio_segundos", segundos, estagio=estagio)
+        self.observar("rpa_documento_segundos", sum(resultado.tempos.values()))
+
+        # As páginas puladas vêm também do cache, gravadas com os textos
+        puladas = len(resultado.paginas_puladas)
+        if resultado.cache_ocr:
+            self.incrementar("rpa_paginas_total", resultado.paginas - puladas, origem="cache")
+        else:
+            self.incrementar("rpa_paginas_total", resultado.paginas_texto, origem="camada_texto")
+            sem_regioes = resultado.paginas_sem_regioes
+            self.incrementar("rpa_paginas_total", resultado.paginas - resultado.paginas_texto - puladas - sem_regioes,
+                             origem="ocr")
+            self.incrementar("rpa_paginas_total", sem_regioes, origem="sem_regioes")
+        self.incrementar("rpa_paginas_total", puladas, origem="pulada")
+        if "cache" in resultado.tempos:
+            self.incrementar("rpa_cache_ocr_total", resultado="acerto" if resultado.cache_ocr else "falta")
+        if resultado.paginas_fallback:
+            self.incrementar("rpa_paginas_fallback_total", resultado.paginas_fallback)
+        if resultado.releituras:
+            self.incrementar("rpa_releituras_ocr_total", resultado.releituras)
+
+        for (nome, rotulos), valor in resultado.contagens.items():
+            self.incrementar(nome, valor, **dict(rotulos))
+
+        with self._lock:
+            self._concluidos.append(time.monotonic())
+
+    def docs_por_minuto(self, janela=JANELA_TAXA):
+        """Notas concluídas por minuto nos últimos `janela` segundos"""
+        agora = time.monotonic()
+        with self._lock:
+            while self._concluidos and agora - self._concluidos[0] > max(janela, JANELA_TAXA):
+                self._concluidos.popleft()
+            quantidade = sum(1 for momento in self._concluidos if agora - momento <= janela)
+        return quantidade * 60 / janela if janela > 0 else 0.0
+
+    def _ler_medidores(self):
+        with self._lock:
+            medidores = list(self._medidores.items())
+        valores = {}
+        for chave, funcao in medidores:
+            try:
+                valores[chave] = funcao()
+            except Exception:
+                # A fila pode já ter sido encerrada entre o registro e a leitura
+                continue
+        return valores
+
+    def snapshot(self):
+        medidores = self._ler_medidores()
+        with self._lock:
+            contadores = {_serie(n, r): v for (n, r), v in sorted(self._contadores.items())}
+            histogramas = {_serie(n, r): h.resumo() for (n, r), h in sorted(self._histogramas.items())}
+        return {
+            "momento": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "desde": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+            "docs_por_minuto": round(self.docs_por_minuto(), 2),
+            "contadores": contadores,
+            "histogramas": histogramas,
+            "medidores": {_serie(n, r): v for (n, r), v in sorted(medidores.items())},
+        }
+
+    def texto_prometheus(self):
+        medidores = self._ler_medidores()
+        linhas = []
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((chave, list(h.acumulados()), h.soma, h.contagem)
+                                 for chave, h in self._histogramas.items())
+
+        tipo_escrito = set()
+
+        def tipo(nome, qual):
+            if nome not in tipo_escrito:
+                linhas.append(f"# TYPE {nome} {qual}")
+                tipo_escrito.add(nome)
+
+        for (nome, rotulos), valor in contadores:
+            tipo(nome, "counter")
+            linhas.append(f"{_serie(nome, rotulos)} {valor}")
+        for (nome, rotulos), acumulados, soma, contagem in histogramas:
+            tipo(nome, "histogram")
+            for limite, total in acumulados:
+                le = "+Inf" if limite == float("inf") else f"{limite:g}"
+                linhas.append(f"{_serie(nome + '_bucket', rotulos, [('le', le)])} {total}")
+            linhas.append(f"{_serie(nome + '_sum', rotulos)} {soma:.6f}")
+            linhas.append(f"{_serie(nome + '_count', rotulos)} {contagem}")
+        for (nome, rotulos), valor in sorted(medidores.items()):
+            tipo(nome, "gauge")
+            linhas.append(f"{_serie(nome, rotulos)} {valor}")
+        tipo("rpa_docs_por_minuto", "gauge")
+        linhas.append(f"rpa_docs_por_minuto {self.docs_por_minuto():.2f}")
+        return "\n".join(linhas) + "\n"
+
+
+_metricas = Metricas()
+
+def obter_metricas():
+    """Métricas do processo"""
+    return _metricas
+
+
+@contextmanager
+def coletar_documento(destino):
+    """
+    Enquanto ativo nesta thread, o que for contado vai para `destino` (as contagens
+    do ResultadoNF) e não para as métricas do processo: nos processos do lote é assim
+    que a contagem chega ao principal.
+    """
+    anterior = getattr(_local, "destino", None)
+    _local.destino = destino
+    try:
+        yield destino
+    finally:
+        _local.destino = anterior
+
+
+def contar(nome, valor=1, **rotulos):
+    destino = getattr(_local, "destino", None)
+    if destino is None:
+        _metricas.incrementar(nome, valor, **rotulos)
+        return
+    chave = _chave(nome, rotulos)
+    destino[chave] = destino.get(chave, 0) + valor
+
+
+def observar(nome, segundos, **rotulos):
+    _metricas.observar(nome, segundos, **rotulos)
+
+
+class GravadorMetricas:
+    """Grava o snapshot em JSON a cada `intervalo` segundos e uma última vez ao parar"""
+
+    def __init__(self, caminho, intervalo=INTERVALO_GRAVACAO, metricas=None):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.metricas = metricas or _metricas
+        self._parar = threading.Event()
+        self._thread = None
+
+    def gravar(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.metricas.snapshot(), f, ensure_ascii=False, indent=2)
+        # Troca atômica: quem lê o arquivo nunca pega a gravação pela metade
+        os.replace(temporario, self.caminho)
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.gravar()
+            except Exception as e:
+                print(f"Erro ao gravar métricas: {str(e)}")
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._loop, name="metricas", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join()
+        self.gravar()
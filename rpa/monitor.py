@@ -0,0 +1,377 @@
+"""
+Monitor da pasta de entrada: as notas são processadas à medida que chegam, sem interface.
+
+Com o `watchdog` instalado, o sistema de arquivos avisa quando um PDF aparece ou muda
+(e uma varredura lenta cobre avisos perdidos); sem ele, a pasta é varrida a cada
+`--intervalo` segundos. Um PDF só entra no pool depois que o tamanho e a data de
+modificação param de mudar por `--estabilidade` segundos e o arquivo termina com
+`%%EOF`, para não ler cópias pela metade.
+
+Terminada a nota (e o envio, quando houver), o PDF vai para `processados/` ou, se deu
+erro, para `erros/` dentro da pasta de entrada; na pasta ficam só as notas novas.
+Com `--manter` os PDFs ficam onde estão e só são lidos de novo se mudarem.
+
+Uso: python -m rpa.monitor "Nota Fiscal" "NF JSON" [--workers 3] [--sem-envio] [--outbox] [--intervalo 2]
+"""
+import os
+import sys
+import time
+import queue
+import shutil
+import logging
+import argparse
+import threading
+from dataclasses import replace
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from watchdog.observers import Observer  # avisos do sistema de arquivos
+except ImportError:
+    Observer = None
+
+from rpa.api import ClienteAPI
+from rpa.outbox import Entregador, obter_outbox
+from rpa.batch import workers_padrao, criar_pool, processar_arquivo
+from rpa.pipeline import ConfigPipeline, ResultadoNF, enviar_resultado, reservar_envio, guardar_artefato
+from rpa.artefatos import DESLIGADO, MODOS, criar_armazem
+from rpa.registro import CAMINHO_REGISTRO, snapshot_atual
+from rpa.indice import obter_indice
+from rpa.log import registrar
+from rpa.metricas import GravadorMetricas, obter_metricas
+
+INTERVALO_VARREDURA = 2.0
+# Com os avisos do watchdog a varredura só cobre eventos perdidos (rede, pasta recriada)
+INTERVALO_COM_AVISOS = 30.0
+ESTABILIDADE = 2.0
+# PDF estável mas sem %%EOF no fim (gerador fora do padrão): processa depois de esperar mais
+ESPERA_SEM_EOF = 5
+PASTA_PROCESSADOS = "processados"
+PASTA_ERROS = "erros"
+
+
+def _versao(caminho):
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+def termina_com_eof(caminho, tamanho_final=1024):
+    """Se o PDF já foi gravado até o fim: o marcador %%EOF fica nos últimos bytes"""
+    try:
+        with open(caminho, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - tamanho_final))
+            return b"%%EOF" in f.read()
+    except OSError:
+        # Aberto com exclusividade por quem está copiando (Windows)
+        return False
+
+
+def destino_livre(pasta, nome):
+    """Caminho em `pasta` que não sobrescreve um arquivo anterior com o mesmo nome"""
+    destino = os.path.join(pasta, nome)
+    if not os.path.exists(destino):
+        return destino
+    base, ext = os.path.splitext(nome)
+    return os.path.join(pasta, f"{base}_{time.strftime('%Y%m%d_%H%M%S')}_{time.monotonic_ns() % 10000}{ext}")
+
+
+class _Avisos:
+    """Recebe os eventos do watchdog; só anota o nome, quem decide o que fazer é o laço do monitor"""
+
+    def __init__(self, fila):
+        self.fila = fila
+
+    def dispatch(self, evento):
+        if evento.is_directory:
+            return
+        # Arquivo renomeado para .pdf (cópia em .tmp) chega como movimento
+        caminho = getattr(evento, "dest_path", "") or evento.src_path
+        if isinstance(caminho, str) and caminho.lower().endswith(".pdf"):
+            self.fila.put(os.path.basename(caminho))
+
+
+class Monitor:
+    """
+    Acompanha uma pasta e processa cada PDF novo ou alterado num pool de processos.
+
+    Como no lote, os processos leem e extraem; artefatos e envio ficam neste processo.
+    `ao_concluir(resultado)` é chamado quando a nota termina, já com o envio feito.
+    """
+
+    def __init__(self, entrada, saida, config=None, workers=None, mover=True, intervalo=INTERVALO_VARREDURA,
+                 estabilidade=ESTABILIDADE, usar_avisos=True, ao_concluir=None):
+        self.entrada = entrada
+        self.saida = saida
+        self.config = config or ConfigPipeline()
+        self.workers = workers or workers_padrao()
+        self.pasta_processados = os.path.join(entrada, PASTA_PROCESSADOS) if mover else None
+        self.pasta_erros = os.path.join(entrada, PASTA_ERROS) if mover else None
+        self.intervalo = intervalo
+        self.estabilidade = estabilidade
+        self.usar_avisos = usar_avisos and Observer is not None
+        self.ao_concluir = ao_concluir
+
+        self._config_workers = replace(self.config, enviar=False, artefatos=DESLIGADO)
+        self._candidatos = {}     # nome -> (versão, desde quando está nela)
+        self._em_andamento = {}   # nome -> versão, do envio ao pool até o fim do envio para a API
+        self._concluidos = {}     # nome -> versão já processada (só com mover=False ou se mover falhar)
+        self._futuros = {}        # futuro do pool -> nome
+        self._envios = []         # (nome, resultado, futuro do envio)
+        self._avisos = queue.SimpleQueue()
+        self._parar = threading.Event()
+
+    # --- Descoberta ---
+    def _observar(self, nome, agora):
+        if nome in self._em_andamento:
+            return
+        versao = _versao(os.path.join(self.entrada, nome))
+        if versao is None or self._concluidos.get(nome) == versao:
+            return
+        anterior = self._candidatos.get(nome)
+        if anterior is None or anterior[0] != versao:
+            self._candidatos[nome] = (versao, agora)
+
+    def varrer(self):
+        agora = time.monotonic()
+        try:
+            with os.scandir(self.entrada) as itens:
+                for item in itens:
+                    if item.is_file() and item.name.lower().endswith(".pdf"):
+                        self._observar(item.name, agora)
+        except OSError as e:
+            # Compartilhamento desmontado ou sem permissão: o monitor segue e tenta na próxima varredura
+            registrar("monitor_varredura_falhou", logging.WARNING, entrada=self.entrada, erro=str(e))
+
+    def _receber_avisos(self):
+        agora = time.monotonic()
+        while True:
+            try:
+                self._observar(self._avisos.get_nowait(), agora)
+            except queue.Empty:
+                return
+
+    def _prontos(self):
+        """Candidatos que pararam de mudar; quem mudou desde a última olhada recomeça a contagem"""
+        agora = time.monotonic()
+        prontos = []
+        for nome, (versao, desde) in list(self._candidatos.items()):
+            caminho = os.path.join(self.entrada, nome)
+            atual = _versao(caminho)
+            if atual is None:
+                del self._candidatos[nome]
+            elif atual != versao:
+                self._candidatos[nome] = (atual, agora)
+            elif agora - desde >= self.estabilidade:
+                if termina_com_eof(caminho) or agora - desde >= self.estabilidade * ESPERA_SEM_EOF:
+                    prontos.append(nome)
+        # Mais antigos primeiro: quem chegou antes sai antes
+        return sorted(prontos, key=lambda n: self._candidatos[n][1])
+
+    # --- Processamento ---
+    def _submeter(self):
+        # O pool recebe só o que consegue começar logo; o resto espera como candidato,
+        # onde uma nova versão do arquivo ainda é percebida
+        vagas = self.workers * 2 - len(self._futuros)
+        for nome in self._prontos()[:max(0, vagas)]:
+            versao, desde = self._candidatos.pop(nome)
+            tarefa = (os.path.join(self.entrada, nome),
+                      os.path.join(self.saida, os.path.splitext(nome)[0] + ".json"),
+                      self._config_workers)
+            try:
+                futuro = self._executor.submit(processar_arquivo, tarefa)
+            except BrokenProcessPool as e:
+                # Um processo do pool morreu (falta de memória, por exemplo): a nota volta a ser
+                # candidata e o pool é recriado; as que estavam nele terminam com erro no _coletar
+                self._candidatos[nome] = (versao, desde)
+                registrar("monitor_pool_recriado", logging.WARNING, erro=str(e))
+                self._executor.shutdown(wait=False)
+                self._executor = criar_pool(self.workers)
+                return
+            self._em_andamento[nome] = versao
+            self._futuros[futuro] = nome
+
+    def _coletar(self, espera):
+        if not self._futuros:
+            self._parar.wait(espera)
+            return
+        prontos, _ = wait(self._futuros, timeout=espera, return_when=FIRST_COMPLETED)
+        for futuro in prontos:
+            nome = self._futuros.pop(futuro)
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                resultado = ResultadoNF(caminho_pdf=os.path.join(self.entrada, nome), erro=str(e), estagio_erro="pool")
+            if self._armazem:
+                guardar_artefato(resultado, self.config, self._armazem)
+            resultado.textos = []
+            envio = None
+            if (self.config.enviar and not resultado.erro and not resultado.ja_enviado
+                    and reservar_envio(resultado, self.config)):
+                if self._cliente:
+                    envio = self._cliente.agendar(enviar_resultado, resultado, self.config, self._cliente)
+                else:
+                    enviar_resultado(resultado, self.config)
+            self._envios.append((nome, resultado, envio))
+
+    def _finalizar_envios(self):
+        # O PDF só sai da pasta depois do envio: a requisição pode ler o arquivo
+        pendentes = []
+        for nome, resultado, envio in self._envios:
+            if envio is not None and not envio.done():
+                pendentes.append((nome, resultado, envio))
+                continue
+            if envio is not None:
+                envio.result()
+            self._finalizar(nome, resultado)
+        self._envios = pendentes
+
+    def _finalizar(self, nome, resultado):
+        versao = self._em_andamento.pop(nome)
+        destino = self.pasta_processados if resultado.sucesso else self.pasta_erros
+        movido = None
+        if destino:
+            try:
+                os.makedirs(destino, exist_ok=True)
+                movido = shutil.move(os.path.join(self.entrada, nome), destino_livre(destino, nome))
+            except OSError as e:
+                print(f"Não foi possível mover {nome}: {str(e)}")
+        if movido is None:
+            self._concluidos[nome] = versao
+        obter_metricas().registrar_resultado(resultado)
+        registrar("monitor_nota", arquivo=nome, sucesso=resultado.sucesso, ja_enviado=resultado.ja_enviado,
+                  erro=resultado.descricao_erro(), destino=movido, tempo=round(sum(resultado.tempos.values()), 4))
+        if self.ao_concluir:
+            self.ao_concluir(resultado)
+
+    # --- Laço principal ---
+    def parar(self):
+        self._parar.set()
+
+    def executar(self):
+        """Roda até `parar()` (ou Ctrl+C); as notas já no pool terminam antes de sair"""
+        os.makedirs(self.saida, exist_ok=True)
+        snapshot_atual(self.config.caminho_registro)
+        self._armazem = criar_armazem(self.config.artefatos, self.config.pasta_artefatos)
+        self._cliente = None
+        if self.config.enviar and self.config.entrega == "direta":
+            self._cliente = ClienteAPI(max_em_voo=self.config.envios_simultaneos)
+
+        observador = None
+        if self.usar_avisos:
+            observador = Observer()
+            observador.schedule(_Avisos(self._avisos), self.entrada, recursive=False)
+            observador.start()
+        intervalo = INTERVALO_COM_AVISOS if observador else self.intervalo
+        metricas = obter_metricas()
+        metricas.medidor("rpa_fila", lambda: len(self._candidatos), fila="monitor")
+        metricas.medidor("rpa_em_processamento", lambda: len(self._em_andamento), fila="monitor")
+        registrar("monitor_inicio", entrada=self.entrada, workers=self.workers, avisos=observador is not None)
+
+        self._executor = criar_pool(self.workers)
+        proxima_varredura = 0.0
+        try:
+            while not self._parar.is_set():
+                if time.monotonic() >= proxima_varredura:
+                    self.varrer()
+                    proxima_varredura = time.monotonic() + intervalo
+                self._receber_avisos()
+                self._submeter()
+                self._coletar(min(0.5, self.estabilidade / 2))
+                self._finalizar_envios()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observador:
+                observador.stop()
+                observador.join()
+            while self._futuros:
+                self._coletar(1.0)
+            self._executor.shutdown(wait=True)
+            if self._cliente:
+                for _, _, envio in self._envios:
+                    if envio is not None:
+                        envio.exception()
+                self._cliente.fechar()
+            self._finalizar_envios()
+            metricas.remover_medidor("rpa_fila", fila="monitor")
+            metricas.remover_medidor("rpa_em_processamento", fila="monitor")
+            if self._armazem:
+                self._armazem.fechar()
+
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rpa.monitor",
+                                     description="Acompanha uma pasta e processa cada PDF que chega.")
+    parser.add_argument("entrada", help="Pasta onde os PDFs chegam")
+    parser.add_argument("saida", help="Pasta para salvar os JSONs")
+    parser.add_argument("--workers", type=int, default=None, help=f"Processos paralelos (padrão: {workers_padrao()})")
+    parser.add_argument("--sem-envio", action="store_true", help="Apenas gera os JSONs, sem enviar para a API")
+    parser.add_argument("--outbox", action="store_true",
+                        help="Grava as notas na fila local e envia em segundo plano, com novas tentativas")
+    parser.add_argument("--manter", action="store_true",
+                        help="Não move os PDFs para processados/ e erros/; só relê um PDF se ele mudar")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_VARREDURA,
+                        help="Segundos entre varreduras da pasta quando o watchdog não está instalado")
+    parser.add_argument("--estabilidade", type=float, default=ESTABILIDADE,
+                        help="Segundos sem mudança no arquivo antes de processá-lo")
+    parser.add_argument("--sem-avisos", action="store_true", help="Usa só a varredura, mesmo com o watchdog instalado")
+    parser.add_argument("--artefatos", choices=MODOS, default=ConfigPipeline.artefatos,
+                        help="Onde guardar o texto do OCR: um arquivo por hash, um zip por execução ou nada")
+    parser.add_argument("--registro", default=CAMINHO_REGISTRO,
+                        help="Cadastro de estabelecimentos (CSV ou SQLite); sem ele vale o mapa_estab")
+    parser.add_argument("--metricas", default=None,
+                        help="Grava as métricas (tempos por estágio, contadores, filas) neste JSON a cada 10s")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.entrada):
+        print(f"Pasta de entrada não existe: {args.entrada}", file=sys.stderr)
+        return 2
+
+    config = ConfigPipeline(
+        enviar=not args.sem_envio,
+        entrega="outbox" if args.outbox else "direta",
+        artefatos=args.artefatos,
+        caminho_registro=args.registro,
+        pular_enviados=not args.sem_envio,
+    )
+
+    def ao_concluir(resultado):
+        if resultado.ja_enviado:
+            situacao = f"PULADO - {resultado.resposta}"
+        else:
+            situacao = "OK" if resultado.sucesso else f"ERRO {resultado.descricao_erro()}"
+        print(f"{time.strftime('%H:%M:%S')} {resultado.nome} - {situacao} ({sum(resultado.tempos.values()):.1f}s)",
+              flush=True)
+
+    monitor = Monitor(args.entrada, args.saida, config, workers=args.workers, mover=not args.manter,
+                      intervalo=args.intervalo, estabilidade=args.estabilidade,
+                      usar_avisos=not args.sem_avisos, ao_concluir=ao_concluir)
+
+    entregador = None
+    if config.enviar and config.entrega == "outbox":
+        outbox = obter_outbox(config.caminho_outbox)
+        entregador = Entregador(outbox, ClienteAPI(max_em_voo=config.envios_simultaneos),
+                                indice=obter_indice(config.caminho_indice)).iniciar()
+        obter_metricas().medidor("rpa_fila", lambda: outbox.contar().get("pendente", 0), fila="outbox")
+    gravador = GravadorMetricas(args.metricas).iniciar() if args.metricas else None
+
+    modo = "avisos do sistema de arquivos" if monitor.usar_avisos else f"varredura a cada {args.intervalo:g}s"
+    print(f"Acompanhando {args.entrada} ({modo}). Ctrl+C para sair.", flush=True)
+    try:
+        monitor.executar()
+    finally:
+        if entregador:
+            entregador.parar()
+            entregador.cliente.fechar()
+        if gravador:
+            gravador.parar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
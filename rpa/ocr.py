@@ -1,108 +1,349 @@
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import re
-from datetime import datetime, timedelta
 import os
-import json
-from PIL import Image, ImageEnhance, ImageFilter
+import shlex
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageEnhance, ImageFilter
 from rpa.constantes import pytesseract_cmd
-from rpa.utils import gerar_base64_pdf, obter_cod_estab, encontrar_cnpj_tomador
-from rpa.api import enviar_para_api
-from tkinter import messagebox
+from rpa.utils import obter_cod_estab, encontrar_cnpj_tomador
+from rpa.extracao import extrair_campos
+from rpa.registro import snapshot_atual
+
+try:
+    import pymupdf  # PyMuPDF, usado para ler a camada de texto de PDFs digitais
+except ImportError:
+    pymupdf = None
+
+try:
+    import tesserocr  # API C do Tesseract, mantém o motor carregado no processo
+except ImportError:
+    tesserocr = None
 
 pytesseract.pytesseract.tesseract_cmd = pytesseract_cmd
 
-def preprocess_image(img):
-    # Pré processamento de imagem para melhorar os acertos do OCR
+# Mínimo de caracteres alfanuméricos para considerar a camada de texto de uma página
+MIN_CARACTERES_CAMADA_TEXTO = 40
+# Páginas renderizadas por chamada ao Poppler
+PAGINAS_POR_RENDERIZACAO = 4
+
+@dataclass(frozen=True)
+class PerfilPreprocessamento:
+    """Parâmetros de renderização e binarização; cada layout de fornecedor pode ter o seu"""
+    nome: str
+    dpi: int = 400
+    nitidez: bool = True
+    limiar: int = 180
+    adaptativo: bool = False
+    raio_adaptativo: int = 15
+    deslocamento_adaptativo: int = 12
+
+# 400 dpi equivale ao antigo render padrão de 200 dpi ampliado 2x, agora com detalhe real
+PERFIS = {
+    "padrao": PerfilPreprocessamento("padrao"),
+    "rapido": PerfilPreprocessamento("rapido", dpi=300, nitidez=False),
+    "adaptativo": PerfilPreprocessamento("adaptativo", adaptativo=True),
+    # Primeira leitura do modo escalonado: barata, boa o bastante para a maioria das páginas limpas
+    "rascunho": PerfilPreprocessamento("rascunho", dpi=200, nitidez=False),
+}
+
+# Modo escalonado: perfis em ordem crescente de custo; uma página só sobe de degrau se a
+# leitura anterior ficou com confiança média abaixo do mínimo ou se ainda faltam campos
+ESCADA_PERFIS = ("rascunho", "padrao", "adaptativo")
+CONFIANCA_MINIMA = 70.0
+
+def registrar_perfil(perfil):
+    PERFIS[perfil.nome] = perfil
+
+def obter_perfil(nome=None):
+    return PERFIS.get(nome or "padrao", PERFIS["padrao"])
+
+@lru_cache(maxsize=None)
+def _tabela_limiar(limiar):
+    # Tabela de 256 posições aplicada em C pelo Pillow, sem chamar Python por pixel
+    return tuple(0 if x < limiar else 255 for x in range(256))
+
+@lru_cache(maxsize=None)
+def _tabela_adaptativa(deslocamento):
+    # Entrada é o quanto o pixel é mais escuro que a vizinhança
+    return tuple(0 if x > deslocamento else 255 for x in range(256))
+
+def preprocess_image(img, perfil=None):
+    # Pré processamento de imagem para melhorar os acertos do OCR.
+    # A página já chega renderizada no dpi do perfil, então não há ampliação aqui.
+    perfil = perfil or obter_perfil()
     img = img.convert("L")
-    img = img.filter(ImageFilter.SHARPEN)
-    img = img.point(lambda x: 0 if x < 180 else 255)
-    img = img.resize((img.width * 2, img.height * 2))
-    return img
+    if perfil.nitidez:
+        img = img.filter(ImageFilter.SHARPEN)
 
-def extrair_info(texto, path_pdf, qtde_paginas):
-    texto = re.sub(r'\s+', ' ', texto)
+    if perfil.adaptativo:
+        # Limiar local: tinta é o que fica mais escuro que a média da vizinhança,
+        # o que tolera fundos manchados ou com iluminação irregular
+        media = img.filter(ImageFilter.BoxBlur(perfil.raio_adaptativo))
+        diferenca = ImageChops.subtract(media, img)
+        return diferenca.point(_tabela_adaptativa(perfil.deslocamento_adaptativo), mode="1")
+
+    # Saída em 1 bit: menos memória e PNG bem menor na entrega ao Tesseract
+    return img.point(_tabela_limiar(perfil.limiar), mode="1")
 
-    cnpj_fornecedor = re.search(r'\bC?F?P?\/?C?N?P?J?[:\s-]*([\d./-]{18})', texto, re.IGNORECASE)
+def extrair_info_detalhado(texto, path_pdf, qtde_paginas, registro=None, silencioso=False):
+    """
+    Como o extrair_info, devolvendo também a Extracao com a confiança de cada campo.
+    `registro` é o Snapshot do cadastro de estabelecimentos (padrão: o atual);
+    `silencioso` desliga os prints de diagnóstico.
+    """
+    texto = re.sub(r'\s+', ' ', texto)
+    registro = registro or snapshot_atual()
 
-    contrato = re.search(r'Contrato\s+([A-Za-z0-9]+)', texto)
-    numero_nf = re.search(r'RPS Nº\s*(\d+)', texto)
-    data_emissao = re.search(r'Data da Compra:\s*(\d{2}/\d{2}/\d{4})', texto)
-    valor_total = re.search(r'VALOR TOTAL DO SERVIÇO\s*=\s*R\$\s*([\d,.]+)', texto)
+    extracao = extrair_campos(texto)
+    fornecedor = extracao.fornecedor
 
     # Encontra e valida o CNPJ tomador
-    cnpj_tomador_raw = encontrar_cnpj_tomador(texto)
-    print("CNPJ Tomador encontrado:", cnpj_tomador_raw)
+    cnpj_tomador_raw = encontrar_cnpj_tomador(texto, registro, silencioso)
+    if not silencioso:
+        print("CNPJ Tomador encontrado:", cnpj_tomador_raw)
     cnpj_tomador_num = cnpj_tomador_raw.replace(".", "").replace("/", "").replace("-", "")
 
-    file_base64 = gerar_base64_pdf(path_pdf)
-
     dt_vencimento = ""
-    if data_emissao:
-        try:
-            emissao_obj = datetime.strptime(data_emissao.group(1), "%d/%m/%Y")
-            venc_obj = emissao_obj + timedelta(days=30)
-            dt_vencimento = venc_obj.strftime("%d/%m/%Y")
-        except:
-            dt_vencimento = ""
-
-    valor_nf = 0.0
-    if valor_total:
-        valor_str = valor_total.group(1).replace(".", "").replace(",", ".")
-        try:
-            valor_nf = float(valor_str)
-        except:
-            valor_nf = 0.0
+    emissao_obj = extracao.valor("dtEmissao")
+    if emissao_obj:
+        venc_obj = emissao_obj + timedelta(days=fornecedor.prazo_vencimento_dias)
+        dt_vencimento = venc_obj.strftime("%d/%m/%Y")
 
-    quantidade = valor_nf / 100.0 if valor_nf > 0 else 0.0
+    valor_nf = extracao.valor("valorNf") or 0.0
 
-    return {
-        "cnpjFornecedor": (cnpj_fornecedor.group(1).replace(".", "").replace("/", "").replace("-", "") if cnpj_fornecedor else ""),
-        "nrContrato": "434",
-        "codEstab": obter_cod_estab(cnpj_tomador_num),
+    quantidade = valor_nf / fornecedor.valor_unitario if valor_nf > 0 else 0.0
+
+    dados = {
+        "cnpjFornecedor": extracao.valor("cnpjFornecedor") or "",
+        "nrContrato": fornecedor.nr_contrato,
+        "codEstab": obter_cod_estab(cnpj_tomador_num, registro),
         "codCentroCusto": "0",
         "codContaContabil": "0",
         "tipoDespesa": "0",
-        "nrNotaFiscal": str(numero_nf.group(1) if numero_nf else ""),
-        "dtEmissao": str(data_emissao.group(1) if data_emissao else ""),
+        "nrNotaFiscal": extracao.texto("nrNotaFiscal"),
+        "dtEmissao": extracao.texto("dtEmissao"),
         "dtVencimento": dt_vencimento,
         "qtdeTotalNf": f"{quantidade:.4f}",
         "valorNf": f"{valor_nf:.2f}",
-        "descricao": "Compra de benefícios - Auxilio Alimentação e Refeição",
+        "descricao": fornecedor.descricao,
         "lstProdServ": [
             {
-                "nomeProdServ": "Auxilio Alimentação e Refeição",
-                "valorProdServ": "100.00",
+                "nomeProdServ": fornecedor.nome_prod_serv,
+                "valorProdServ": f"{fornecedor.valor_unitario:.2f}",
                 "vlTotalProdServ": f"{valor_nf:.2f}",
                 "qtdeProdServ": f"{quantidade:.4f}",
                 "sequencia": 1.00
             }
         ],
-        "nrCOF0080Aprovado": "-",
-        "fileHashNF": file_base64
+        "nrCOF0080Aprovado": "-"
+        # fileHashNF é gerado em blocos direto do PDF na gravação e no envio (rpa.payload)
     }
+    return dados, extracao
+
+def extrair_info(texto, path_pdf, qtde_paginas):
+    return extrair_info_detalhado(texto, path_pdf, qtde_paginas)[0]
+
+def extrair_camada_texto(path_pdf):
+    """Retorna o texto embutido de cada página do PDF (lista vazia se não for possível ler)"""
+    if pymupdf is None:
+        return []
+    try:
+        with pymupdf.open(path_pdf) as doc:
+            return [pagina.get_text() for pagina in doc]
+    except Exception as e:
+        print(f"Erro ao ler camada de texto do PDF: {str(e)}")
+        return []
+
+def texto_utilizavel(texto):
+    # Páginas escaneadas não têm camada de texto ou trazem só alguns caracteres soltos
+    alfanumericos = sum(1 for c in texto if c.isalnum())
+    return alfanumericos >= MIN_CARACTERES_CAMADA_TEXTO and "\ufffd" not in texto
+
+def contar_paginas_pdf(path_pdf):
+    if pymupdf is not None:
+        try:
+            with pymupdf.open(path_pdf) as doc:
+                return doc.page_count
+        except Exception:
+            pass
+    return pdfinfo_from_path(path_pdf)["Pages"]
+
+def _faixas(paginas, tamanho):
+    """
+    Agrupa os números de página em faixas consecutivas (primeira, última) de até `tamanho`
+    páginas. A primeira faixa tem uma página só: com parar_cedo a nota costuma se resolver nela.
+    """
+    faixas = []
+    for n in paginas:
+        if faixas:
+            primeira, ultima = faixas[-1]
+            maximo = 1 if len(faixas) == 1 else tamanho
+            if n == ultima + 1 and ultima - primeira + 1 < maximo:
+                faixas[-1] = (primeira, n)
+                continue
+        faixas.append((n, n))
+    return faixas
+
+def iterar_paginas_pdf(path_pdf, paginas=None, dpi=200):
+    """
+    Renderiza as páginas em faixas pequenas (numeração a partir de 1), produzindo (número, imagem).
+    Cada convert_from_path roda o pdfinfo e abre o arquivo de novo no Poppler; com faixas de
+    PAGINAS_POR_RENDERIZACAO esse custo não se repete a cada página e a memória continua limitada.
+    """
+    if paginas is None:
+        paginas = range(1, contar_paginas_pdf(path_pdf) + 1)
+    for primeira, ultima in _faixas(paginas, PAGINAS_POR_RENDERIZACAO):
+        imagens = convert_from_path(path_pdf, dpi=dpi, first_page=primeira, last_page=ultima, grayscale=True)
+        for n in range(primeira, ultima + 1):
+            # Cada imagem sai da lista ao ser entregue, para ser liberada depois do OCR
+            yield n, imagens.pop(0)
+
+# --- Motores de OCR ---
+def _interpretar_config(config):
+    """Separa o --psm e as variáveis -c de uma string de configuração no formato do pytesseract"""
+    psm = 3
+    variaveis = {}
+    partes = shlex.split(config or "")
+    for i, parte in enumerate(partes):
+        if parte == "--psm" and i + 1 < len(partes):
+            psm = int(partes[i + 1])
+        elif parte == "-c" and i + 1 < len(partes) and "=" in partes[i + 1]:
+            nome, valor = partes[i + 1].split("=", 1)
+            variaveis[nome] = valor
+    return psm, variaveis
+
+def _pasta_tessdata():
+    # Usa os traineddata da mesma instalação apontada em constantes.pytesseract_cmd
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    pasta = os.path.join(os.path.dirname(pytesseract_cmd), "tessdata")
+    return pasta if os.path.isdir(pasta) else None
+
+
+class MotorPytesseract:
+    """Backend original: grava a imagem em arquivo temporário e executa o tesseract.exe a cada chamada"""
+    nome = "pytesseract"
+
+    def reconhecer(self, img, lang="por", config="--psm 6"):
+        return pytesseract.image_to_string(img, lang=lang, config=config)
+
+    def reconhecer_com_confianca(self, img, lang="por", config="--psm 6"):
+        # Uma execução só: o texto é remontado, linha a linha, das palavras do image_to_data
+        dados = pytesseract.image_to_data(img, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+        linhas = {}
+        confiancas = []
+        for i, palavra in enumerate(dados["text"]):
+            confianca = float(dados["conf"][i])
+            if confianca < 0 or not palavra.strip():
+                continue
+            linha = (dados["block_num"][i], dados["par_num"][i], dados["line_num"][i])
+            linhas.setdefault(linha, []).append(palavra)
+            confiancas.append(confianca)
+        texto = "\n".join(" ".join(palavras) for palavras in linhas.values())
+        return texto, sum(confiancas) / len(confiancas) if confiancas else 0.0
+
+    def fechar(self):
+        pass
+
+
+class MotorTesserocr:
+    """
+    Tesseract residente pela API C (tesserocr). O traineddata é carregado uma vez
+    por idioma e a imagem é passada em memória, sem arquivo temporário nem processo novo.
+    """
+    nome = "tesserocr"
+
+    def __init__(self):
+        self._apis = {}
+        self._padroes = {}
+
+    def _api(self, lang):
+        if lang not in self._apis:
+            caminho = _pasta_tessdata()
+            if caminho:
+                self._apis[lang] = tesserocr.PyTessBaseAPI(path=caminho, lang=lang)
+            else:
+                self._apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+        return self._apis[lang]
+
+    def reconhecer(self, img, lang="por", config="--psm 6"):
+        api = self._api(lang)
+        psm, variaveis = _interpretar_config(config)
+
+        # Variáveis persistem entre chamadas na API; volta ao padrão as que esta chamada não usa
+        for nome, padrao in self._padroes.items():
+            if nome not in variaveis:
+                api.SetVariable(nome, padrao)
+        for nome, valor in variaveis.items():
+            if nome not in self._padroes:
+                self._padroes[nome] = api.GetVariableAsString(nome) or ""
+            api.SetVariable(nome, valor)
+
+        api.SetPageSegMode(psm)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+    def reconhecer_com_confianca(self, img, lang="por", config="--psm 6"):
+        texto = self.reconhecer(img, lang=lang, config=config)
+        # Média das palavras do reconhecimento que acabou de rodar, sem ler a imagem de novo
+        return texto, float(self._api(lang).MeanTextConf())
+
+    def fechar(self):
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+MOTORES = {
+    "pytesseract": MotorPytesseract,
+    "tesserocr": MotorTesserocr,
+}
 
-def ler_nf_com_ocr(path_pdf, output_json):
-    imagens = convert_from_path(path_pdf)
-    texto = ""
-    for img in imagens:
-        img_proc = preprocess_image(img)
-        texto += pytesseract.image_to_string(img_proc, lang="por", config="--psm 6") + "\n"
+# A API do Tesseract não é thread-safe: cada thread (e cada processo do lote) tem os seus motores
+_motores = threading.local()
 
-    nome_base = os.path.basename(path_pdf).replace(".pdf", "")
-    with open(f"logs/ocr_texto_{nome_base}.txt", "w", encoding="utf-8") as f:
-        f.write(texto)
+def resolver_motor(nome="auto"):
+    """Nome do motor que `nome` usa nesta thread; `auto` prefere o tesserocr quando instalado"""
+    if nome == "auto":
+        return getattr(_motores, "_auto", None) or ("tesserocr" if tesserocr is not None else "pytesseract")
+    return nome
 
-    dados_nf = extrair_info(texto, path_pdf, len(imagens))
+def obter_motor(nome="auto"):
+    """Motor de OCR de longa duração da thread atual (ver resolver_motor)"""
+    motores = _motores.__dict__
+    nome = resolver_motor(nome)
+    if nome not in motores:
+        if nome == "tesserocr" and tesserocr is None:
+            raise RuntimeError("Motor tesserocr indisponível: pacote tesserocr não instalado")
+        motores[nome] = MOTORES[nome]()
+    return motores[nome]
 
-    os.makedirs(os.path.dirname(output_json), exist_ok=True)
+def _reconhecer(metodo, img, lang, config, motor):
+    try:
+        return getattr(obter_motor(motor), metodo)(img, lang=lang, config=config)
+    except RuntimeError as e:
+        # tesserocr sem traineddata ou com versão incompatível: no modo auto segue pelo pytesseract
+        if motor != "auto" or obter_motor(motor).nome == "pytesseract":
+            raise
+        print(f"Motor tesserocr falhou ({str(e)}), usando pytesseract")
+        _motores._auto = "pytesseract"
+        return getattr(obter_motor("pytesseract"), metodo)(img, lang=lang, config=config)
 
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(dados_nf, f, indent=4, ensure_ascii=False)
+def ocr_imagem(img, lang="por", config="--psm 6", motor="auto"):
+    return _reconhecer("reconhecer", img, lang, config, motor)
 
-    status, resposta = enviar_para_api(dados_nf)
+def aquecer(lang="por", motor="auto"):
+    """
+    Cria o motor da thread atual e carrega o traineddata de `lang` lendo uma imagem em
+    branco, para que a primeira nota não pague esse custo. Com o pytesseract o ganho é
+    o executável e o traineddata já no cache de disco do sistema.
+    """
+    ocr_imagem(Image.new("L", (64, 32), 255), lang=lang, motor=motor)
 
-    if status == 200:
-        messagebox.showinfo("Sucesso", f"Enviado com sucesso!\nJSON salvo em: {output_json}")
-    else:
-        messagebox.showwarning("Erro", f"Erro ({status}): {resposta}\nJSON salvo em: {output_json}")
+def ocr_imagem_com_confianca(img, lang="por", config="--psm 6", motor="auto"):
+    """(texto, confiança média das palavras, de 0 a 100)"""
+    return _reconhecer("reconhecer_com_confianca", img, lang, config, motor)
@@ -0,0 +1,272 @@
+"""
+Fila local (outbox) de envios para a API, em SQLite.
+
+O resultado da extração é gravado aqui e um entregador em segundo plano faz o
+envio, com novas tentativas e espera exponencial. Assim o OCR não fica parado
+quando a API está fora, e o que estiver na fila sobrevive ao fechamento do programa.
+Envios que falham de forma definitiva (4xx) ou esgotam as tentativas vão para
+a situação `morto` e podem ser reenfileirados.
+
+Uso: python -m rpa.outbox {status,entregar,reenfileirar}
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+from rpa.api import ClienteAPI
+from rpa.indice import CAMINHO_INDICE, ENFILEIRADA, obter_indice
+from rpa.metricas import contar
+
+CAMINHO_OUTBOX = os.path.join("dados", "outbox.db")
+
+PENDENTE = "pendente"
+ENVIADO = "enviado"
+MORTO = "morto"
+
+# Enquanto um entregador tenta um item, ninguém mais o pega; se o processo cair,
+# o item volta para a fila quando esse prazo vence
+PRAZO_RESERVA = 300
+
+# Status que não adianta repetir: o problema está no conteúdo da nota
+def _falha_definitiva(status):
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+class Outbox:
+    def __init__(self, caminho=CAMINHO_OUTBOX):
+        self.caminho = caminho
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._local = threading.local()
+        with self._conexao() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    caminho_pdf TEXT,
+                    output_json TEXT,
+                    payload TEXT NOT NULL,
+                    situacao TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    proxima_tentativa REAL NOT NULL,
+                    ultimo_status INTEGER,
+                    ultima_resposta TEXT,
+                    criado_em REAL NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS ix_outbox_fila ON outbox (situacao, proxima_tentativa)")
+            # Filas criadas antes do índice de envios não têm a coluna do hash
+            colunas = {linha["name"] for linha in con.execute("PRAGMA table_info(outbox)")}
+            if "hash_pdf" not in colunas:
+                con.execute("ALTER TABLE outbox ADD COLUMN hash_pdf TEXT")
+
+    def _conexao(self):
+        # Uma conexão por thread; WAL deixa a interface, o lote e o entregador usarem o arquivo juntos
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=30)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            self._local.con = con
+        return con
+
+    def enfileirar(self, dados, caminho_pdf="", output_json="", hash_pdf=""):
+        agora = time.time()
+        with self._conexao() as con:
+            cursor = con.execute(
+                "INSERT INTO outbox (caminho_pdf, output_json, hash_pdf, payload, proxima_tentativa, criado_em, "
+                "atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (caminho_pdf, output_json, hash_pdf, json.dumps(dados, ensure_ascii=False), agora, agora, agora),
+            )
+            return cursor.lastrowid
+
+    def reservar(self, limite=10):
+        """Pega até `limite` itens vencidos, reservando-os para este entregador"""
+        agora = time.time()
+        itens = []
+        with self._conexao() as con:
+            linhas = con.execute(
+                "SELECT * FROM outbox WHERE situacao = ? AND proxima_tentativa <= ? ORDER BY id LIMIT ?",
+                (PENDENTE, agora, limite),
+            ).fetchall()
+            for linha in linhas:
+                cursor = con.execute(
+                    "UPDATE outbox SET proxima_tentativa = ? WHERE id = ? AND proxima_tentativa <= ?",
+                    (agora + PRAZO_RESERVA, linha["id"], agora),
+                )
+                # Outro processo pode ter reservado o mesmo item entre o SELECT e o UPDATE
+                if cursor.rowcount:
+                    itens.append(dict(linha))
+        return itens
+
+    def _atualizar(self, id_item, situacao, status, resposta, tentativas, proxima_tentativa=None):
+        agora = time.time()
+        with self._conexao() as con:
+            con.execute(
+                "UPDATE outbox SET situacao = ?, ultimo_status = ?, ultima_resposta = ?, tentativas = ?, "
+                "proxima_tentativa = ?, atualizado_em = ? WHERE id = ?",
+                (situacao, status, resposta, tentativas, proxima_tentativa or agora, agora, id_item),
+            )
+
+    def marcar_enviado(self, item, status, resposta):
+        self._atualizar(item["id"], ENVIADO, status, resposta, item["tentativas"] + 1)
+
+    def marcar_morto(self, item, status, resposta):
+        self._atualizar(item["id"], MORTO, status, resposta, item["tentativas"] + 1)
+
+    def reagendar(self, item, status, resposta, atraso):
+        self._atualizar(item["id"], PENDENTE, status, resposta, item["tentativas"] + 1, time.time() + atraso)
+
+    def reenfileirar_mortos(self, indice=None):
+        """
+        Devolve os itens mortos à fila. O índice de envios volta a marcá-los como
+        enfileirados, para um novo lote não reenviar a mesma nota antes do entregador.
+        """
+        with self._conexao() as con:
+            linhas = con.execute(
+                "SELECT id, hash_pdf, payload, caminho_pdf, output_json FROM outbox WHERE situacao = ?", (MORTO,),
+            ).fetchall()
+            agora = time.time()
+            reenfileirados = []
+            for linha in linhas:
+                cursor = con.execute(
+                    "UPDATE outbox SET situacao = ?, tentativas = 0, proxima_tentativa = ?, atualizado_em = ? "
+                    "WHERE id = ? AND situacao = ?",
+                    (PENDENTE, agora, agora, linha["id"], MORTO),
+                )
+                if cursor.rowcount:
+                    reenfileirados.append(linha)
+
+        if indice is not None:
+            for linha in reenfileirados:
+                indice.registrar(linha["hash_pdf"], json.loads(linha["payload"]), ENFILEIRADA,
+                                 caminho_pdf=linha["caminho_pdf"], output_json=linha["output_json"])
+        return len(reenfileirados)
+
+    def contar(self):
+        """Quantidade de itens por situação"""
+        linhas = self._conexao().execute("SELECT situacao, COUNT(*) FROM outbox GROUP BY situacao").fetchall()
+        return {situacao: total for situacao, total in linhas}
+
+    def mortos(self, limite=20):
+        return [dict(l) for l in self._conexao().execute(
+            "SELECT id, caminho_pdf, ultimo_status, ultima_resposta FROM outbox WHERE situacao = ? ORDER BY id DESC LIMIT ?",
+            (MORTO, limite),
+        )]
+
+
+_outboxes = {}
+
+def obter_outbox(caminho=CAMINHO_OUTBOX):
+    """Uma instância por processo para cada arquivo de outbox"""
+    if caminho not in _outboxes:
+        _outboxes[caminho] = Outbox(caminho)
+    return _outboxes[caminho]
+
+
+class Entregador:
+    """Thread que esvazia a outbox: envia, reagenda com espera exponencial ou move para os mortos"""
+
+    def __init__(self, outbox, cliente=None, max_tentativas=8, atraso_base=2, atraso_max=600, intervalo=1.0,
+                 indice=None):
+        self.outbox = outbox
+        self.cliente = cliente or ClienteAPI()
+        # IndiceEnvios onde o desfecho (entregue ou morto) de cada nota é anotado
+        self.indice = indice
+        self.max_tentativas = max_tentativas
+        self.atraso_base = atraso_base
+        self.atraso_max = atraso_max
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _entregar(self, item):
+        # Uma tentativa por vez: as repetições ficam a cargo da outbox, sem segurar a thread
+        # O JSON gravado pelo pipeline é o corpo; o payload da fila valida os campos e serve
+        # de reserva (com o base64 gerado do PDF) se o arquivo tiver sido apagado
+        dados = json.loads(item["payload"])
+        status, resposta = self.cliente.enviar(
+            dados, max_tentativas=1, caminho_pdf=item["caminho_pdf"], arquivo_json=item["output_json"],
+        )
+
+        if status == 200 or _falha_definitiva(status) or item["tentativas"] + 1 >= self.max_tentativas:
+            if self.indice is not None:
+                self.indice.registrar_resposta(item["hash_pdf"], dados, status, resposta,
+                                               item["caminho_pdf"], item["output_json"])
+
+        if status == 200:
+            self.outbox.marcar_enviado(item, status, resposta)
+            contar("rpa_outbox_total", desfecho="enviado")
+        elif _falha_definitiva(status) or item["tentativas"] + 1 >= self.max_tentativas:
+            self.outbox.marcar_morto(item, status, resposta)
+            contar("rpa_outbox_total", desfecho="morto")
+        else:
+            atraso = min(self.atraso_max, self.atraso_base * 2 ** item["tentativas"])
+            self.outbox.reagendar(item, status, resposta, atraso)
+            contar("rpa_outbox_total", desfecho="reagendado")
+        return status
+
+    def entregar_vencidos(self):
+        """Uma passada pela fila; retorna quantos itens foram tentados"""
+        itens = self.outbox.reservar(limite=32)
+        envios = [self.cliente.agendar(self._entregar, item) for item in itens]
+        for envio in envios:
+            envio.result()
+        return len(itens)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                tentados = self.entregar_vencidos()
+            except Exception as e:
+                print(f"Erro no entregador da outbox: {str(e)}")
+                tentados = 0
+            if not tentados:
+                self._parar.wait(self.intervalo)
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._loop, name="entregador-outbox", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join()
+
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rpa.outbox", description="Administra a fila de envios")
+    parser.add_argument("comando", choices=["status", "entregar", "reenfileirar"])
+    parser.add_argument("--db", default=CAMINHO_OUTBOX)
+    parser.add_argument("--indice", default=CAMINHO_INDICE, help="Índice de envios atualizado nas entregas e ao reenfileirar")
+    args = parser.parse_args(argv)
+
+    outbox = Outbox(args.db)
+
+    if args.comando == "reenfileirar":
+        print(f"{outbox.reenfileirar_mortos(indice=obter_indice(args.indice))} itens voltaram para a fila.")
+    elif args.comando == "entregar":
+        # Entrega até não sobrar nada vencido; itens em espera ficam para a próxima execução
+        entregador = Entregador(outbox, indice=obter_indice(args.indice))
+        try:
+            while entregador.entregar_vencidos():
+                pass
+        finally:
+            entregador.cliente.fechar()
+
+    contagem = outbox.contar()
+    print(", ".join(f"{situacao}: {contagem.get(situacao, 0)}" for situacao in (PENDENTE, ENVIADO, MORTO)))
+    for item in outbox.mortos():
+        print(f"  [morto] #{item['id']} {item['caminho_pdf']} - ({item['ultimo_status']}) {item['ultima_resposta']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import os
+import json
+import base64
+
+CAMPO_ARQUIVO = "fileHashNF"
+
+# Múltiplo de 3: cada bloco vira base64 sem padding, então os pedaços podem ser concatenados
+BLOCO = 3 * 256 * 1024
+
+_MARCADOR = "__fileHashNF__"
+
+
+class CorpoPayload:
+    """
+    JSON da nota com o `fileHashNF` codificado em base64 aos poucos, direto do PDF.
+
+    Nunca monta a string base64 inteira: serve como corpo do requests (iterável com
+    tamanho conhecido, enviado com Content-Length) e para gravar o JSON em disco.
+    A saída é idêntica à do json.dump com os mesmos parâmetros.
+    """
+
+    def __init__(self, dados, caminho_pdf, indent=None):
+        self.caminho_pdf = caminho_pdf
+        modelo = dict(dados)
+        modelo[CAMPO_ARQUIVO] = _MARCADOR
+        texto = json.dumps(modelo, indent=indent, ensure_ascii=False)
+        antes, depois = texto.split(json.dumps(_MARCADOR), 1)
+        self._antes = (antes + '"').encode("utf-8")
+        self._depois = ('"' + depois).encode("utf-8")
+
+    def __len__(self):
+        tamanho_pdf = os.path.getsize(self.caminho_pdf)
+        return len(self._antes) + 4 * ((tamanho_pdf + 2) // 3) + len(self._depois)
+
+    def __iter__(self):
+        yield self._antes
+        with open(self.caminho_pdf, "rb") as pdf_file:
+            for bloco in iter(lambda: pdf_file.read(BLOCO), b""):
+                yield base64.b64encode(bloco)
+        yield self._depois
+
+    def gravar(self, destino):
+        # Grava em arquivo temporário e troca, para nunca deixar um JSON pela metade
+        temporario = f"{destino}.tmp"
+        with open(temporario, "wb") as f:
+            for pedaco in self:
+                f.write(pedaco)
+        os.replace(temporario, destino)
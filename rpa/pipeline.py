@@ -0,0 +1,571 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+from rpa.ocr import (
+    extrair_camada_texto, texto_utilizavel, contar_paginas_pdf, iterar_paginas_pdf,
+    obter_perfil, preprocess_image, ocr_imagem, ocr_imagem_com_confianca, extrair_info_detalhado,
+    resolver_motor, ESCADA_PERFIS, CONFIANCA_MINIMA
+)
+from rpa.api import CAMPOS_OBRIGATORIOS, cliente_padrao
+from rpa.cache import CacheOCR, obter_cache
+from rpa.payload import CorpoPayload
+from rpa.outbox import CAMINHO_OUTBOX, obter_outbox
+from rpa.registro import CAMINHO_REGISTRO, COD_ESTAB_PADRAO, snapshot_atual
+from rpa.log import registrar
+from rpa.metricas import coletar_documento
+from rpa.diagnostico import perfilar_documento
+from rpa.artefatos import CONTEUDO, DESLIGADO, PASTA_ARTEFATOS, obter_armazem, montar_registro
+from rpa.indice import CAMINHO_INDICE, ENFILEIRADA, ENVIANDO, FALHOU, obter_indice, descrever
+from rpa.templates import obter_template, recortar, montar_texto
+from rpa.utils import calcular_hash_pdf
+
+
+@dataclass
+class ConfigPipeline:
+    """Opções do processamento de uma nota; precisa ser serializável para os processos de lote"""
+    lang: str = "por"
+    config_tesseract: str = "--psm 6"
+    enviar: bool = True
+    usar_camada_texto: bool = True
+    perfil: str = "padrao"
+    template: str | None = None
+    motor_ocr: str = "auto"
+    envios_simultaneos: int = 4
+    # "direta" envia na hora; "outbox" grava na fila local e o Entregador envia depois
+    entrega: str = "direta"
+    caminho_outbox: str = CAMINHO_OUTBOX
+    pasta_cache: str | None = "cache/ocr"
+    limite_cache_mb: int = 500
+    # Textos do OCR: "desligado", "conteudo" (um .json.gz por hash) ou "lote" (um zip por lote)
+    artefatos: str = CONTEUDO
+    pasta_artefatos: str = PASTA_ARTEFATOS
+    caminho_registro: str = CAMINHO_REGISTRO
+    # Índice dos envios; com pular_enviados, PDFs e notas já enviados não são reprocessados
+    caminho_indice: str | None = CAMINHO_INDICE
+    pular_enviados: bool = True
+    # Modo de diagnóstico: com uma pasta, cada nota roda sob o cProfile e grava o .prof nela
+    pasta_perfis: str | None = None
+    # OCR escalonado: primeira leitura com o perfil mais barato de ESCADA_PERFIS (no lugar de
+    # `perfil`) e novas leituras, com os seguintes, só das páginas e regiões que falharem
+    escalonar: bool = False
+    confianca_minima: float = CONFIANCA_MINIMA
+    # Extração incremental: para de rasterizar e ler páginas quando os campos obrigatórios e o
+    # estabelecimento já foram resolvidos (as páginas seguintes costumam ser anexos)
+    parar_cedo: bool = False
+
+    def assinatura_ocr(self):
+        """Tudo o que muda o texto do OCR; faz parte da chave do cache"""
+        return {
+            "lang": self.lang,
+            "config_tesseract": self.config_tesseract,
+            # O texto muda de um motor para o outro; "auto" entra como o motor que ele escolhe
+            "motor_ocr": resolver_motor(self.motor_ocr),
+            "usar_camada_texto": self.usar_camada_texto,
+            # O escalonamento sem template ignora o perfil; com template, ele lê as regiões primeiro
+            "perfil": asdict(obter_perfil(self.perfil)) if self.template or not self.escalonar else None,
+            "template": asdict(obter_template(self.template)) if self.template else None,
+            "escalonamento": {
+                "perfis": [asdict(obter_perfil(nome)) for nome in ESCADA_PERFIS],
+                "confianca_minima": self.confianca_minima,
+            } if self.escalonar else None,
+            "parar_cedo": self.parar_cedo,
+        }
+
+
+@dataclass
+class ResultadoNF:
+    """Resultado estruturado do processamento de um PDF, sem dependência da interface"""
+    caminho_pdf: str
+    output_json: str = ""
+    hash_pdf: str = ""
+    dados: dict = field(default_factory=dict)
+    paginas: int = 0
+    paginas_texto: int = 0
+    cache_ocr: bool = False
+    paginas_fallback: int = 0
+    # Com template: páginas sem região declarada, que ficam sem texto e não passam pelo OCR
+    paginas_sem_regioes: int = 0
+    # Modo escalonado: confiança média do OCR de cada página (None nas de camada de texto)
+    # e quantas releituras de página ou região foram feitas com um perfil mais caro
+    confianca_ocr: list = field(default_factory=list)
+    releituras: int = 0
+    # Páginas não lidas porque os campos já tinham sido encontrados (parar_cedo)
+    paginas_puladas: list = field(default_factory=list)
+    # Largura e altura de cada página rasterizada, uma vez por página (no modo escalonado,
+    # a da leitura que ficou)
+    dimensoes: list = field(default_factory=list)
+    confianca: dict = field(default_factory=dict)
+    textos: list = field(default_factory=list)
+    ja_enviado: bool = False
+    # Contagens do documento (busca do CNPJ etc.), somadas às métricas pelo processo principal
+    contagens: dict = field(default_factory=dict)
+    status: int | None = None
+    resposta: str = ""
+    erro: str = ""
+    estagio_erro: str = ""
+    tempos: dict = field(default_factory=dict)
+    arquivo_perfil: str = ""
+
+    @property
+    def nome(self):
+        return os.path.basename(self.caminho_pdf)
+
+    @property
+    def sucesso(self):
+        # Sem envio para a API, basta o fluxo ter terminado sem exceção
+        if self.erro:
+            return False
+        return self.status is None or self.status == 200
+
+    def descricao_erro(self):
+        """Texto curto para relatórios de lote"""
+        if self.erro:
+            return f"{self.estagio_erro}: {self.erro}"
+        if not self.sucesso:
+            return f"Erro ({self.status}): {self.resposta}"
+        return ""
+
+
+@contextmanager
+def _estagio(resultado, nome):
+    # Mede o tempo do estágio e marca onde o fluxo falhou
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        resultado.estagio_erro = nome
+        raise
+    finally:
+        resultado.tempos[nome] = resultado.tempos.get(nome, 0.0) + time.perf_counter() - inicio
+
+
+# --- Estágios ---
+def ler_camada_texto(path_pdf, config):
+    """Texto embutido por página; None nas páginas que precisam de OCR"""
+    if not config.usar_camada_texto:
+        return []
+    return [t if texto_utilizavel(t) else None for t in extrair_camada_texto(path_pdf)]
+
+def rasterizar(path_pdf, paginas, config):
+    """Gerador de (número, imagem), uma página por vez"""
+    return iterar_paginas_pdf(path_pdf, paginas, dpi=obter_perfil(config.perfil).dpi)
+
+def pre_processar(img, config):
+    return preprocess_image(img, obter_perfil(config.perfil))
+
+def executar_ocr(img, config):
+    return ocr_imagem(img, lang=config.lang, config=config.config_tesseract, motor=config.motor_ocr)
+
+def executar_ocr_com_confianca(img, config):
+    return ocr_imagem_com_confianca(img, lang=config.lang, config=config.config_tesseract, motor=config.motor_ocr)
+
+def executar_ocr_regioes(img, regioes, config, perfil=None):
+    """Lê só os recortes do template; cada campo com a sua configuração do Tesseract"""
+    perfil = perfil or obter_perfil(config.perfil)
+    valores = {}
+    for regiao in regioes:
+        recorte = preprocess_image(recortar(img, regiao.caixa), perfil)
+        valores[regiao.campo] = ocr_imagem(recorte, lang=config.lang, config=regiao.config(),
+                                           motor=config.motor_ocr).strip()
+    return valores
+
+def extrair(texto, path_pdf, qtde_paginas, config, silencioso=False):
+    """Retorna (dados, Extracao); a Extracao traz o fornecedor e a confiança por campo"""
+    return extrair_info_detalhado(texto, path_pdf, qtde_paginas, snapshot_atual(config.caminho_registro),
+                                  silencioso=silencioso)
+
+def campos_faltando(dados, extracao):
+    """Campos obrigatórios que a extração não achou, mais o codEstab quando o tomador não foi identificado"""
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not extracao.texto(campo)]
+    if dados.get("codEstab") == COD_ESTAB_PADRAO:
+        faltando.append("codEstab")
+    return faltando
+
+def guardar_artefato(resultado, config, armazem=None):
+    """Entrega o texto do OCR ao armazém de artefatos; a gravação acontece em segundo plano"""
+    armazem = armazem or obter_armazem(config.artefatos, config.pasta_artefatos)
+    if armazem and resultado.textos:
+        armazem.guardar(montar_registro(resultado.hash_pdf, resultado.caminho_pdf, resultado.textos,
+                                        config.assinatura_ocr()))
+
+def persistir(dados, path_pdf, output_json, config):
+    """Grava o JSON final"""
+    pasta_saida = os.path.dirname(output_json)
+    if pasta_saida:
+        os.makedirs(pasta_saida, exist_ok=True)
+
+    # O base64 do PDF é escrito em blocos, sem passar inteiro pela memória
+    CorpoPayload(dados, path_pdf, indent=4).gravar(output_json)
+
+def enviar(resultado, config, cliente=None):
+    # O corpo é o próprio JSON gravado no estágio anterior, lido do disco durante o envio
+    return (cliente or cliente_padrao()).enviar(
+        resultado.dados, caminho_pdf=resultado.caminho_pdf, arquivo_json=resultado.output_json
+    )
+
+def enfileirar(resultado, config):
+    id_item = obter_outbox(config.caminho_outbox).enfileirar(
+        resultado.dados, resultado.caminho_pdf, resultado.output_json, resultado.hash_pdf
+    )
+    return f"Na fila de envio (#{id_item})"
+
+def registrar_envio(resultado, config):
+    """Anota no índice o desfecho do envio (ou a entrada na fila) da nota"""
+    if not config.caminho_indice:
+        return
+    indice = obter_indice(config.caminho_indice)
+    if config.entrega == "outbox":
+        indice.registrar(resultado.hash_pdf, resultado.dados, ENFILEIRADA, None, resultado.resposta,
+                         resultado.caminho_pdf, resultado.output_json)
+    else:
+        indice.registrar_resposta(resultado.hash_pdf, resultado.dados, resultado.status, resultado.resposta,
+                                  resultado.caminho_pdf, resultado.output_json)
+
+def consultar_envio_anterior(resultado, config):
+    """Envio anterior do mesmo PDF (pelo hash) ou, com os dados já extraídos, da mesma nota"""
+    if not (config.caminho_indice and config.pular_enviados):
+        return None
+    indice = obter_indice(config.caminho_indice)
+    anterior = indice.consultar(resultado.hash_pdf)
+    if anterior or not resultado.dados:
+        return anterior
+    anterior = indice.consultar_nota(resultado.dados.get("cnpjFornecedor"), resultado.dados.get("nrNotaFiscal"))
+    # O próprio PDF reenviado à força não conta como duplicata de si mesmo
+    if anterior and anterior["hash_pdf"] != resultado.hash_pdf:
+        return anterior
+    return None
+
+# Envios reservados por este processo e ainda sem desfecho, pelo hash do PDF e pela nota:
+# {chave: (resultado, evento)}. Uma cópia da mesma nota espera o evento do primeiro envio
+_envios_em_andamento = {}
+_trava_envios = threading.RLock()
+
+def _chaves_envio(resultado):
+    chaves = [resultado.hash_pdf]
+    nota = (resultado.dados.get("cnpjFornecedor"), resultado.dados.get("nrNotaFiscal"))
+    if all(nota):
+        chaves.append(nota)
+    return chaves
+
+def _envio_em_andamento(resultado):
+    """Evento do envio de outra cópia desta nota ainda em andamento neste processo, ou None"""
+    with _trava_envios:
+        for chave in _chaves_envio(resultado):
+            dono, evento = _envios_em_andamento.get(chave, (None, None))
+            if evento and dono is not resultado:
+                return evento
+    return None
+
+def _liberar_envio(resultado):
+    with _trava_envios:
+        for chave in _chaves_envio(resultado):
+            dono, evento = _envios_em_andamento.get(chave, (None, None))
+            if dono is resultado:
+                del _envios_em_andamento[chave]
+                evento.set()
+
+def reservar_envio(resultado, config):
+    """
+    Última conferência do índice, no processo que envia, logo antes de agendar o envio.
+    Os processos de OCR consultam o índice antes de as notas anteriores do lote serem
+    enviadas; sem esta conferência, duas cópias do mesmo PDF (ou da mesma nota) no mesmo
+    lote seriam enviadas. Marca a nota como em envio e retorna True se ela deve seguir.
+
+    Se a outra cópia ainda está sendo enviada por este processo, também retorna True:
+    o enviar_resultado desta espera o desfecho daquela e confere de novo, para que a
+    cópia só conte como já enviada se o primeiro envio tiver sido entregue.
+    """
+    if not config.caminho_indice:
+        return True
+    with _estagio(resultado, "indice"), _trava_envios:
+        anterior = consultar_envio_anterior(resultado, config)
+        if anterior and anterior["situacao"] == ENVIANDO and _envio_em_andamento(resultado):
+            return True
+        if not anterior:
+            obter_indice(config.caminho_indice).registrar(resultado.hash_pdf, resultado.dados, ENVIANDO,
+                                                          caminho_pdf=resultado.caminho_pdf,
+                                                          output_json=resultado.output_json)
+            evento = threading.Event()
+            for chave in _chaves_envio(resultado):
+                _envios_em_andamento[chave] = (resultado, evento)
+    if anterior:
+        resultado.ja_enviado = True
+        resultado.resposta = descrever(anterior)
+        return False
+    return True
+
+def enviar_resultado(resultado, config, cliente=None):
+    """
+    Estágio de envio sobre um resultado já extraído; o lote o executa fora dos processos de OCR.
+    Como o processar_nf, não levanta exceção: a falha fica em `erro` com estagio_erro "enviar".
+    """
+    if resultado.ja_enviado:
+        return resultado
+    # Cópia de uma nota que este processo ainda está enviando: espera o desfecho e confere de
+    # novo; se o primeiro envio falhou, esta cópia é reservada e enviada
+    evento = _envio_em_andamento(resultado)
+    while evento:
+        evento.wait()
+        if not reservar_envio(resultado, config):
+            return resultado
+        evento = _envio_em_andamento(resultado)
+    try:
+        with _estagio(resultado, "enviar"):
+            if config.entrega == "outbox":
+                # Sem status: a resposta da API chega depois, pelo Entregador
+                resultado.resposta = enfileirar(resultado, config)
+            else:
+                resultado.status, resultado.resposta = enviar(resultado, config, cliente)
+            registrar_envio(resultado, config)
+    except Exception as e:
+        # Um envio com erro (índice SQLite, fila local) não derruba o lote inteiro
+        resultado.erro = str(e)
+        if config.caminho_indice and resultado.status is None:
+            # A requisição não chegou a ter resposta: libera a marca de reservar_envio para
+            # que a nota possa ser enviada de novo. Com resposta, a situação fica em dúvida
+            # e a nota continua bloqueada, sem risco de duplicata
+            try:
+                obter_indice(config.caminho_indice).registrar(resultado.hash_pdf, resultado.dados, FALHOU,
+                                                              resposta=resultado.erro,
+                                                              caminho_pdf=resultado.caminho_pdf,
+                                                              output_json=resultado.output_json)
+            except Exception as erro_indice:
+                print(f"Não foi possível registrar a falha de envio de {resultado.nome}: {erro_indice}")
+    finally:
+        _liberar_envio(resultado)
+    return resultado
+
+
+def _pendencias(textos, path_pdf, resultado, config):
+    """Campos ainda faltando no texto lido até aqui (páginas não lidas contam como vazias)"""
+    # Extração de avaliação: sem os prints de diagnóstico e com as contagens descartadas,
+    # que valem só para a extração final da nota
+    with _estagio(resultado, "avaliar"), coletar_documento({}):
+        texto = "".join((t or "") + "\n" for t in textos)
+        return campos_faltando(*extrair(texto, path_pdf, len(textos), config, silencioso=True))
+
+def _resolvido(textos, path_pdf, resultado, config):
+    # Só avalia com algum texto já lido; no início de um PDF escaneado não há o que extrair
+    return config.parar_cedo and any(textos) and not _pendencias(textos, path_pdf, resultado, config)
+
+def _marcar_puladas(textos, pendentes, resultado):
+    resultado.paginas_puladas = [n for n in pendentes if textos[n - 1] is None]
+    for n in resultado.paginas_puladas:
+        textos[n - 1] = ""
+
+
+def _ler_escalonado(path_pdf, pendentes, textos, resultado, config):
+    """
+    OCR em degraus: todas as páginas pendentes passam pelo primeiro perfil de ESCADA_PERFIS.
+    Sobem para o próximo as de confiança abaixo do mínimo ou, se a extração ainda não achar
+    os campos obrigatórios, todas; cada página fica com a leitura de maior confiança.
+    """
+    confiancas = {}
+    dimensoes = {}
+    for degrau, nome_perfil in enumerate(ESCADA_PERFIS):
+        if degrau:
+            faltando = _pendencias(textos, path_pdf, resultado, config)
+            baixas = [n for n in sorted(confiancas) if confiancas[n] < config.confianca_minima]
+            # Com parar_cedo, campos resolvidos bastam: páginas de baixa confiança não são relidas
+            if not faltando and (not baixas or config.parar_cedo):
+                break
+            pendentes = baixas or sorted(confiancas)
+            if not pendentes:
+                break
+            resultado.releituras += len(pendentes)
+
+        perfil = obter_perfil(nome_perfil)
+        paginas = iterar_paginas_pdf(path_pdf, pendentes, dpi=perfil.dpi)
+        while True:
+            if not degrau and _resolvido(textos, path_pdf, resultado, config):
+                break
+            with _estagio(resultado, "rasterizar"):
+                n, img = next(paginas, (None, None))
+            if n is None:
+                break
+            tamanho = img.size
+            with _estagio(resultado, "pre_processar"):
+                img = preprocess_image(img, perfil)
+            with _estagio(resultado, "ocr"):
+                texto, confianca = executar_ocr_com_confianca(img, config)
+            del img
+            if n not in confiancas or confianca > confiancas[n]:
+                textos[n - 1], confiancas[n], dimensoes[n] = texto, confianca, tamanho
+        if not degrau:
+            _marcar_puladas(textos, pendentes, resultado)
+
+    resultado.confianca_ocr = [round(confiancas[n], 1) if n in confiancas else None
+                               for n in range(1, len(textos) + 1)]
+    resultado.dimensoes = [dimensoes[n] for n in sorted(dimensoes)]
+    return textos
+
+
+def _degraus_acima(nome_perfil):
+    """Perfis da escada depois de `nome_perfil`; a escada inteira se ele não fizer parte dela"""
+    if nome_perfil in ESCADA_PERFIS:
+        return ESCADA_PERFIS[ESCADA_PERFIS.index(nome_perfil) + 1:]
+    return ESCADA_PERFIS
+
+def _reler_regioes(img, regioes, valores, resultado, config):
+    # Modo escalonado com template: regiões vazias são lidas de novo com os perfis da escada
+    # acima do já usado (mesma imagem, outro pré-processamento) antes de recorrer à página inteira
+    for nome_perfil in _degraus_acima(config.perfil):
+        vazias = [r for r in regioes if not valores.get(r.campo)]
+        if not vazias:
+            break
+        resultado.releituras += len(vazias)
+        valores.update(executar_ocr_regioes(img, vazias, config, obter_perfil(nome_perfil)))
+    return valores
+
+
+def ler_paginas(path_pdf, resultado, config):
+    """
+    Texto de cada página: camada embutida quando utilizável, OCR nas demais. Com
+    parar_cedo, as páginas depois da que resolve os campos ficam com texto vazio.
+    """
+    with _estagio(resultado, "camada_texto"):
+        textos = ler_camada_texto(path_pdf, config)
+
+    if not textos:
+        # Sem camada de texto (ou PDF ilegível pelo PyMuPDF): todas as páginas vão para o OCR
+        with _estagio(resultado, "rasterizar"):
+            textos = [None] * contar_paginas_pdf(path_pdf)
+
+    # PDFs digitais dispensam o OCR; só as páginas sem texto utilizável são rasterizadas
+    pendentes = [n + 1 for n, t in enumerate(textos) if t is None]
+    resultado.paginas_texto = len(textos) - len(pendentes)
+
+    template = obter_template(config.template)
+    if template:
+        # Com template, páginas sem nenhuma região declarada nem são renderizadas
+        com_regioes = set(template.paginas())
+        for n in pendentes:
+            if n not in com_regioes:
+                textos[n - 1] = ""
+        resultado.paginas_sem_regioes = sum(1 for n in pendentes if n not in com_regioes)
+        pendentes = [n for n in pendentes if n in com_regioes]
+    elif config.escalonar:
+        return _ler_escalonado(path_pdf, pendentes, textos, resultado, config)
+
+    # Renderiza, pré-processa e lê uma página por vez, liberando a imagem antes da próxima
+    paginas = rasterizar(path_pdf, pendentes, config)
+    while True:
+        if _resolvido(textos, path_pdf, resultado, config):
+            break
+        with _estagio(resultado, "rasterizar"):
+            n, img = next(paginas, (None, None))
+        if n is None:
+            break
+        resultado.dimensoes.append(img.size)
+
+        texto = ""
+        if template:
+            with _estagio(resultado, "ocr"):
+                valores = executar_ocr_regioes(img, template.regioes_da_pagina(n), config)
+                if config.escalonar and not all(valores.values()):
+                    _reler_regioes(img, template.regioes_da_pagina(n), valores, resultado, config)
+            texto = montar_texto(valores)
+            if all(valores.values()):
+                textos[n - 1] = texto
+                continue
+            # Alguma região veio vazia: completa com o OCR da página inteira
+            resultado.paginas_fallback += 1
+
+        with _estagio(resultado, "pre_processar"):
+            img = pre_processar(img, config)
+
+        with _estagio(resultado, "ocr"):
+            textos[n - 1] = "\n".join(filter(None, [texto, executar_ocr(img, config)]))
+        del img
+
+    _marcar_puladas(textos, pendentes, resultado)
+    return textos
+
+
+def processar_nf(path_pdf, output_json, config=None):
+    """
+    Executa o fluxo completo de uma nota: rasterização, pré-processamento,
+    OCR, extração, gravação do JSON e envio para a API.
+
+    Nunca levanta exceção: falhas ficam registradas em `erro` e `estagio_erro`.
+    """
+    config = config or ConfigPipeline()
+    if config.pasta_perfis:
+        return perfilar_documento(_processar_nf, path_pdf, output_json, config)
+    return _processar_nf(path_pdf, output_json, config)
+
+
+def _processar_nf(path_pdf, output_json, config):
+    resultado = ResultadoNF(caminho_pdf=path_pdf, output_json=output_json)
+
+    try:
+        if config.caminho_indice:
+            # PDF já entregue: nem renderiza, a menos que o reenvio seja forçado
+            with _estagio(resultado, "indice"):
+                resultado.hash_pdf = calcular_hash_pdf(path_pdf)
+                anterior = consultar_envio_anterior(resultado, config)
+            if anterior:
+                resultado.ja_enviado = True
+                resultado.resposta = descrever(anterior)
+                return resultado
+
+        textos = cache = None
+        if config.pasta_cache:
+            with _estagio(resultado, "cache"):
+                cache = obter_cache(config.pasta_cache, config.limite_cache_mb)
+                resultado.hash_pdf = resultado.hash_pdf or calcular_hash_pdf(path_pdf)
+                chave_cache = CacheOCR.chave(resultado.hash_pdf, config.assinatura_ocr())
+                guardado = cache.obter(chave_cache)
+            resultado.cache_ocr = guardado is not None
+            if guardado:
+                textos, resultado.paginas_puladas = guardado
+
+        # Reprocessamentos do mesmo PDF com as mesmas configurações pulam renderização e OCR
+        if textos is None:
+            textos = ler_paginas(path_pdf, resultado, config)
+            if cache:
+                with _estagio(resultado, "cache"):
+                    cache.guardar(chave_cache, textos, resultado.paginas_puladas)
+        resultado.textos = textos
+        resultado.paginas = len(textos)
+
+        if config.artefatos != DESLIGADO:
+            # Gravado antes da extração: se ela falhar, o texto fica disponível para o replay
+            with _estagio(resultado, "artefatos"):
+                resultado.hash_pdf = resultado.hash_pdf or calcular_hash_pdf(path_pdf)
+                guardar_artefato(resultado, config)
+
+        texto = "".join(t + "\n" for t in textos)
+
+        with _estagio(resultado, "extrair"), coletar_documento(resultado.contagens):
+            resultado.dados, extracao = extrair(texto, path_pdf, resultado.paginas, config)
+            resultado.confianca = extracao.confiancas()
+
+        if config.caminho_indice:
+            # Mesma nota em outro PDF (digitalizada de novo, por exemplo): gera o JSON mas não reenvia
+            with _estagio(resultado, "indice"):
+                anterior = consultar_envio_anterior(resultado, config)
+            if anterior:
+                resultado.ja_enviado = True
+                resultado.resposta = descrever(anterior)
+
+        with _estagio(resultado, "persistir"):
+            persistir(resultado.dados, path_pdf, output_json, config)
+
+        if config.enviar:
+            enviar_resultado(resultado, config)
+
+    except Exception as e:
+        resultado.erro = str(e)
+
+    # Um evento por nota; nos processos do lote ele segue pela fila para o processo principal
+    registrar("nf_processada", logging.WARNING if resultado.erro else logging.INFO,
+              arquivo=resultado.nome, hash_pdf=resultado.hash_pdf, paginas=resultado.paginas,
+              cache_ocr=resultado.cache_ocr, paginas_puladas=resultado.paginas_puladas, ja_enviado=resultado.ja_enviado, status=resultado.status,
+              erro=resultado.erro, estagio_erro=resultado.estagio_erro,
+              tempos={k: round(v, 4) for k, v in resultado.tempos.items()})
+    return resultado
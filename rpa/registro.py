@@ -0,0 +1,219 @@
+"""
+Cadastro dos estabelecimentos (CNPJ do tomador -> codEstab).
+
+O cadastro vem de um arquivo local: CSV (`cnpj;cod_estab;...`, separador `;` ou
+`,`) ou SQLite (tabela `estabelecimentos` com as colunas `cnpj` e `cod_estab`).
+Colunas a mais viram atributos do estabelecimento. Sem arquivo, vale o
+`mapa_estab` de constantes.py.
+
+O arquivo é lido na primeira consulta. Cada leitura gera um Snapshot imutável,
+já com os índices montados, que é compartilhado pelas threads do processo. Quando
+o arquivo muda, a próxima consulta monta um novo Snapshot e troca a referência,
+sem reiniciar o programa; quem já estava com o anterior termina a nota com ele.
+
+Uso: python -m rpa.registro {status,exportar} [--arquivo dados/estabelecimentos.csv]
+"""
+import os
+import sys
+import csv
+import time
+import sqlite3
+import argparse
+import threading
+from types import MappingProxyType
+from dataclasses import dataclass, field
+
+from rpa.constantes import mapa_estab
+from rpa.cnpj import IndiceCNPJ
+
+CAMINHO_REGISTRO = os.path.join("dados", "estabelecimentos.csv")
+COD_ESTAB_PADRAO = "999"
+
+# Intervalo mínimo entre duas conferências da data de modificação do arquivo
+INTERVALO_VERIFICACAO = 2.0
+
+
+def _versao(caminho):
+    # Data de modificação em ns e tamanho: pega também duas gravações no mesmo segundo
+    info = os.stat(caminho)
+    return (info.st_mtime_ns, info.st_size)
+
+
+def normalizar_cnpj(cnpj):
+    digitos = "".join(c for c in str(cnpj) if c.isdigit())
+    return digitos.zfill(14) if digitos else ""
+
+
+@dataclass(frozen=True)
+class Estabelecimento:
+    cnpj: str
+    cod_estab: str
+    atributos: dict = field(default_factory=dict)
+
+
+class Snapshot:
+    """Cadastro imutável com os índices por CNPJ, por código e de busca aproximada"""
+
+    def __init__(self, estabelecimentos, origem="constantes", versao=None):
+        por_cnpj = {}
+        por_codigo = {}
+        for estab in estabelecimentos:
+            por_cnpj[estab.cnpj] = estab
+            por_codigo.setdefault(estab.cod_estab, []).append(estab)
+        self.por_cnpj = MappingProxyType(por_cnpj)
+        self.por_codigo = MappingProxyType({cod: tuple(lista) for cod, lista in por_codigo.items()})
+        self.indice = IndiceCNPJ(por_cnpj)
+        self.origem = origem
+        self.versao = versao
+
+    def __len__(self):
+        return len(self.por_cnpj)
+
+    def __contains__(self, cnpj):
+        return cnpj in self.por_cnpj
+
+    def cod_estab(self, cnpj, padrao=COD_ESTAB_PADRAO):
+        estab = self.por_cnpj.get(cnpj)
+        return estab.cod_estab if estab else padrao
+
+
+def snapshot_de_mapa(mapa, origem="constantes"):
+    return Snapshot([Estabelecimento(normalizar_cnpj(c), str(cod)) for c, cod in mapa.items()], origem)
+
+
+def _estabelecimento(linha):
+    # Nomes de coluna sem diferença de maiúsculas; o resto da linha vira atributo
+    linha = {str(k).strip().lower(): v for k, v in linha.items() if k is not None}
+    cnpj = normalizar_cnpj(linha.pop("cnpj", ""))
+    cod = str(linha.pop("cod_estab", "") or "").strip()
+    if not cnpj or not cod:
+        return None
+    return Estabelecimento(cnpj, cod, {k: v for k, v in linha.items() if v not in (None, "")})
+
+
+def ler_csv(caminho):
+    with open(caminho, "r", encoding="utf-8-sig", newline="") as f:
+        cabecalho = f.readline()
+        f.seek(0)
+        leitor = csv.DictReader(f, delimiter=";" if ";" in cabecalho else ",")
+        return [e for e in map(_estabelecimento, leitor) if e]
+
+
+def ler_sqlite(caminho):
+    # Somente leitura: o cadastro é mantido por outro sistema
+    con = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+    try:
+        con.row_factory = sqlite3.Row
+        return [e for e in (_estabelecimento(dict(l)) for l in con.execute("SELECT * FROM estabelecimentos")) if e]
+    finally:
+        con.close()
+
+
+def carregar_snapshot(caminho):
+    versao = _versao(caminho)
+    if caminho.lower().endswith((".db", ".sqlite", ".sqlite3")):
+        estabelecimentos = ler_sqlite(caminho)
+    else:
+        estabelecimentos = ler_csv(caminho)
+    return Snapshot(estabelecimentos, origem=caminho, versao=versao)
+
+
+class Registro:
+    """Dono do Snapshot atual de um arquivo de cadastro; recarrega quando o arquivo muda"""
+
+    def __init__(self, caminho=CAMINHO_REGISTRO, intervalo=INTERVALO_VERIFICACAO):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._snapshot = None
+        self._verificado_em = 0.0
+        self._lock = threading.Lock()
+
+    def _versao_arquivo(self):
+        try:
+            return _versao(self.caminho)
+        except OSError:
+            return None
+
+    def snapshot(self):
+        """Snapshot atual; confere o arquivo no máximo a cada `intervalo` segundos"""
+        atual = self._snapshot
+        if atual is not None and time.monotonic() - self._verificado_em < self.intervalo:
+            return atual
+
+        with self._lock:
+            # Outra thread pode ter recarregado enquanto esta esperava
+            if self._snapshot is not atual and self._snapshot is not None:
+                return self._snapshot
+            self._verificado_em = time.monotonic()
+            versao = self._versao_arquivo()
+
+            if versao is None:
+                if atual is None or atual.origem != "constantes":
+                    self._snapshot = snapshot_de_mapa(mapa_estab)
+            elif atual is None or atual.versao != versao:
+                try:
+                    self._snapshot = carregar_snapshot(self.caminho)
+                    if atual is not None:
+                        print(f"Cadastro de estabelecimentos recarregado: {len(self._snapshot)} itens")
+                except Exception as e:
+                    # Arquivo pela metade ou inválido: segue com o cadastro anterior
+                    print(f"Erro ao ler o cadastro {self.caminho}: {str(e)}")
+                    if atual is None:
+                        self._snapshot = snapshot_de_mapa(mapa_estab)
+            return self._snapshot
+
+
+_registros = {}
+_lock_registros = threading.Lock()
+
+def obter_registro(caminho=CAMINHO_REGISTRO):
+    """Um Registro por processo para cada arquivo de cadastro"""
+    with _lock_registros:
+        if caminho not in _registros:
+            _registros[caminho] = Registro(caminho)
+        return _registros[caminho]
+
+def snapshot_atual(caminho=CAMINHO_REGISTRO):
+    return obter_registro(caminho).snapshot()
+
+
+def exportar_csv(snapshot, destino):
+    """Grava o cadastro em CSV; atributos extras viram colunas"""
+    extras = sorted({k for e in snapshot.por_cnpj.values() for k in e.atributos})
+    pasta = os.path.dirname(destino)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    temporario = f"{destino}.tmp"
+    with open(temporario, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f, delimiter=";")
+        escritor.writerow(["cnpj", "cod_estab"] + extras)
+        for estab in snapshot.por_cnpj.values():
+            escritor.writerow([estab.cnpj, estab.cod_estab] + [estab.atributos.get(k, "") for k in extras])
+    # Troca atômica: um processo recarregando nunca lê o arquivo pela metade
+    os.replace(temporario, destino)
+
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rpa.registro", description="Cadastro de estabelecimentos")
+    parser.add_argument("comando", choices=["status", "exportar"],
+                        help="exportar grava o cadastro atual (ou o mapa_estab) no arquivo")
+    parser.add_argument("--arquivo", default=CAMINHO_REGISTRO)
+    args = parser.parse_args(argv)
+
+    if args.comando == "exportar" and args.arquivo.lower().endswith((".db", ".sqlite", ".sqlite3")):
+        print("O exportar grava CSV; informe um --arquivo .csv")
+        return 2
+
+    snapshot = Registro(args.arquivo).snapshot()
+    if args.comando == "exportar":
+        exportar_csv(snapshot, args.arquivo)
+        print(f"{len(snapshot)} estabelecimentos gravados em {args.arquivo}")
+    else:
+        print(f"Origem: {snapshot.origem}")
+        print(f"Estabelecimentos: {len(snapshot)}, códigos distintos: {len(snapshot.por_codigo)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Serviço HTTP de OCR das notas.
+
+Outros sistemas enviam o PDF por POST e recebem o id do trabalho; o processamento
+roda num pool de processos (o mesmo fluxo do lote) e o resultado é consultado
+depois. Quando o pool e a fila estão cheios, o POST responde 429 com Retry-After
+em vez de acumular trabalhos sem limite.
+
+Endpoints:
+    POST /notas            PDF em multipart (campo `arquivo`) ou corpo application/pdf -> 202 {"id": ...}
+    GET  /notas/<id>       situação do trabalho e, quando concluído, os dados extraídos
+    GET  /saude            ocupação do pool, da fila e dos envios para a API em andamento
+    GET  /metricas         métricas no formato texto do Prometheus (?formato=json para o snapshot)
+
+Uso: python -m rpa.servico [--porta 8080] [--workers 3] [--fila 16] [--enviar]
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Response, jsonify, request
+
+from rpa.api import ClienteAPI
+from rpa.batch import workers_padrao, criar_pool, processar_arquivo
+from rpa.log import registrar
+from rpa.metricas import obter_metricas
+from rpa.artefatos import DESLIGADO, obter_armazem
+from rpa.pipeline import ConfigPipeline, ResultadoNF, enviar_resultado, reservar_envio, guardar_artefato
+
+PASTA_SERVICO = os.path.join("dados", "servico")
+FILA_PADRAO = 16
+MAX_TRABALHOS_GUARDADOS = 1000
+TAMANHO_MAX_PDF = 50 * 1024 * 1024
+
+NA_FILA = "na_fila"
+PROCESSANDO = "processando"
+ENVIANDO = "enviando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+
+@dataclass
+class Trabalho:
+    id: str
+    arquivo: str
+    caminho_pdf: str
+    output_json: str
+    criado_em: float
+    futuro: object = None
+    resultado: object = None
+    concluido_em: float | None = None
+    # OCR terminado e envio para a API em andamento (o resultado só é publicado depois dele)
+    enviando: bool = False
+
+    @property
+    def situacao(self):
+        if self.resultado is not None:
+            return CONCLUIDO if self.resultado.sucesso else ERRO
+        if self.enviando:
+            return ENVIANDO
+        # Terminado no pool mas ainda sem resultado: artefatos e índice na thread de conclusão
+        if self.futuro is not None and (self.futuro.running() or self.futuro.done()):
+            return PROCESSANDO
+        return NA_FILA
+
+    def resumo(self):
+        resumo = {"id": self.id, "arquivo": self.arquivo, "situacao": self.situacao,
+                  "criado_em": self.criado_em, "concluido_em": self.concluido_em}
+        r = self.resultado
+        if r is not None:
+            resumo.update({
+                "dados": r.dados, "confianca": r.confianca, "paginas": r.paginas,
+                "ja_enviado": r.ja_enviado, "status_api": r.status, "resposta_api": r.resposta,
+                "erro": r.descricao_erro(), "tempos": r.tempos,
+            })
+        return resumo
+
+
+class ServicoOCR:
+    """Pool de processos com capacidade limitada e os trabalhos em memória"""
+
+    def __init__(self, config=None, workers=None, fila=FILA_PADRAO, pasta=PASTA_SERVICO):
+        # Sem envio, nada é pulado: o índice só serve para evitar envios repetidos (como no lote)
+        self.config = config or ConfigPipeline(enviar=False, pular_enviados=False)
+        self.workers = workers or workers_padrao()
+        self.capacidade = self.workers + fila
+        self.pasta = pasta
+        os.makedirs(os.path.join(pasta, "entrada"), exist_ok=True)
+        os.makedirs(os.path.join(pasta, "saida"), exist_ok=True)
+
+        # Envio e artefatos ficam neste processo, como no lote
+        self._config_workers = replace(self.config, enviar=False, artefatos=DESLIGADO)
+        self._executor = criar_pool(self.workers)
+        # O que vem depois do OCR (artefatos, índice de envios) não pode rodar na thread de controle
+        # do pool: um disco lento ou o índice travado atrasariam a coleta de todos os trabalhos
+        self._conclusoes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="servico-conclusao")
+        self._vagas = threading.BoundedSemaphore(self.capacidade)
+        self._cliente = None
+        if self.config.enviar:
+            # Os envios não podem rodar na thread de controle do pool; esta fila já é limitada pelas vagas
+            self._cliente = ClienteAPI(max_em_voo=self.config.envios_simultaneos)
+            self._envios = ThreadPoolExecutor(max_workers=self.config.envios_simultaneos,
+                                              thread_name_prefix="servico-envio")
+        self._trabalhos = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.metricas = obter_metricas()
+        self.metricas.medidor("rpa_fila", lambda: self.saude()["na_fila"], fila="servico")
+        self.metricas.medidor("rpa_em_processamento", lambda: self.saude()["processando"], fila="servico")
+        self.metricas.medidor("rpa_fila", lambda: self.saude()["enviando"], fila="servico_envios")
+
+    def submeter(self, arquivo, salvar):
+        """
+        Cria o trabalho e coloca no pool; `salvar(caminho)` grava o PDF recebido.
+        Retorna None se não houver vaga (o chamador responde 429).
+        """
+        if not self._vagas.acquire(blocking=False):
+            self.metricas.incrementar("rpa_servico_recusados_total")
+            return None
+        try:
+            id_trabalho = uuid.uuid4().hex
+            trabalho = Trabalho(
+                id=id_trabalho, arquivo=arquivo, criado_em=time.time(),
+                caminho_pdf=os.path.join(self.pasta, "entrada", f"{id_trabalho}.pdf"),
+                output_json=os.path.join(self.pasta, "saida", f"{id_trabalho}.json"),
+            )
+            salvar(trabalho.caminho_pdf)
+            with self._lock:
+                self._trabalhos[id_trabalho] = trabalho
+                self._descartar_antigos()
+            trabalho.futuro = self._executor.submit(
+                processar_arquivo, (trabalho.caminho_pdf, trabalho.output_json, self._config_workers)
+            )
+        except Exception:
+            self._vagas.release()
+            raise
+        trabalho.futuro.add_done_callback(lambda futuro: self._ao_terminar(trabalho, futuro))
+        return trabalho
+
+    def _ao_terminar(self, trabalho, futuro):
+        # Roda na thread de controle do pool: só pega o resultado e passa o resto adiante
+        try:
+            resultado = futuro.result()
+        except Exception as e:
+            resultado = ResultadoNF(caminho_pdf=trabalho.caminho_pdf, erro=str(e), estagio_erro="pool")
+        self._conclusoes.submit(self._concluir, trabalho, resultado)
+
+    def _concluir(self, trabalho, resultado):
+        try:
+            guardar_artefato(resultado, self.config, obter_armazem(self.config.artefatos, self.config.pasta_artefatos))
+            resultado.textos = []
+            if self._cliente and not resultado.erro and not resultado.ja_enviado and reservar_envio(resultado, self.config):
+                # A vaga só é liberada depois do envio: a API também faz parte da capacidade
+                trabalho.enviando = True
+                self._envios.submit(self._enviar, trabalho, resultado)
+                return
+        except Exception as e:
+            resultado.erro = str(e)
+        self._finalizar(trabalho, resultado)
+
+    def _enviar(self, trabalho, resultado):
+        try:
+            enviar_resultado(resultado, self.config, self._cliente)
+        finally:
+            self._finalizar(trabalho, resultado)
+
+    def _finalizar(self, trabalho, resultado):
+        trabalho.resultado = resultado
+        trabalho.concluido_em = time.time()
+        self._vagas.release()
+        self.metricas.registrar_resultado(resultado)
+        self.metricas.observar("rpa_servico_trabalho_segundos", trabalho.concluido_em - trabalho.criado_em)
+        registrar("servico_trabalho", id=trabalho.id, arquivo=trabalho.arquivo, situacao=trabalho.situacao,
+                  duracao=round(trabalho.concluido_em - trabalho.criado_em, 4))
+
+    def _descartar_antigos(self):
+        # Guarda só os últimos trabalhos concluídos; os arquivos deles vão junto
+        while len(self._trabalhos) > MAX_TRABALHOS_GUARDADOS:
+            antigo = next((t for t in self._trabalhos.values() if t.resultado is not None), None)
+            if antigo is None:
+                break
+            del self._trabalhos[antigo.id]
+            for caminho in (antigo.caminho_pdf, antigo.output_json):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+
+    def obter(self, id_trabalho):
+        with self._lock:
+            return self._trabalhos.get(id_trabalho)
+
+    def saude(self):
+        with self._lock:
+            situacoes = [t.situacao for t in self._trabalhos.values()]
+        return {
+            "workers": self.workers,
+            "capacidade": self.capacidade,
+            "na_fila": situacoes.count(NA_FILA),
+            "processando": situacoes.count(PROCESSANDO),
+            "enviando": situacoes.count(ENVIANDO),
+            "concluidos": situacoes.count(CONCLUIDO),
+            "erros": situacoes.count(ERRO),
+        }
+
+    def fechar(self):
+        self._executor.shutdown(wait=True)
+        self._conclusoes.shutdown(wait=True)
+        if self._cliente:
+            self._envios.shutdown(wait=True)
+            self._cliente.fechar()
+
+
+def criar_app(servico=None):
+    """App Flask sobre um ServicoOCR (criado com as opções padrão se não for informado)"""
+    servico = servico or ServicoOCR()
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = TAMANHO_MAX_PDF
+    app.extensions["servico_ocr"] = servico
+
+    @app.post("/notas")
+    def criar_nota():
+        enviado = request.files.get("arquivo")
+        if enviado is not None:
+            nome = enviado.filename or "nota.pdf"
+            inicio = enviado.stream.read(5)
+            enviado.stream.seek(0)
+            salvar = enviado.save
+        elif request.mimetype == "application/pdf":
+            nome = request.args.get("nome", "nota.pdf")
+            corpo = request.get_data()
+            inicio = corpo[:5]
+
+            def salvar(caminho):
+                with open(caminho, "wb") as f:
+                    f.write(corpo)
+        else:
+            return jsonify(erro="Envie o PDF no campo 'arquivo' (multipart) ou com Content-Type application/pdf"), 400
+
+        if inicio != b"%PDF-":
+            return jsonify(erro="O arquivo enviado não é um PDF"), 400
+
+        trabalho = servico.submeter(nome, salvar)
+        if trabalho is None:
+            resposta = jsonify(erro="Fila cheia, tente novamente em instantes", **servico.saude())
+            resposta.headers["Retry-After"] = "5"
+            return resposta, 429
+
+        resposta = jsonify(id=trabalho.id, situacao=trabalho.situacao)
+        resposta.headers["Location"] = f"/notas/{trabalho.id}"
+        return resposta, 202
+
+    @app.get("/notas/<id_trabalho>")
+    def consultar_nota(id_trabalho):
+        trabalho = servico.obter(id_trabalho)
+        if trabalho is None:
+            return jsonify(erro="Trabalho não encontrado"), 404
+        return jsonify(trabalho.resumo())
+
+    @app.get("/saude")
+    def saude():
+        return jsonify(situacao="ok", **servico.saude())
+
+    @app.get("/metricas")
+    def metricas():
+        if request.args.get("formato") == "json":
+            return jsonify(servico.metricas.snapshot())
+        return Response(servico.metricas.texto_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    return app
+
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m rpa.servico", description="Serviço HTTP de OCR das notas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help=f"Processos de OCR (padrão: {workers_padrao()})")
+    parser.add_argument("--fila", type=int, default=FILA_PADRAO,
+                        help="Trabalhos aguardando além dos que estão em processamento; acima disso, 429")
+    parser.add_argument("--enviar", action="store_true", help="Envia cada nota para a API depois da extração")
+    args = parser.parse_args(argv)
+
+    servico = ServicoOCR(ConfigPipeline(enviar=args.enviar, pular_enviados=args.enviar),
+                         workers=args.workers, fila=args.fila)
+    try:
+        criar_app(servico).run(host=args.host, port=args.porta, threaded=True)
+    finally:
+        servico.fechar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
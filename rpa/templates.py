@@ -0,0 +1,128 @@
+"""
+Templates de layout para OCR por região.
+
+Cada template declara, para um layout de fornecedor, onde fica cada campo na
+página. Só esses recortes passam pelo Tesseract, com configuração própria do
+campo (linha única e lista de caracteres permitidos). Os templates ficam em
+`templates/layouts.json`, no formato:
+
+    [
+        {
+            "nome": "fornecedor_x",
+            "regioes": [
+                {"campo": "nrNotaFiscal", "pagina": 1, "caixa": [0.62, 0.08, 0.95, 0.12]},
+                {"campo": "cnpjTomador", "pagina": 1, "caixa": [0.05, 0.30, 0.50, 0.34]}
+            ]
+        }
+    ]
+
+`caixa` é (x0, y0, x1, y1) em fração da largura e altura da página, então o
+mesmo template serve para qualquer dpi.
+"""
+import os
+import json
+from dataclasses import dataclass, field
+
+CAMINHO_TEMPLATES = os.path.join("templates", "layouts.json")
+
+_CNPJ = "0123456789./-"
+
+# Linha única (--psm 7) e só os caracteres que o campo pode ter
+CONFIG_CAMPOS = {
+    "cnpjFornecedor": f"--psm 7 -c tessedit_char_whitelist={_CNPJ}",
+    "cnpjTomador": f"--psm 7 -c tessedit_char_whitelist={_CNPJ}",
+    "nrNotaFiscal": "--psm 7 -c tessedit_char_whitelist=0123456789",
+    "dtEmissao": "--psm 7 -c tessedit_char_whitelist=0123456789/",
+    "valorNf": "--psm 7 -c tessedit_char_whitelist=0123456789.,",
+}
+
+# Rótulos que o extrair_info procura antes de cada valor; o fornecedor vem
+# primeiro porque a extração usa o primeiro CNPJ completo do texto
+ROTULOS = {
+    "cnpjFornecedor": "CNPJ: {}",
+    "nrNotaFiscal": "RPS Nº {}",
+    "dtEmissao": "Data da Compra: {}",
+    "valorNf": "VALOR TOTAL DO SERVIÇO = R$ {}",
+    "cnpjTomador": "Tomador {}",
+}
+
+
+@dataclass(frozen=True)
+class Regiao:
+    campo: str
+    caixa: tuple
+    pagina: int = 1
+    config_tesseract: str = ""
+
+    def config(self):
+        return self.config_tesseract or CONFIG_CAMPOS.get(self.campo, "--psm 7")
+
+
+@dataclass(frozen=True)
+class TemplateLayout:
+    nome: str
+    regioes: tuple = field(default_factory=tuple)
+
+    def paginas(self):
+        return sorted({r.pagina for r in self.regioes})
+
+    def regioes_da_pagina(self, pagina):
+        return [r for r in self.regioes if r.pagina == pagina]
+
+
+TEMPLATES = {}
+_carregados = False
+
+def registrar_template(template):
+    TEMPLATES[template.nome] = template
+
+def carregar_templates(caminho=CAMINHO_TEMPLATES):
+    with open(caminho, "r", encoding="utf-8") as f:
+        for item in json.load(f):
+            regioes = tuple(
+                Regiao(
+                    campo=r["campo"],
+                    caixa=tuple(r["caixa"]),
+                    pagina=r.get("pagina", 1),
+                    config_tesseract=r.get("config_tesseract", ""),
+                )
+                for r in item["regioes"]
+            )
+            registrar_template(TemplateLayout(item["nome"], regioes))
+
+def obter_template(nome):
+    """Template pelo nome; o arquivo padrão é lido na primeira consulta de cada processo"""
+    global _carregados
+    if not nome:
+        return None
+    if not _carregados:
+        _carregados = True
+        if os.path.isfile(CAMINHO_TEMPLATES):
+            carregar_templates()
+    if nome not in TEMPLATES:
+        raise KeyError(f"Template de layout não encontrado: {nome}")
+    return TEMPLATES[nome]
+
+
+def recortar(img, caixa):
+    x0, y0, x1, y1 = caixa
+    return img.crop((int(x0 * img.width), int(y0 * img.height), int(x1 * img.width), int(y1 * img.height)))
+
+def _formatar_cnpj(valor):
+    # Com whitelist o Tesseract às vezes perde a pontuação; a extração espera o CNPJ formatado
+    digitos = "".join(c for c in valor if c.isdigit())
+    if len(digitos) != 14:
+        return valor
+    return f"{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}"
+
+def montar_texto(valores):
+    """Monta, a partir dos valores lidos nas regiões, o texto no formato que o extrair_info reconhece"""
+    linhas = []
+    for campo, rotulo in ROTULOS.items():
+        valor = valores.get(campo)
+        if not valor:
+            continue
+        if campo.startswith("cnpj"):
+            valor = _formatar_cnpj(valor)
+        linhas.append(rotulo.format(valor))
+    return "\n".join(linhas)
@@ -1,21 +1,19 @@
-import os
-import base64
+import hashlib
 import re
-import Levenshtein
-from datetime import datetime
-from rpa.constantes import mapa_estab
+from rpa.registro import snapshot_atual
+from rpa.log import registrar_envio
+from rpa.metricas import contar
 
-def gerar_base64_pdf(path_pdf):
-    try:
-        with open(path_pdf, "rb") as pdf_file:
-            encoded_string = base64.b64encode(pdf_file.read())
-            return encoded_string.decode('utf-8')
-    except Exception as e:
-        print(f"Erro ao gerar Base64 do PDF: {str(e)}")
-        return ""
+def calcular_hash_pdf(path_pdf):
+    # SHA-256 lido em blocos, sem carregar o PDF inteiro na memória
+    sha = hashlib.sha256()
+    with open(path_pdf, "rb") as pdf_file:
+        for bloco in iter(lambda: pdf_file.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
 
-def obter_cod_estab(cnpj_comprador):
-    return mapa_estab.get(cnpj_comprador, "999")
+def obter_cod_estab(cnpj_comprador, snapshot=None):
+    return (snapshot or snapshot_atual()).cod_estab(cnpj_comprador)
 
 def corrigir_cnpj_ocr(cnpj_raw):
     """Corrige erros comuns de OCR em CNPJs"""
@@ -31,40 +29,37 @@ def corrigir_cnpj_ocr(cnpj_raw):
         .replace("/", "")
     )
 
-def encontrar_cnpj_tomador(texto):
+def encontrar_cnpj_tomador(texto, snapshot=None, silencioso=False):
+    # O mesmo snapshot do cadastro vale para a nota inteira, mesmo se o arquivo mudar no meio
+    snapshot = snapshot or snapshot_atual()
+
     # Busca todos os padrões com possível CNPJ, mesmo bagunçados
     cnpjs_raw = re.findall(r'[\dIlOo./ -]{14,22}', texto)
     cnpjs_corrigidos = [corrigir_cnpj_ocr(c) for c in cnpjs_raw]
 
     # 1. Tentativa direta
     for cnpj in cnpjs_corrigidos:
-        if cnpj in mapa_estab:
-            print(f"[MATCH DIRETO] {cnpj}")
+        if cnpj in snapshot:
+            if not silencioso:
+                print(f"[MATCH DIRETO] {cnpj}")
+            contar("rpa_cnpj_tomador_total", busca="direta")
             return cnpj
 
-    # 2. Fuzzy Levenshtein
-    candidatos = list(mapa_estab.keys())
-    melhor_candidato = None
-    menor_distancia = float("inf")
-
-    for cnpj_ocr in cnpjs_corrigidos:
-        for candidato in candidatos:
-            dist = Levenshtein.distance(cnpj_ocr, candidato)
-            if dist < menor_distancia:
-                menor_distancia = dist
-                melhor_candidato = candidato
-                cnpj_comparado = cnpj_ocr  # Salva o que estava sendo comparado
+    # 2. Fuzzy Levenshtein pelo índice dos estabelecimentos (raio 3)
+    encontrado = snapshot.indice.melhor(cnpjs_corrigidos, raio=3)
 
-    if melhor_candidato and menor_distancia <= 3:
-        print(f"[LEV MATCH] {cnpj_comparado} → {melhor_candidato} | distância = {menor_distancia}")
+    if encontrado:
+        cnpj_comparado, melhor_candidato, distancia = encontrado
+        if not silencioso:
+            print(f"[LEV MATCH] {cnpj_comparado} → {melhor_candidato} | distância = {distancia}")
+        contar("rpa_cnpj_tomador_total", busca="aproximada")
         return melhor_candidato
 
-    print("[FALHA] Nenhum CNPJ tomador encontrado via Levenshtein")
+    if not silencioso:
+        print("[FALHA] Nenhum CNPJ tomador encontrado via Levenshtein")
+    contar("rpa_cnpj_tomador_total", busca="nao_encontrado")
     return ""
 
 def salvar_log(status, request_data, response_data):
-    os.makedirs("logs", exist_ok=True)
-    with open("logs/api_log.txt", "a", encoding="utf-8") as log:
-        log.write(f"\n{datetime.now()} - Status: {status}\n")
-        log.write(f"Request: {request_data}\n")
-        log.write(f"Response: {response_data}\n")
+    # Mantido por compatibilidade: o log agora é estruturado e rotativo (rpa.log)
+    registrar_envio(status, request_data, response_data)